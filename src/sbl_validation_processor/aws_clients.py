@@ -0,0 +1,65 @@
+import boto3.session
+import os
+import threading
+
+from botocore.config import Config
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+
+def get_client_config() -> Config:
+    return Config(
+        max_pool_connections=int(os.getenv("AWS_MAX_POOL_CONNECTIONS", 50)),
+        retries={
+            "max_attempts": int(os.getenv("AWS_MAX_ATTEMPTS", 5)),
+            "mode": os.getenv("AWS_RETRY_MODE", "standard"),
+        },
+    )
+
+
+def get_session() -> boto3.session.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session()
+    return _session
+
+
+def get_client(service_name: str, region_name: str = None):
+    # boto3 clients are thread safe once built, but building them from a shared session isn't, so creation
+    # happens under the lock and every caller after that reuses the client (and its connection pool)
+    client_key = (service_name, region_name)
+    client = _clients.get(client_key)
+    if client is None:
+        session = get_session()
+        with _lock:
+            client = _clients.get(client_key)
+            if client is None:
+                client = session.client(
+                    service_name=service_name,
+                    region_name=region_name,
+                    config=get_client_config(),
+                )
+                _clients[client_key] = client
+    return client
+
+
+def get_storage_options(region_name: str = "us-east-1") -> dict:
+    creds = get_session().get_credentials().get_frozen_credentials()
+    return {
+        "aws_access_key_id": creds.access_key,
+        "aws_secret_access_key": creds.secret_key,
+        "session_token": creds.token,
+        "aws_region": region_name,
+    }
+
+
+def reset_clients():
+    # clients can't be shared across a fork, so child processes start from a clean registry
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
@@ -0,0 +1,38 @@
+import os
+
+from typing import Dict, List, Optional
+
+
+def get_target_bytes(env: str = "BATCH_TARGET_BYTES") -> Optional[int]:
+    # with a byte target, rows per batch follow the data's width instead of the fixed BATCH_SIZE.  The target
+    # is in decoded (arrow) bytes, which is what a batch costs in memory
+    if target := os.getenv(env):
+        return int(target)
+    return None
+
+
+def get_row_bounds() -> tuple:
+    return (
+        int(os.getenv("BATCH_MIN_ROWS", 10000)),
+        int(os.getenv("BATCH_MAX_ROWS", 1000000)),
+    )
+
+
+def rows_for_bytes(rows: int, nbytes: int, target_bytes: int) -> int:
+    # how many rows of data averaging nbytes / rows per row fit in target_bytes
+    if not rows or not nbytes:
+        return get_row_bounds()[1]
+    return int(target_bytes * rows / nbytes)
+
+
+def batch_size_from_manifest(parts: List[Dict], target_bytes: int, default: int) -> int:
+    # the splitter records each part's decoded size, manifests written before that fall back to default
+    if not parts or any("data_bytes" not in part for part in parts):
+        return default
+    min_rows, max_rows = get_row_bounds()
+    rows = rows_for_bytes(
+        sum(part["rows"] for part in parts),
+        sum(part["data_bytes"] for part in parts),
+        target_bytes,
+    )
+    return max(min_rows, min(max_rows, rows))
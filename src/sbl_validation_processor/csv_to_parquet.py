@@ -1,60 +1,383 @@
-import boto3
+import csv
+import hashlib
+import heapq
+import io
 import json
 import logging
 import os
-import pandas as pa
+import pyarrow
+import pyarrow.csv as pa_csv
+import shutil
+import tempfile
+import threading
+import time
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from typing import Dict, Iterator, List
+
+from sbl_validation_processor import instrumentation
+from sbl_validation_processor.batch_sizing import (
+    get_row_bounds,
+    get_target_bytes,
+    rows_for_bytes,
+)
+from sbl_validation_processor.parquet_profile import write_table
+from sbl_validation_processor.result_cache import DigestReader, write_manifest
+from sbl_validation_processor.storage import get_storage
 
 log = logging.getLogger()
 
+CSV_ENGINES = ["pandas", "pyarrow", "polars"]
+
 
 def get_csv_data(bucket: str, key: str):
-    env = os.getenv("ENV", "S3")
-    if env == "LOCAL":
-        with open(os.path.join(bucket, key), "r") as f:
-            return pa.io.common.StringIO(f.read())
-    else:
-        s3 = boto3.client("s3")
-        response = s3.get_object(Bucket=bucket, Key=key)
-        return response["Body"]
+    return get_storage().open_read(bucket, key)
 
 
 def write_parquet(buffer: BytesIO, bucket: str, parquet_file: str):
-    env = os.getenv("ENV", "S3")
-    if env == "LOCAL":
-        file_path = os.path.join(bucket, parquet_file)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "wb") as f:
-            f.write(buffer.getvalue())
-    else:
-        s3 = boto3.client("s3")
-        s3.upload_fileobj(buffer, bucket, parquet_file)
+    get_storage().write_bytes(bucket, parquet_file, buffer)
 
 
-def split_csv_into_parquet(bucket: str, key: str):
+def encode_and_write_parquet(
+    table: pyarrow.Table, bucket: str, parquet_file: str
+) -> Dict:
+    buffer = BytesIO()
+    write_table(table, buffer)
+    # identical uploads split the same way produce identical parts, so the part's bytes identify its content
+    digest = hashlib.sha256(buffer.getbuffer()).hexdigest()
+    buffer.seek(0)
+    write_parquet(buffer, bucket, parquet_file)
+    return {
+        "key": parquet_file,
+        "digest": digest,
+        "rows": table.num_rows,
+        "bytes": buffer.getbuffer().nbytes,
+        "data_bytes": table.nbytes,
+    }
+
+
+class _ChainedReader(io.RawIOBase):
+    # replays bytes already consumed from a stream (e.g. the header line) before the rest of the stream
+    def __init__(self, prefix: bytes, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._stream.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+
+def _read_header(csv_data, block_size: int = 64 * 1024):
+    head = b""
+    while b"\n" not in head:
+        block = csv_data.read(block_size)
+        if not block:
+            break
+        head += block
+    line, _, rest = head.partition(b"\n")
+    column_names = next(csv.reader([line.decode("utf-8-sig").rstrip("\r")]), [])
+    return column_names, rest
+
+
+def _rebatch(
+    batches, column_names: List[str], batch_size: int, target_bytes: int = None
+) -> Iterator[pyarrow.Table]:
+    # arrow readers batch by bytes, so regroup into exactly batch_size rows to keep the same part layout the
+    # pandas chunks produced.  With target_bytes, each part is cut where the pending batches add up to the
+    # target, so it follows the width of the rows it holds, and batch_size only caps it
+    schema = pyarrow.schema([(name, pyarrow.string()) for name in column_names])
+    pending = []
+    pending_rows = 0
+    pending_bytes = 0
+    yielded = False
+
+    def rows_to_cut() -> int:
+        if pending_rows >= batch_size:
+            return batch_size
+        if target_bytes is None or pending_bytes < target_bytes:
+            return 0
+        rows, nbytes = 0, 0
+        for batch in pending:
+            if nbytes + batch.nbytes >= target_bytes:
+                rows += rows_for_bytes(
+                    batch.num_rows, batch.nbytes, target_bytes - nbytes
+                )
+                break
+            rows += batch.num_rows
+            nbytes += batch.nbytes
+        return min(batch_size, max(get_row_bounds()[0], rows))
+
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        pending_bytes += batch.nbytes
+        while pending_rows and (rows := rows_to_cut()):
+            table = pyarrow.Table.from_batches(pending, schema=schema)
+            yield table.slice(0, rows)
+            yielded = True
+            remainder = table.slice(rows)
+            pending = remainder.to_batches()
+            pending_rows = remainder.num_rows
+            pending_bytes = remainder.nbytes
+    if pending_rows or not yielded:
+        # a header only csv still produces a single, empty part
+        yield pyarrow.Table.from_batches(pending, schema=schema)
+
+
+def _pandas_batches(
+    csv_data, batch_size: int, target_bytes: int = None
+) -> Iterator[pyarrow.Table]:
+    # pandas and polars are only imported when their engine is picked, they're slow to import
+    import pandas as pa
+
+    # without pandas' schema metadata, every engine writes the same bytes for the same upload
+    chunks = (
+        pyarrow.Table.from_pandas(chunk).replace_schema_metadata(None)
+        for chunk in pa.read_csv(
+            csv_data,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=get_row_bounds()[0] if target_bytes else batch_size,
+        )
+    )
+    if target_bytes is None:
+        yield from chunks
+        return
+    # read in small chunks that are regrouped by size.  The first chunk carries the column names
+    first = next(chunks, None)
+    if first is None:
+        return
+    yield from _rebatch(
+        (batch for table in [first, *chunks] for batch in table.to_batches()),
+        first.column_names,
+        batch_size,
+        target_bytes,
+    )
+
+
+def _pad_short_rows(batches, short_rows: List, column_names: List[str]):
+    # puts the rows the reader skipped for having too few fields back where they were, padded with empty
+    # strings the way pandas reads them.  short_rows is a heap of (row index, values) the reader's invalid
+    # row handler fills in as it parses, which is always before it hands over the batch the rows belong in
+    schema = pyarrow.schema([(name, pyarrow.string()) for name in column_names])
+    position = 0
+    for batch in batches:
+        offset = 0
+        while short_rows and short_rows[0][0] <= position + batch.num_rows - offset:
+            index, values = heapq.heappop(short_rows)
+            if index > position:
+                yield batch.slice(offset, index - position)
+                offset += index - position
+            yield pyarrow.RecordBatch.from_pylist(
+                [dict(zip(column_names, values))], schema=schema
+            )
+            position = index + 1
+        if offset < batch.num_rows:
+            yield batch.slice(offset)
+            position += batch.num_rows - offset
+    while short_rows:
+        _, values = heapq.heappop(short_rows)
+        yield pyarrow.RecordBatch.from_pylist(
+            [dict(zip(column_names, values))], schema=schema
+        )
+
+
+def _pyarrow_batches(
+    csv_data, batch_size: int, target_bytes: int = None
+) -> Iterator[pyarrow.Table]:
+    column_names, rest = _read_header(csv_data)
+    if not column_names:
+        raise ValueError("No columns to parse from file")
+    # pandas renames repeated names (a, a.1), pyarrow would silently keep only one of the columns
+    duplicates = sorted({name for name in column_names if column_names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate column names in the header: {duplicates}")
+    # blocks are what the reader reads ahead (more of them the more cores it has) and what _rebatch buffers,
+    # and a part keeps every block it has rows from alive until it's written.  Small blocks, never bigger
+    # than the byte target, keep that to about a part's worth
+    block_size = int(os.getenv("CSV_BLOCK_SIZE", 1024 * 1024))
+    if target_bytes:
+        block_size = min(block_size, target_bytes)
+    short_rows = []
+    short_rows_lock = threading.Lock()
+
+    def handle_invalid_row(row) -> str:
+        # rows with too many fields fail the same as they do in pandas.  The reader stops numbering rows once
+        # a quoted value has spanned lines, so a short row after one can't be put back in place and fails too
+        if row.actual_columns > row.expected_columns or row.number is None:
+            return "error"
+        values = next(csv.reader([row.text]), [])
+        values += [""] * (len(column_names) - len(values))
+        # blank lines aren't numbered, so row.number counts the rows before this one
+        with short_rows_lock:
+            heapq.heappush(short_rows, (row.number - 1, values))
+        return "skip"
+
+    try:
+        reader = pa_csv.open_csv(
+            _ChainedReader(rest, csv_data),
+            read_options=pa_csv.ReadOptions(
+                column_names=column_names,
+                block_size=block_size,
+            ),
+            # quoted values can hold newlines, and without this a block boundary inside one fails the read
+            parse_options=pa_csv.ParseOptions(
+                newlines_in_values=True, invalid_row_handler=handle_invalid_row
+            ),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pyarrow.string() for name in column_names},
+                null_values=[],
+                strings_can_be_null=False,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+    except pyarrow.ArrowInvalid as e:
+        # header only csv, there's nothing left for the reader to parse
+        if "Empty CSV file" not in str(e):
+            raise e
+        reader = None
     try:
-        paths = key.split("/")
-        fname = paths[-1]
-        fprefix = ".".join(fname.split(".")[:-1])
-        if root := os.getenv("S3_ROOT"):
-            res_folder = f"{root}/{'/'.join(paths[1:-1])}/{fprefix}_pqs/"
-        else:
-            res_folder = f"{'/'.join(paths[:-1])}/{fprefix}_pqs/"
+        yield from _rebatch(
+            _pad_short_rows(reader or [], short_rows, column_names),
+            column_names,
+            batch_size,
+            target_bytes,
+        )
+    finally:
+        # stops the reader's read ahead from pulling on the upload once the split is done, or has failed
+        if reader is not None:
+            reader.close()
+
+
+def _polars_batches(
+    csv_data, batch_size: int, target_bytes: int = None
+) -> Iterator[pyarrow.Table]:
+    # polars only reads a csv in batches from a file, so the upload is spooled to local disk and read back a
+    # batch at a time, which keeps memory to a few batches rather than the whole upload.  Polars keeps blank
+    # lines as all null rows, so drop those to match the other engines before filling the remaining nulls
+    # with empty strings
+    import polars as pl
+
+    with tempfile.NamedTemporaryFile(suffix=".csv") as spool:
+        shutil.copyfileobj(csv_data, spool, 16 * 1024 * 1024)
+        spool.flush()
+        spool.seek(0)
+        column_names, _ = _read_header(spool)
+        schema = pyarrow.schema([(name, pyarrow.string()) for name in column_names])
+        reader = pl.read_csv_batched(
+            spool.name,
+            infer_schema_length=0,
+            batch_size=get_row_bounds()[0] if target_bytes else batch_size,
+        )
+
+        def batches():
+            while dfs := reader.next_batches(1):
+                df = dfs[0].filter(~pl.all_horizontal(pl.all().is_null()))
+                yield from df.fill_null("").to_arrow().cast(schema).to_batches()
+
+        yield from _rebatch(batches(), column_names, batch_size, target_bytes)
+
+
+def iter_csv_batches(
+    csv_data, batch_size: int, engine: str = None, target_bytes: int = None
+) -> Iterator[pyarrow.Table]:
+    engine = engine or os.getenv("CSV_ENGINE", "pandas")
+    if engine == "pandas":
+        return _pandas_batches(csv_data, batch_size, target_bytes)
+    elif engine == "pyarrow":
+        return _pyarrow_batches(csv_data, batch_size, target_bytes)
+    elif engine == "polars":
+        return _polars_batches(csv_data, batch_size, target_bytes)
+    raise ValueError(f"unknown CSV_ENGINE {engine}, expected one of {CSV_ENGINES}")
 
-        csv_data = get_csv_data(bucket, key)
+
+def get_pqs_folder(key: str) -> str:
+    paths = key.split("/")
+    fname = paths[-1]
+    fprefix = ".".join(fname.split(".")[:-1])
+    if root := os.getenv("S3_ROOT"):
+        return f"{root}/{'/'.join(paths[1:-1])}/{fprefix}_pqs/"
+    return f"{'/'.join(paths[:-1])}/{fprefix}_pqs/"
+
+
+def split_csv_into_parquet(bucket: str, key: str):
+    try:
+        res_folder = get_pqs_folder(key)
 
         pq_idx = 1
         batch_size = int(os.getenv("BATCH_SIZE", 50000))
-        log.info(f"batch size: {batch_size}")
-        for chunk in pa.read_csv(
-            csv_data, dtype=str, keep_default_na=False, chunksize=batch_size
-        ):
-            buffer = BytesIO()
-            chunk.to_parquet(buffer)
-            buffer.seek(0)
-            write_parquet(buffer, bucket, f"{res_folder}{pq_idx:05}.parquet")
-            pq_idx += 1
+        target_bytes = get_target_bytes()
+        if target_bytes is not None:
+            # parts are sized by bytes, capped at BATCH_MAX_ROWS instead of BATCH_SIZE
+            batch_size = get_row_bounds()[1]
+        engine = os.getenv("CSV_ENGINE", "pandas")
+        log.info(
+            f"batch size: {batch_size}, target bytes: {target_bytes}, csv engine: {engine}"
+        )
+        upload_workers = int(os.getenv("UPLOAD_WORKERS", 4))
+        max_in_flight = int(os.getenv("MAX_IN_FLIGHT", upload_workers * 2))
+
+        with instrumentation.stage("csv_to_parquet", engine=engine) as metrics:
+            csv_data = DigestReader(get_csv_data(bucket, key))
+
+            def finish_part(future):
+                with metrics.timer("upload_wait"):
+                    part = future.result()
+                metrics.add("bytes_written", part["bytes"])
+                parts.append(part)
+
+            # parse on this thread while parts are encoded and uploaded on the pool.  Waiting on the oldest
+            # part once max_in_flight is reached bounds memory, and surfaces any failed upload before parsing
+            # more
+            in_flight = deque()
+            parts = []
+            with ThreadPoolExecutor(max_workers=upload_workers) as pool:
+                try:
+                    batch_start = time.perf_counter()
+                    for table in iter_csv_batches(
+                        csv_data, batch_size, engine, target_bytes
+                    ):
+                        metrics.add("rows", table.num_rows)
+                        metrics.batch(
+                            table.num_rows,
+                            time.perf_counter() - batch_start,
+                            part=pq_idx,
+                        )
+                        in_flight.append(
+                            pool.submit(
+                                encode_and_write_parquet,
+                                table,
+                                bucket,
+                                f"{res_folder}{pq_idx:05}.parquet",
+                            )
+                        )
+                        pq_idx += 1
+                        if len(in_flight) >= max_in_flight:
+                            finish_part(in_flight.popleft())
+                        batch_start = time.perf_counter()
+                    while in_flight:
+                        finish_part(in_flight.popleft())
+                    csv_digest = csv_data.hexdigest()
+                finally:
+                    for future in in_flight:
+                        future.cancel()
+                    csv_data.close()
+                    metrics.add("bytes_read", csv_data.bytes_read)
+
+            # digests of the upload and its parts, for the validator's result cache
+            write_manifest(bucket, res_folder, csv_digest, parts)
 
         return {
             "statusCode": 200,
@@ -62,6 +385,7 @@ def split_csv_into_parquet(bucket: str, key: str):
             "Records": [
                 {"s3": {"bucket": {"name": bucket}, "object": {"key": res_folder}}}
             ],
+            "metrics": metrics.summary(),
         }
     except Exception as e:
         log.exception("Failed to process {} in {}".format(key, bucket))
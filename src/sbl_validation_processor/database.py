@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+from botocore.exceptions import ClientError
+from typing import TYPE_CHECKING
+
+from sbl_validation_processor.aws_clients import get_client
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+
+log = logging.getLogger()
+
+_lock = threading.Lock()
+_engines = {}
+_secrets = {}
+_timings = {
+    "secret_fetch_count": 0,
+    "secret_fetch_seconds": 0.0,
+    "secret_cache_hits": 0,
+    "engine_create_count": 0,
+    "engine_create_seconds": 0.0,
+    "engine_cache_hits": 0,
+    "connection_count": 0,
+}
+
+
+def get_secret(secret_name):
+    # secrets are cached for SECRET_TTL_SECONDS so a job doesn't go back to secrets manager for every batch,
+    # while still picking up a rotated password within the ttl
+    ttl = int(os.getenv("SECRET_TTL_SECONDS", 300))
+    now = time.monotonic()
+    cached = _secrets.get(secret_name)
+    if cached and cached[0] > now:
+        _timings["secret_cache_hits"] += 1
+        return cached[1]
+
+    region_name = "us-east-1"
+
+    client = get_client("secretsmanager", region_name=region_name)
+
+    try:
+        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
+    except ClientError as e:
+        raise e
+
+    secret = json.loads(get_secret_value_response["SecretString"])
+    _timings["secret_fetch_count"] += 1
+    _timings["secret_fetch_seconds"] += time.monotonic() - now
+    _secrets[secret_name] = (now + ttl, secret)
+    return secret
+
+
+def get_dsn() -> str:
+    # pydantic and sqlalchemy are imported on first use, most runs never touch the db
+    from pydantic import PostgresDsn
+
+    env = os.getenv("ENV", "S3")
+    if env == "LOCAL":
+        user = os.getenv("DB_USER")
+        passwd = os.getenv("DB_PWD")
+        host = os.getenv("DB_HOST")
+        db = os.getenv("DB_NAME")
+    else:
+        secret = get_secret(os.getenv("DB_SECRET", None))
+        user = secret["username"]
+        passwd = secret["password"]
+        host = secret["host"]
+        db = secret["database"]
+
+    postgres_dsn = PostgresDsn.build(
+        scheme="postgresql+psycopg2",
+        username=user,
+        password=urllib.parse.quote(passwd, safe=""),
+        host=host,
+        path=db,
+    )
+    return postgres_dsn.unicode_string()
+
+
+def get_engine(dsn: str = None) -> "Engine":
+    # one engine (and connection pool) per dsn for the life of the process
+    dsn = dsn or get_dsn()
+    engine = _engines.get(dsn)
+    if engine is not None:
+        _timings["engine_cache_hits"] += 1
+        return engine
+    with _lock:
+        engine = _engines.get(dsn)
+        if engine is None:
+            from sqlalchemy import create_engine, event
+
+            start = time.monotonic()
+            engine = create_engine(
+                dsn,
+                echo=bool(json.loads(os.getenv("DB_ECHO", "false").lower())),
+                pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+                pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+                pool_pre_ping=True,
+            )
+            event.listen(engine, "connect", _count_connection)
+            _engines[dsn] = engine
+            _timings["engine_create_count"] += 1
+            _timings["engine_create_seconds"] += time.monotonic() - start
+            log.info("created db engine, pool size {}".format(engine.pool.size()))
+    return engine
+
+
+def _count_connection(dbapi_connection, connection_record):
+    _timings["connection_count"] += 1
+
+
+def get_timings() -> dict:
+    return dict(_timings)
+
+
+def reset_engines():
+    # engines can't be shared across a fork, so child processes start without any
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose(close=False)
+        _engines.clear()
+        _secrets.clear()
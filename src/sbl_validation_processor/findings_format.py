@@ -0,0 +1,160 @@
+import os
+import polars as pl
+import re
+
+from typing import Dict, List, Optional, Tuple
+
+from sbl_validation_processor.storage import StorageObject, get_storage
+
+FINDINGS_FORMATS = ["wide", "long"]
+FINDINGS_LAYOUTS = ["batch", "partitioned"]
+PARTITION_PREFIX = "validation_id="
+
+# what identifies a finding, everything but its fields
+FINDING_COLUMNS = [
+    "validation_type",
+    "validation_id",
+    "row",
+    "unique_identifier",
+    "scope",
+    "phase",
+    "submission_id",
+]
+
+LONG_SCHEMA = {
+    "validation_type": pl.String,
+    "validation_id": pl.String,
+    "row": pl.UInt32,
+    "unique_identifier": pl.String,
+    "scope": pl.String,
+    "phase": pl.String,
+    "submission_id": pl.String,
+    "field_index": pl.UInt16,
+    "field_name": pl.String,
+    "field_value": pl.String,
+}
+
+
+def get_findings_format() -> str:
+    # wide (the default) is one row per finding with as many field_N/value_N columns as its validation
+    # checks, so parts have different schemas.  long is one row per finding and field, the same schema in
+    # every part, so the aggregator can scan all of _res/ at once and push filters down into it
+    findings_format = os.getenv("FINDINGS_FORMAT", "wide")
+    if findings_format not in FINDINGS_FORMATS:
+        raise ValueError(
+            "FINDINGS_FORMAT must be one of {}, not {}".format(
+                FINDINGS_FORMATS, findings_format
+            )
+        )
+    return findings_format
+
+
+def get_findings_layout() -> str:
+    # batch (the default) writes one part per validated batch under _res/.  partitioned splits each batch's
+    # findings into _res/validation_id=<id>/ folders, so the aggregator's per validation_id queries only
+    # open that validation's parts
+    findings_layout = os.getenv("FINDINGS_LAYOUT", "batch")
+    if findings_layout not in FINDINGS_LAYOUTS:
+        raise ValueError(
+            "FINDINGS_LAYOUT must be one of {}, not {}".format(
+                FINDINGS_LAYOUTS, findings_layout
+            )
+        )
+    return findings_layout
+
+
+def partition_findings(
+    findings: pl.DataFrame, parquet_file: str
+) -> List[Tuple[str, pl.DataFrame]]:
+    # the batch's findings for each validation_id, in validation_id order, with the part they belong in.
+    # Parts keep the batch's file name, so they still sort in batch order within a validation_id
+    folder, _, file_name = parquet_file.rpartition("/")
+    return [
+        (f"{folder}/{PARTITION_PREFIX}{validation_id}/{file_name}", df)
+        for (validation_id,), df in sorted(
+            findings.partition_by(
+                "validation_id", as_dict=True, maintain_order=True
+            ).items()
+        )
+    ]
+
+
+def partition_folder(key: str) -> str:
+    # the validation_id=<id>/ folder a part is in, or "" for a part written in the batch layout
+    folder = key.rpartition("/")[0].rpartition("/")[2]
+    return f"{folder}/" if folder.startswith(PARTITION_PREFIX) else ""
+
+
+def get_partitioned_parts(
+    parts: List[StorageObject],
+) -> Dict[str, List[StorageObject]]:
+    # the parts of each validation_id, or nothing if any part was written in the batch layout
+    parts_by_id = {}
+    for part in parts:
+        folder = partition_folder(part.key)
+        if not folder:
+            return {}
+        validation_id = folder.removeprefix(PARTITION_PREFIX).rstrip("/")
+        parts_by_id.setdefault(validation_id, []).append(part)
+    return parts_by_id
+
+
+def is_long(schema: Dict) -> bool:
+    return "field_index" in schema
+
+
+def wide_field_count(columns) -> int:
+    # how many field_N/value_N pairs wide findings with these columns have, all null or not
+    return sum(1 for column in columns if re.fullmatch(r"field_\d+", column))
+
+
+def to_long(findings: pl.DataFrame) -> pl.DataFrame:
+    field_count = wide_field_count(findings.columns)
+    if not field_count:
+        return pl.DataFrame(schema=LONG_SCHEMA)
+    # field_1 of every finding, then field_2 of those that have one, and so on.  Every finding has a field_1,
+    # so findings still first appear in the order the validator wrote them
+    return pl.concat(
+        findings.select(
+            *FINDING_COLUMNS,
+            field_index=pl.lit(i, pl.UInt16),
+            field_name=f"field_{i}",
+            field_value=f"value_{i}",
+        ).filter(pl.col("field_name").is_not_null())
+        for i in range(1, field_count + 1)
+    ).cast(LONG_SCHEMA)
+
+
+def to_wide(lf: pl.LazyFrame, field_count: int) -> pl.LazyFrame:
+    # back to the wide columns the report and json builders expect.  Grouping keeps the order findings first
+    # appear in, and a filter on any of the finding columns is still pushed down into the scan
+    return lf.group_by(FINDING_COLUMNS, maintain_order=True).agg(
+        expr
+        for i in range(1, field_count + 1)
+        for expr in (
+            pl.col("field_name")
+            .filter(pl.col("field_index") == i)
+            .first()
+            .alias(f"field_{i}"),
+            pl.col("field_value")
+            .filter(pl.col("field_index") == i)
+            .first()
+            .alias(f"value_{i}"),
+        )
+    )
+
+
+def widen(lf: pl.LazyFrame, field_count: Optional[int] = None) -> pl.LazyFrame:
+    # field_count is how many field columns the wide findings had (see ValidationSummary.field_count), all
+    # null ones included, so both formats give the same columns.  Without it, for results written before
+    # the summary kept it, the long findings are scanned once for it
+    if field_count is None:
+        field_count = lf.select(pl.col("field_index").max()).collect().item() or 0
+    return to_wide(lf, field_count)
+
+
+def scan_long_findings(
+    bucket: str, key: str, field_count: Optional[int] = None
+) -> pl.LazyFrame:
+    # every long part under key (including any validation_id= folders) as one scan, widened again
+    return widen(get_storage().scan_parquet(bucket, key), field_count)
@@ -0,0 +1,89 @@
+import io
+import logging
+import polars as pl
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from sbl_validation_processor.database import get_engine
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+
+log = logging.getLogger()
+
+
+class FindingsBulkLoader:
+    # Streams findings batches into postgres with COPY ... FROM STDIN on a single pooled connection.  Each COPY
+    # runs on a background thread while the caller validates the next batch, with at most one batch in flight.
+    # Everything is one transaction, committed once per submission, so a failed submission leaves no findings
+    # behind.
+    def __init__(self, engine: "Engine" = None, table_name: str = "findings"):
+        self.table_name = table_name
+        self.connection = (engine or get_engine()).raw_connection()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending: Future = None
+        self.row_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def _copy(self, df: pl.DataFrame) -> int:
+        buffer = io.BytesIO()
+        # polars writes nulls as unquoted empty fields and empty strings as "", which is how COPY's csv
+        # format tells the two apart
+        df.write_csv(buffer, include_header=False)
+        buffer.seek(0)
+        columns = ", ".join(f'"{column}"' for column in df.columns)
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {self.table_name} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        return df.height
+
+    def _wait(self):
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            self.row_count += pending.result()
+
+    def submit(self, df: pl.DataFrame):
+        self._wait()
+        self.pending = self.executor.submit(self._copy, df)
+
+    def commit(self) -> int:
+        try:
+            self._wait()
+            self.connection.commit()
+            log.info("{} findings persisted to db".format(self.row_count))
+        except Exception as e:
+            self.connection.rollback()
+            raise e
+        finally:
+            self.close()
+        return self.row_count
+
+    def abort(self):
+        if self.connection is None:
+            return
+        try:
+            if self.pending is not None:
+                self.pending.exception()
+                self.pending = None
+            self.connection.rollback()
+        finally:
+            self.close()
+
+    def close(self):
+        # returns the connection to the pool, safe to call more than once
+        if self.connection is None:
+            return
+        self.executor.shutdown(wait=True)
+        self.connection.close()
+        self.connection = None
@@ -0,0 +1,67 @@
+import logging
+import os
+import pyarrow
+
+from typing import Dict
+
+from sbl_validation_processor import instrumentation
+from sbl_validation_processor.csv_to_parquet import (
+    get_csv_data,
+    get_pqs_folder,
+    iter_csv_batches,
+)
+from sbl_validation_processor.result_cache import DigestReader
+from sbl_validation_processor.storage import get_storage
+
+log = logging.getLogger()
+
+
+def should_fuse(bucket: str, key: str) -> bool:
+    # uploads up to FUSED_MAX_BYTES are split, validated and aggregated in one process.  Unset (the default)
+    # keeps every upload on the split -> event -> validate -> event -> aggregate path
+    max_bytes = int(os.getenv("FUSED_MAX_BYTES", 0))
+    if max_bytes <= 0:
+        return False
+    size = get_storage().size(bucket, key)
+    log.info("{} is {} bytes, fused limit {}".format(key, size, max_bytes))
+    return size <= max_bytes
+
+
+def run_fused(bucket: str, key: str) -> Dict:
+    # the csv is parsed into arrow batches that go straight to the validator instead of through _pqs/ and
+    # two events.  The _res/ findings, summary, report and submission results are the same as the split path
+    # writes.  The validator and aggregator are imported here, routing only needs should_fuse
+    import polars as pl
+
+    from sbl_validation_processor.parquet_validator import validate_parquets
+    from sbl_validation_processor.results_aggregator import (
+        aggregate_validation_results,
+        get_record_results,
+    )
+
+    try:
+        with instrumentation.stage("fused") as metrics:
+            batch_size = int(os.getenv("BATCH_SIZE", 50000))
+            csv_data = DigestReader(get_csv_data(bucket, key))
+            try:
+                with metrics.timer("parse"):
+                    tables = list(iter_csv_batches(csv_data, batch_size))
+            finally:
+                csv_data.close()
+            table = pyarrow.concat_tables(tables)
+            metrics.add("rows", table.num_rows)
+            metrics.add("bytes_read", csv_data.bytes_read)
+            # the parts are read back with every column as a string, the same as the parsed table
+            lf = pl.from_arrow(table).lazy()
+            del tables, table
+
+            # the validator derives _res/ from where the splitter would have put the parts
+            response = validate_parquets(bucket, get_pqs_folder(key), lf)
+            record = response["Records"][0]
+            aggregate_validation_results(
+                bucket, record["s3"]["object"]["key"], **get_record_results(record)
+            )
+        return {**response, "metrics": metrics.summary()}
+    except Exception as e:
+        log.exception("Failed fused validation of {} in {}".format(key, bucket))
+        raise e
@@ -0,0 +1,88 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List
+
+# the lambda and job entry points, whose import time is what a cold start pays before any work happens
+ENTRY_POINTS = [
+    "sbl_validation_processor.lambda_csv_to_parquet.lambda_function",
+    "sbl_validation_processor.lambda_parquet_validator.lambda_function",
+    "sbl_validation_processor.lambda_validation_aggregator.lambda_function",
+    "sbl_validation_processor.sqs_csv_to_parquet.job",
+    "sbl_validation_processor.sqs_parquet_validation.job",
+    "sbl_validation_processor.sqs_validation_aggregator.job",
+]
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    # parses the stderr of python -X importtime, one line per module in the order imports finish
+    timings = []
+    for line in output.splitlines():
+        if match := _IMPORT_TIME_LINE.match(line):
+            self_us, cumulative_us, indent, module = match.groups()
+            timings.append(
+                ImportTiming(
+                    module=module,
+                    self_us=int(self_us),
+                    cumulative_us=int(cumulative_us),
+                    depth=(len(indent) - 1) // 2,
+                )
+            )
+    return timings
+
+
+def profile_imports(module: str) -> List[ImportTiming]:
+    # imports module in a fresh interpreter, which is what a cold start sees
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(p for p in sys.path if p)}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if result.returncode != 0:
+        raise ImportError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def cost_by_package(timings: List[ImportTiming]) -> Dict[str, int]:
+    # self time summed per top level package (polars, boto3, ...), in microseconds, most expensive first
+    costs = defaultdict(int)
+    for timing in timings:
+        costs[timing.module.split(".")[0]] += timing.self_us
+    return dict(sorted(costs.items(), key=lambda item: item[1], reverse=True))
+
+
+def total_us(timings: List[ImportTiming], module: str) -> int:
+    return next(t.cumulative_us for t in timings if t.module == module)
+
+
+def imported_packages(timings: List[ImportTiming]) -> set:
+    return {timing.module.split(".")[0] for timing in timings}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start import cost")
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    for module in args.modules:
+        timings = profile_imports(module)
+        print(f"{module}: {total_us(timings, module) / 1000:.1f}ms")
+        for package, cost in list(cost_by_package(timings).items())[: args.top]:
+            print(f"  {package:<40} {cost / 1000:8.1f}ms")
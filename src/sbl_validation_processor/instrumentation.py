@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+log = logging.getLogger()
+
+# the stage running on this thread (or task), so helpers deep in a stage can record without passing it around
+_current: ContextVar[Optional["StageMetrics"]] = ContextVar(
+    "stage_metrics", default=None
+)
+
+METRICS_FORMATS = ["json", "emf", "prometheus"]
+
+# the counters that get a unit and a metric of their own in EMF and prometheus output
+_UNITS = {
+    "wall_seconds": "Seconds",
+    "rows": "Count",
+    "rows_per_second": "Count/Second",
+    "batches": "Count",
+    "bytes_read": "Bytes",
+    "bytes_written": "Bytes",
+    "process_peak_rss_bytes": "Bytes",
+}
+
+
+def process_peak_rss_bytes() -> int:
+    # the high water mark of this process or any finished child (e.g. partition workers) over its whole life,
+    # not just this stage.  A long running worker reports its largest job so far with every later job, so it's
+    # only a stage's own peak when the stage has the process to itself.  ru_maxrss is in kilobytes on linux
+    # and bytes on macos
+    scale = 1 if sys.platform == "darwin" else 1024
+    return scale * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def get_metrics_formats() -> list:
+    # METRICS_FORMAT is a comma separated list of json (a log line per stage and batch), emf (CloudWatch
+    # embedded metric format on stdout) and prometheus (a text exposition file for a textfile collector)
+    formats = [
+        f.strip() for f in os.getenv("METRICS_FORMAT", "json").split(",") if f.strip()
+    ]
+    for metrics_format in formats:
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(
+                f"unknown METRICS_FORMAT {metrics_format}, expected any of {METRICS_FORMATS}"
+            )
+    return formats
+
+
+class StageMetrics:
+    # Wall time, row and byte counters, per batch timings and named timers (e.g. polars collects) for one run
+    # of a pipeline stage.  Counters can be added to from upload threads, so they're locked
+    def __init__(self, stage: str, **dimensions):
+        self.stage = stage
+        self.dimensions = dimensions
+        self.status = "ok"
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(float)
+        self.timing_counts = defaultdict(int)
+        self.log_batches = bool(
+            json.loads(os.getenv("METRICS_LOG_BATCHES", "true").lower())
+        )
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: int):
+        with self._lock:
+            self.counters[name] += value
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings[name] += elapsed
+                self.timing_counts[name] += 1
+
+    def batch(self, rows: int, seconds: float, **fields):
+        # logs one batch on its own.  Rows are added to the stage separately, the validator sees every row
+        # once per phase
+        with self._lock:
+            self.counters["batches"] += 1
+            batch = self.counters["batches"]
+        if self.log_batches and "json" in get_metrics_formats():
+            log.info(
+                json.dumps(
+                    {
+                        "metric_type": "batch",
+                        "stage": self.stage,
+                        **self.dimensions,
+                        "batch": batch,
+                        "rows": rows,
+                        "seconds": round(seconds, 3),
+                        "rows_per_second": (
+                            round(rows / seconds, 1) if seconds else None
+                        ),
+                        **fields,
+                    }
+                )
+            )
+
+    def summary(self) -> Dict:
+        wall = time.perf_counter() - self._start
+        with self._lock:
+            counters = dict(self.counters)
+            timings = {
+                name: {"seconds": round(seconds, 3), "count": self.timing_counts[name]}
+                for name, seconds in self.timings.items()
+            }
+        rows = counters.pop("rows", 0)
+        return {
+            "stage": self.stage,
+            **self.dimensions,
+            "status": self.status,
+            "wall_seconds": round(wall, 3),
+            "rows": rows,
+            "rows_per_second": round(rows / wall, 1) if wall else None,
+            "batches": counters.pop("batches", 0),
+            "bytes_read": counters.pop("bytes_read", 0),
+            "bytes_written": counters.pop("bytes_written", 0),
+            "process_peak_rss_bytes": process_peak_rss_bytes(),
+            **counters,
+            "timings": timings,
+        }
+
+
+def emf_record(summary: Dict) -> Dict:
+    namespace = os.getenv("METRICS_NAMESPACE", "SBLValidation")
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [["stage"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": unit}
+                        for name, unit in _UNITS.items()
+                        if summary.get(name) is not None
+                    ],
+                }
+            ],
+        },
+        **{k: v for k, v in summary.items() if k != "timings"},
+        **{
+            f"{name}_seconds": timing["seconds"]
+            for name, timing in summary["timings"].items()
+        },
+    }
+
+
+def prometheus_lines(summary: Dict) -> str:
+    labels = f'stage="{summary["stage"]}",status="{summary["status"]}"'
+    lines = [
+        f"sbl_validation_{name}{{{labels}}} {summary[name]}"
+        for name in _UNITS
+        if summary.get(name) is not None
+    ]
+    lines.extend(
+        f'sbl_validation_timer_seconds{{{labels},timer="{name}"}} {timing["seconds"]}'
+        for name, timing in summary["timings"].items()
+    )
+    return "\n".join(lines) + "\n"
+
+
+def emit(summary: Dict):
+    formats = get_metrics_formats()
+    if "json" in formats:
+        log.info(json.dumps({"metric_type": "stage", **summary}))
+    if "emf" in formats:
+        # EMF has to be the whole line, so it skips the log formatter
+        sys.stdout.write(json.dumps(emf_record(summary)) + "\n")
+        sys.stdout.flush()
+    if "prometheus" in formats:
+        path = os.getenv(
+            "METRICS_PROMETHEUS_FILE", f"/tmp/sbl_validation_{summary['stage']}.prom"
+        )
+        # written then renamed, so a collector never reads half a file
+        with open(f"{path}.tmp", "w") as f:
+            f.write(prometheus_lines(summary))
+        os.replace(f"{path}.tmp", path)
+
+
+@contextmanager
+def stage(name: str, **dimensions):
+    # records a pipeline stage, emitting its summary when it finishes (or fails)
+    metrics = StageMetrics(name, **dimensions)
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    except BaseException:
+        metrics.status = "failed"
+        raise
+    finally:
+        _current.reset(token)
+        try:
+            emit(metrics.summary())
+        except Exception:
+            log.exception("Failed to emit metrics for {}".format(name))
+
+
+def current() -> Optional[StageMetrics]:
+    return _current.get()
+
+
+def timer(name: str):
+    metrics = _current.get()
+    return metrics.timer(name) if metrics else nullcontext()
+
+
+def add(name: str, value: int):
+    if metrics := _current.get():
+        metrics.add(name, value)
@@ -1,16 +1,15 @@
 import json
 import urllib.parse
-import boto3
 import logging
 import os
 
+from sbl_validation_processor.aws_clients import get_client
 from sbl_validation_processor.csv_to_parquet import split_csv_into_parquet
+from sbl_validation_processor.fused_pipeline import run_fused, should_fuse
 
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
-eb = boto3.client("events")
-
 
 def lambda_handler(event, context):
     log.info("Received event: " + json.dumps(event, indent=None))
@@ -24,17 +23,22 @@ def lambda_handler(event, context):
     key = urllib.parse.unquote_plus(request["object"]["key"], encoding="utf-8")
     log.info(f"Received key: {key}")
     if "report.csv" not in key:
-        eb_response = eb.put_events(
-            Entries=[
-                {
-                    "Detail": json.dumps(split_csv_into_parquet(bucket, key)),
-                    "DetailType": "csv_to_parquet",
-                    "EventBusName": os.getenv("EVENT_BUS", "default"),
-                    "Source": "csv_to_parquet",
-                }
-            ]
-        )
-        log.info("put event done")
-        log.info(eb_response)
+        if should_fuse(bucket, key):
+            # small uploads are validated and aggregated here, with no event for the validator
+            run_fused(bucket, key)
+            log.info("fused validation done")
+        else:
+            eb_response = get_client("events").put_events(
+                Entries=[
+                    {
+                        "Detail": json.dumps(split_csv_into_parquet(bucket, key)),
+                        "DetailType": "csv_to_parquet",
+                        "EventBusName": os.getenv("EVENT_BUS", "default"),
+                        "Source": "csv_to_parquet",
+                    }
+                ]
+            )
+            log.info("put event done")
+            log.info(eb_response)
     else:
         raise RuntimeWarning("not processing report.csv: %s", key)
@@ -1,17 +1,18 @@
 import logging
 import os
 import urllib.parse
-import boto3
 import json
 
-from sbl_validation_processor.parquet_validator import validate_parquets
-
 log = logging.getLogger()
 log.setLevel(logging.INFO)
-eb = boto3.client("events")
 
 
 def lambda_handler(event, context):
+    # the validator (polars, regtech_data_validator) and boto3 are imported on the first event rather than
+    # when the function loads, see tests/test_import_profile.py
+    from sbl_validation_processor.aws_clients import get_client
+    from sbl_validation_processor.parquet_validator import validate_parquets
+
     if "detail" in event:
         request = event["detail"]
     elif "responsePayload" in event:
@@ -25,7 +26,7 @@ def lambda_handler(event, context):
     )
     log.info(f"Received key: {key}")
 
-    eb_response = eb.put_events(
+    eb_response = get_client("events").put_events(
         Entries=[
             {
                 "Detail": json.dumps(validate_parquets(bucket, key)),
@@ -1,13 +1,18 @@
 import logging
 import urllib.parse
 
-from sbl_validation_processor.results_aggregator import aggregate_validation_results
-
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
 
 def lambda_handler(event, context):
+    # the aggregator (polars, sqlalchemy, sbl_filing_api, regtech_data_validator) is imported on the first
+    # event rather than when the function loads, see tests/test_import_profile.py
+    from sbl_validation_processor.results_aggregator import (
+        aggregate_validation_results,
+        get_record_results,
+    )
+
     if "detail" in event:
         request = event["detail"]
     elif "responsePayload" in event:
@@ -19,11 +24,12 @@ def lambda_handler(event, context):
     key = urllib.parse.unquote_plus(
         request["Records"][0]["s3"]["object"]["key"], encoding="utf-8"
     )
-    results = request["Records"][0]["results"]
     log.info(f"Received key: {key}")
 
     try:
-        aggregate_validation_results(bucket, key, results)
+        aggregate_validation_results(
+            bucket, key, **get_record_results(request["Records"][0])
+        )
     except Exception as e:
         log.exception("Failed to validate {} in {}".format(key, bucket))
         raise e
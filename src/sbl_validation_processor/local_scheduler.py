@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+log = logging.getLogger()
+
+
+def _percentiles(values) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+class StageStats:
+    # counts plus recent wait (queued to started) and run times of one stage
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = deque(maxlen=1000)
+        self.run_seconds = deque(maxlen=1000)
+
+    def to_dict(self) -> Dict:
+        return {
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_seconds": _percentiles(self.wait_seconds),
+            "run_seconds": _percentiles(self.run_seconds),
+        }
+
+
+class LocalScheduler:
+    # Runs the local pipeline's stages on a bounded thread pool instead of the watchdog observer thread, so one
+    # large upload doesn't hold up the others.  Each stage returns the arguments for the next one (or None to
+    # stop), which is queued straight away rather than handed on through marker files.  Watchdog can report
+    # the same file more than once, so an upload is only run once per path and modification time while its
+    # stages are running.  It's forgotten once they finish, so the scheduler only remembers what's in flight.
+    def __init__(self, stages: List[Tuple[str, Callable]], workers: int = None):
+        self.stages = stages
+        self.workers = workers or int(os.getenv("LOCAL_WORKERS", 2))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="local"
+        )
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._seen = set()
+        self._pending = 0
+        self._stats = {name: StageStats() for name, _ in stages}
+
+    def submit(self, path: str, *args) -> bool:
+        # starts the first stage with args, unless this version of path was already submitted
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            log.info("{} is gone, not scheduling it".format(path))
+            return False
+        key = (path, mtime)
+        with self._lock:
+            if key in self._seen:
+                log.info("{} already scheduled".format(path))
+                return False
+            self._seen.add(key)
+        self._schedule(key, 0, args)
+        return True
+
+    def _schedule(self, key: Tuple[str, int], index: int, args: Tuple):
+        with self._lock:
+            self._stats[self.stages[index][0]].queued += 1
+            self._pending += 1
+        self._executor.submit(self._run, key, index, args, time.monotonic())
+
+    def _run(self, key: Tuple[str, int], index: int, args: Tuple, queued_at: float):
+        name, fn = self.stages[index]
+        stats = self._stats[name]
+        started = time.monotonic()
+        with self._lock:
+            stats.queued -= 1
+            stats.running += 1
+            stats.wait_seconds.append(started - queued_at)
+        next_args = None
+        try:
+            next_args = fn(*args)
+            failed = False
+        except Exception:
+            log.exception("local {} stage failed for {}".format(name, args))
+            failed = True
+        with self._lock:
+            stats.running -= 1
+            stats.run_seconds.append(time.monotonic() - started)
+            if failed:
+                stats.failed += 1
+            else:
+                stats.completed += 1
+        chained = next_args is not None and index + 1 < len(self.stages)
+        if chained:
+            self._schedule(key, index + 1, next_args)
+        with self._lock:
+            if not chained:
+                self._seen.discard(key)
+            self._pending -= 1
+            if not self._pending:
+                self._idle.notify_all()
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    def join(self, timeout: float = None) -> bool:
+        # waits until every queued stage, including the ones they chain to, has finished
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def shutdown(self):
+        self.join()
+        self._executor.shutdown(wait=True)
@@ -1,3 +1,4 @@
+import os
 import time
 import json
 
@@ -5,71 +6,77 @@ from watchdog.observers import Observer
 from watchdog.events import PatternMatchingEventHandler
 
 from sbl_validation_processor.csv_to_parquet import split_csv_into_parquet
+from sbl_validation_processor.local_scheduler import LocalScheduler
 from sbl_validation_processor.parquet_validator import validate_parquets
-from sbl_validation_processor.results_aggregator import aggregate_validation_results
+from sbl_validation_processor.results_aggregator import (
+    aggregate_validation_results,
+    get_record_results,
+)
 
 local_path = "/tmp/filing_bucket/upload/"
 
 
-class CsvHandler(PatternMatchingEventHandler):
-    patterns = ["*.csv"]
+def split(key: str):
+    response = split_csv_into_parquet(local_path, key)
+    return (response["Records"][0]["s3"]["object"]["key"],)
 
-    def on_created(self, event):
-        print(f"CSV File created: {event.src_path}", flush=True)
-        if "report.csv" not in event.src_path:
-            split_csv_into_parquet(local_path, event.src_path.replace(local_path, ""))
-            paths = event.src_path.split("/")
-            fname = paths[-1]
-            with open(
-                "/".join(paths[:-1]) + f"/{fname.split(".")[0]}.done_pqs", "wb"
-            ) as pqs_file:
-                pqs_file.write(f"{fname} to parquet done".encode("utf-8"))
 
+def validate(key: str):
+    record = validate_parquets(local_path, key)["Records"][0]
+    return (record["s3"]["object"]["key"], get_record_results(record))
 
-class PqsHandler(PatternMatchingEventHandler):
-    patterns = ["*.done_pqs"]
 
-    def on_created(self, event):
-        print(f"PQS File created: {event.src_path}", flush=True)
-        paths = event.src_path.split("/")
-        sub_id = paths[-1].split(".")[0]
-        key = "/".join(paths[:-1]) + f"/{sub_id}_pqs/"
-        response = validate_parquets(local_path, key.replace(local_path, ""))
+def aggregate(key: str, record_results: dict):
+    aggregate_validation_results(local_path, key, **record_results)
+
 
-        with open("/".join(paths[:-1]) + f"/{sub_id}.done_res", "wb") as res_file:
-            res_file.write(json.dumps(response).encode("utf-8"))
+scheduler = LocalScheduler(
+    [("split", split), ("validate", validate), ("aggregate", aggregate)]
+)
 
 
-class ResHandler(PatternMatchingEventHandler):
-    patterns = ["*.done_res"]
+class CsvHandler(PatternMatchingEventHandler):
+    patterns = ["*.csv"]
 
+    # on_created fires before a large upload is fully written, so uploads run once they're closed (or moved
+    # into place).  Some observers (FSEvents, polling) never emit close events, on_created stays as the
+    # fallback for them, the scheduler skips a version of the file it already has
     def on_created(self, event):
-        print(f"RES File created: {event.src_path}", flush=True)
-        with open(event.src_path, "r") as file:
-            results = json.loads(file.read())
-        paths = event.src_path.split("/")
-        fname = paths[-1].split(".")[0]
-        key = "/".join(paths[:-1]) + f"/{fname}_res/"
-        aggregate_validation_results(local_path, key.replace(local_path, ""), results)
+        self.schedule(event.src_path)
+
+    def on_closed(self, event):
+        self.schedule(event.src_path)
+
+    def on_moved(self, event):
+        self.schedule(event.dest_path)
+
+    def schedule(self, src_path: str):
+        if "report.csv" not in src_path:
+            print(f"CSV File written: {src_path}", flush=True)
+            scheduler.submit(src_path, src_path.replace(local_path, ""))
 
 
 if __name__ == "__main__":
     csv_event_handler = CsvHandler()
-    pqs_event_handler = PqsHandler()
-    res_event_hander = ResHandler()
 
     observer = Observer()
     observer.schedule(csv_event_handler, path=local_path, recursive=True)
-    observer.schedule(pqs_event_handler, path=local_path, recursive=True)
-    observer.schedule(res_event_hander, path=local_path, recursive=True)
 
     observer.start()
     print("Observer started, looping", flush=True)
+    stats_interval = int(os.getenv("LOCAL_STATS_SECONDS", 30))
+    last_stats = None
     try:
         while True:
-            time.sleep(1)
+            time.sleep(stats_interval)
+            # queue depth and latency per stage, whenever something changed
+            stats = scheduler.stats()
+            if stats != last_stats:
+                print(json.dumps({"scheduler": stats}), flush=True)
+                last_stats = stats
     except KeyboardInterrupt:
         observer.stop()
 
     print("Done, killing observer", flush=True)
     observer.join()
+    scheduler.shutdown()
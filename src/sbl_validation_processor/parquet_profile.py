@@ -0,0 +1,57 @@
+import json
+import os
+import pyarrow
+import pyarrow.parquet as pq
+
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import polars as pl
+
+
+@dataclass(frozen=True)
+class ParquetWriteProfile:
+    # How the splitter's parts and the validator's findings are written.  Findings repeat the same few
+    # validation ids, phases and field names over millions of rows, so dictionary encoding plus zstd shrinks
+    # them far more than the snappy pyarrow uses by default, and row groups small enough to have useful
+    # min/max statistics let a scan filtered on validation_id skip most of a file.
+    compression: str = "zstd"
+    compression_level: Optional[int] = 3
+    row_group_size: Optional[int] = 100000
+    write_statistics: bool = True
+    use_dictionary: bool = True
+
+    @classmethod
+    def from_env(cls) -> "ParquetWriteProfile":
+        level = os.getenv("PARQUET_COMPRESSION_LEVEL", "3")
+        row_group_size = os.getenv("PARQUET_ROW_GROUP_SIZE", "100000")
+        return cls(
+            compression=os.getenv("PARQUET_COMPRESSION", "zstd"),
+            compression_level=int(level) if level else None,
+            row_group_size=int(row_group_size) if row_group_size else None,
+            write_statistics=bool(
+                json.loads(os.getenv("PARQUET_STATISTICS", "true").lower())
+            ),
+            use_dictionary=bool(
+                json.loads(os.getenv("PARQUET_DICTIONARY", "true").lower())
+            ),
+        )
+
+    def write_options(self) -> dict:
+        options = asdict(self)
+        if self.compression in ("none", "snappy", "lz4"):
+            # these codecs don't take a level
+            options.pop("compression_level")
+        return options
+
+
+def write_table(table: pyarrow.Table, sink, profile: ParquetWriteProfile = None):
+    profile = profile or ParquetWriteProfile.from_env()
+    pq.write_table(table, sink, **profile.write_options())
+
+
+def write_frame(df: "pl.DataFrame", sink, profile: ParquetWriteProfile = None):
+    # polars frames go through pyarrow too, so both stages honor the same options (polars' own writer has
+    # no dictionary setting)
+    write_table(df.to_arrow(), sink, profile)
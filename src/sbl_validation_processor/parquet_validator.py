@@ -1,60 +1,114 @@
-from typing import List
-import boto3
-import boto3.session
+from typing import Dict, List, Tuple
 import os
 import json
 import logging
+import multiprocessing
 import polars as pl
 import re
-import urllib.parse
+import time
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from io import BytesIO
-from botocore.exceptions import ClientError
-from pydantic import PostgresDsn
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
-from regtech_data_validator.validator import validate_lazy_frame
+from regtech_data_validator.validator import (
+    validate_lazy_frame,
+    validate_register_level,
+)
 from regtech_data_validator.validation_results import ValidationResults, ValidationPhase
 
+from sbl_validation_processor import instrumentation
+from sbl_validation_processor.aws_clients import reset_clients
+from sbl_validation_processor.batch_sizing import (
+    batch_size_from_manifest,
+    get_target_bytes,
+)
+from sbl_validation_processor.database import get_engine, get_timings, reset_engines
+from sbl_validation_processor.findings_format import (
+    get_findings_format,
+    get_findings_layout,
+    is_long,
+    partition_findings,
+    to_long,
+    to_wide,
+)
+from sbl_validation_processor.findings_loader import FindingsBulkLoader
+from sbl_validation_processor.parquet_profile import write_frame
+from sbl_validation_processor.result_cache import (
+    cache_key,
+    get_cached,
+    load_manifest,
+    put_cached,
+    restore_cached,
+)
+from sbl_validation_processor.storage import get_storage, part_sort_key
+from sbl_validation_processor.validation_summary import ValidationSummary, write_summary
+
 logging.basicConfig()
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
+REGISTER_SCOPE = "register"
+
 
 def scan_parquets(bucket: str, key: str):
-    env = os.getenv("ENV", "S3")
-    if env == "LOCAL":
-        return pl.scan_parquet(os.path.join(bucket, key), allow_missing_columns=True)
-    else:
-        session = boto3.session.Session()
-        creds = session.get_credentials()
-        storage_options = {
-            "aws_access_key_id": creds.access_key,
-            "aws_secret_access_key": creds.secret_key,
-            "session_token": creds.token,
-            "aws_region": "us-east-1",
-        }
-        return pl.scan_parquet(
-            f"s3://{bucket}/{key}",
-            allow_missing_columns=True,
-            storage_options=storage_options,
-        )
+    return get_storage().scan_parquet(bucket, key, allow_missing_columns=True)
 
 
 def write_parquet(buffer: BytesIO, bucket: str, parquet_file: str):
-    env = os.getenv("ENV", "S3")
-    if env == "LOCAL":
-        file_path = os.path.join(bucket, parquet_file)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "wb") as f:
-            f.write(buffer.getvalue())
-    else:
-        s3 = boto3.client("s3")
-        s3.upload_fileobj(buffer, bucket, parquet_file)
+    get_storage().write_bytes(bucket, parquet_file, buffer)
+
+
+def prepare_findings(
+    findings: pl.DataFrame, phase: str, submission_id: str, row_offset: int = 0
+) -> pl.DataFrame:
+    df = findings.with_columns(
+        phase=pl.lit(phase),
+        submission_id=pl.lit(submission_id),
+    )
+    if row_offset:
+        # rows are numbered from the start of the validated frame, shift them back to rows in the file
+        df = df.with_columns((pl.col("row") + row_offset).cast(pl.UInt32))
+    return df.cast({"phase": pl.String})
+
 
+def write_findings(df: pl.DataFrame, bucket: str, parquet_file: str) -> List[str]:
+    # returns the parts written, parquet_file itself unless the layout splits it by validation_id
+    parts = [(parquet_file, df)]
+    if get_findings_layout() == "partitioned":
+        parts = partition_findings(df, parquet_file)
+    for part_file, part_df in parts:
+        if get_findings_format() == "long":
+            part_df = to_long(part_df)
+        buffer = BytesIO()
+        write_frame(part_df, buffer)
+        instrumentation.add("bytes_written", buffer.getbuffer().nbytes)
+        buffer.seek(0)
+        write_parquet(buffer, bucket, part_file)
+    return [part_file for part_file, _ in parts]
 
-def validate_parquets(bucket: str, key: str):
+
+def read_findings(bucket: str, parquet_file: str) -> pl.DataFrame:
+    # a result file as the validator produced it, whichever format it was written in
+    df = get_storage().scan_parquet(bucket, parquet_file).collect()
+    if is_long(df.schema):
+        df = to_wide(df.lazy(), df["field_index"].max() or 0).collect()
+    return df
+
+
+def insert_findings(df: pl.DataFrame):
+    with get_db_session() as db_session:
+        db_entries = df.write_database(
+            table_name="findings",
+            connection=db_session,
+            if_table_exists="append",
+        )
+        db_session.commit()
+    log.info("{} findings persisted to db".format(db_entries))
+
+
+def validate_parquets(bucket: str, key: str, lf: pl.LazyFrame = None):
+    # lf is an upload already parsed in this process (see fused_pipeline), the parts under key are never
+    # written, so the partition, cache and sizing options that read them are skipped
     log.info(f"Validating parquets in {bucket}, File {key}")
 
     file_paths = [path for path in key.split("/") if path]
@@ -68,6 +122,16 @@ def validate_parquets(bucket: str, key: str):
     batch_size = int(os.getenv("BATCH_SIZE", 50000))
     max_errors = int(os.getenv("MAX_ERRORS", 1000000))
     persist_db = bool(json.loads(os.getenv("DB_PERSIST", "false").lower()))
+    # copy streams every batch into one transaction, insert is the old per batch write_database
+    persist_method = os.getenv("DB_PERSIST_METHOD", "copy")
+    # more than one worker validates contiguous runs of parts in separate processes
+    workers = int(os.getenv("VALIDATION_WORKERS", 1))
+    # reuse results from an earlier upload with the same content, see result_cache
+    use_cache = bool(json.loads(os.getenv("RESULT_CACHE", "false").lower()))
+    # a byte target sizes batches from the width of this file's rows, which the splitter's manifest has
+    target_bytes = get_target_bytes("VALIDATION_TARGET_BYTES") or get_target_bytes()
+    if lf is not None:
+        workers, use_cache, target_bytes = 1, False, None
 
     if root := os.getenv("S3_ROOT"):
         validation_result_path = (
@@ -76,40 +140,124 @@ def validate_parquets(bucket: str, key: str):
     else:
         validation_result_path = f"{'/'.join(file_paths[:-1])}/{submission_id}_res/"
 
+    loader = None
     try:
-        lf = scan_parquets(bucket, key)
-        all_results = []
+        with instrumentation.stage("validate", workers=workers) as metrics:
+            metrics.add(
+                "bytes_read",
+                sum(
+                    obj.size
+                    for obj in get_storage().list_prefix(bucket, key)
+                    if obj.key.endswith(".parquet")
+                ),
+            )
+            if persist_db and persist_method == "copy":
+                loader = FindingsBulkLoader()
 
-        for validation_results in validate_lazy_frame(
-            lf, {"lei": lei}, batch_size=batch_size, max_errors=max_errors
-        ):
-            if validation_results.findings.height:
-                buffer = BytesIO()
-                df = validation_results.findings.with_columns(
-                    phase=pl.lit(validation_results.phase),
-                    submission_id=pl.lit(submission_id),
+            manifest = load_manifest(bucket, key) if use_cache or target_bytes else None
+            if target_bytes and manifest:
+                batch_size = batch_size_from_manifest(
+                    manifest["parts"], target_bytes, batch_size
                 )
-                df = df.cast({"phase": pl.String})
-                log.info("findings found for batch {}: {}".format(pq_idx, df.height))
-                if persist_db:
-                    db_session = get_db_session()
-                    db_entries = df.write_database(
-                        table_name="findings",
-                        connection=db_session,
-                        if_table_exists="append",
-                    )
-                    db_session.commit()
-                    log.info("{} findings persisted to db".format(db_entries))
-                df.write_parquet(buffer)
-                buffer.seek(0)
-                write_parquet(
-                    buffer, bucket, f"{validation_result_path}{pq_idx:05}.parquet"
+                log.info("batch size for {} bytes: {}".format(target_bytes, batch_size))
+            file_cache_key = (
+                cache_key(
+                    [manifest["csv_digest"]],
+                    lei=lei,
+                    batch_size=batch_size,
+                    max_errors=max_errors,
+                    findings_format=get_findings_format(),
+                    findings_layout=get_findings_layout(),
                 )
-                pq_idx += 1
-            validation_results.findings = None
-            all_results.append(validation_results)
+                if manifest and use_cache
+                else None
+            )
+            cached = None
+            if file_cache_key and (cache_entry := get_cached(bucket, file_cache_key)):
+                cached = restore_cached(
+                    bucket,
+                    file_cache_key,
+                    cache_entry,
+                    validation_result_path,
+                    submission_id,
+                )
+
+            if cached:
+                log.info("reusing cached results for {}".format(key))
+                summary, result_files = cached
+            elif workers > 1:
+                summary, result_files = validate_partitions(
+                    bucket,
+                    key,
+                    lei,
+                    submission_id,
+                    validation_result_path,
+                    workers,
+                    batch_size,
+                    max_errors,
+                    manifest,
+                    use_cache,
+                )
+            else:
+                if lf is None:
+                    lf = scan_parquets(bucket, key)
+                summary = ValidationSummary()
+                result_files = []
+
+                batch_start = time.perf_counter()
+                for validation_results in validate_lazy_frame(
+                    lf, {"lei": lei}, batch_size=batch_size, max_errors=max_errors
+                ):
+                    metrics.batch(
+                        validation_results.record_count,
+                        time.perf_counter() - batch_start,
+                        phase=str(validation_results.phase),
+                        findings=validation_results.findings.height,
+                    )
+                    if validation_results.findings.height:
+                        df = prepare_findings(
+                            validation_results.findings,
+                            validation_results.phase,
+                            submission_id,
+                        )
+                        log.info(
+                            "findings found for batch {}: {}".format(pq_idx, df.height)
+                        )
+                        if loader:
+                            loader.submit(df)
+                        elif persist_db:
+                            insert_findings(df)
+                        result_file = f"{validation_result_path}{pq_idx:05}.parquet"
+                        result_files.extend(
+                            (part_file, str(validation_results.phase))
+                            for part_file in write_findings(df, bucket, result_file)
+                        )
+                        pq_idx += 1
+                    summary.add(validation_results, validation_results.findings)
+                    validation_results.findings = None
+                    batch_start = time.perf_counter()
 
-        validation_results = combine_results(all_results)
+            if persist_db and (cached or workers > 1):
+                # findings that weren't validated in this process are loaded from the result files.  Partition
+                # workers don't touch the db, so nothing from a file that failed syntax on any partition gets
+                # persisted
+                for result_file, _ in result_files:
+                    with metrics.timer("collect_results"):
+                        df = read_findings(bucket, result_file)
+                    if loader:
+                        loader.submit(df)
+                    else:
+                        insert_findings(df)
+
+            if file_cache_key and not cached:
+                put_cached(bucket, file_cache_key, summary, result_files)
+            if loader:
+                with metrics.timer("db_commit"):
+                    loader.commit()
+            results_ref = write_summary(summary, bucket, validation_result_path)
+            if persist_db:
+                log.info("db timings: {}".format(get_timings()))
+            metrics.add("rows", summary.to_results()["total_records"])
 
         return {
             "statusCode": 200,
@@ -120,15 +268,305 @@ def validate_parquets(bucket: str, key: str):
                         "bucket": {"name": bucket},
                         "object": {"key": validation_result_path},
                     },
-                    "results": validation_results,
+                    "results_ref": results_ref,
                 }
             ],
+            "metrics": metrics.summary(),
         }
     except Exception as e:
         log.exception("Failed to validate {} in {}".format(key, bucket))
+        if loader:
+            loader.abort()
         raise e
 
 
+def get_part_row_counts(bucket: str, key: str) -> List[Tuple[str, int]]:
+    # row counts come from the parquet footers, so no data is read
+    storage = get_storage()
+    part_keys = sorted(
+        (
+            obj.key
+            for obj in storage.list_prefix(bucket, key)
+            if obj.key.endswith(".parquet")
+        ),
+        key=part_sort_key,
+    )
+    with ThreadPoolExecutor(
+        max_workers=int(os.getenv("S3_LIST_PARALLELISM", 8))
+    ) as pool:
+        row_counts = pool.map(
+            lambda part_key: storage.scan_parquet(bucket, part_key)
+            .select(pl.len())
+            .collect()
+            .item(),
+            part_keys,
+        )
+        return list(zip(part_keys, row_counts))
+
+
+def plan_partitions(
+    part_row_counts: List[Tuple[str, int]], workers: int
+) -> List[Tuple[int, List[str]]]:
+    # contiguous runs of parts with roughly even row counts, each with the row offset of its first part
+    target_rows = sum(rows for _, rows in part_row_counts) / workers
+    partitions = []
+    part_keys, row_offset, total_rows = [], 0, 0
+    for part_key, rows in part_row_counts:
+        part_keys.append(part_key)
+        total_rows += rows
+        if (
+            total_rows >= target_rows * (len(partitions) + 1)
+            and len(partitions) < workers - 1
+        ):
+            partitions.append((row_offset, part_keys))
+            part_keys, row_offset = [], total_rows
+    if part_keys:
+        partitions.append((row_offset, part_keys))
+    return partitions
+
+
+def init_worker():
+    # nothing inherited from the parent process (clients, pools) is safe to reuse
+    reset_clients()
+    reset_engines()
+
+
+def validate_partition(
+    bucket: str,
+    part_keys: List[str],
+    row_offset: int,
+    partition: int,
+    lei: str,
+    submission_id: str,
+    validation_result_path: str,
+    batch_size: int,
+    max_errors: int,
+) -> Tuple[ValidationSummary, List[Tuple[str, str]]]:
+    # workers emit their own metrics, the parent's stage can't see into their processes
+    with instrumentation.stage("validate_partition", partition=partition) as metrics:
+        lf = pl.concat([scan_parquets(bucket, k) for k in part_keys], how="diagonal")
+        summary = ValidationSummary()
+        result_files = []
+        pq_idx = 1
+        batch_start = time.perf_counter()
+        for validation_results in validate_lazy_frame(
+            lf, {"lei": lei}, batch_size=batch_size, max_errors=max_errors
+        ):
+            metrics.batch(
+                validation_results.record_count,
+                time.perf_counter() - batch_start,
+                phase=str(validation_results.phase),
+            )
+            findings = validation_results.findings
+            if "scope" in findings.columns:
+                # register checks here would only see this partition, they're run over the whole file instead
+                findings = findings.filter(pl.col("scope") != REGISTER_SCOPE)
+            if findings.height:
+                df = prepare_findings(
+                    findings, validation_results.phase, submission_id, row_offset
+                )
+                result_file = (
+                    f"{validation_result_path}p{partition:03}_{pq_idx:05}.parquet"
+                )
+                log.info(
+                    "findings found for partition {} batch {}: {}".format(
+                        partition, pq_idx, df.height
+                    )
+                )
+                result_files.extend(
+                    (part_file, str(validation_results.phase))
+                    for part_file in write_findings(df, bucket, result_file)
+                )
+                pq_idx += 1
+            summary.add(validation_results, findings, include_register=False)
+            validation_results.findings = None
+            batch_start = time.perf_counter()
+        metrics.add("rows", max(summary.record_counts.values(), default=0))
+    return summary, result_files
+
+
+def validate_register(lf: pl.LazyFrame, lei: str) -> ValidationResults:
+    # the validator's register checks (duplicate uids) over the whole file's uid column, once
+    return validate_register_level({"lei": lei}, lf.select("uid").collect()["uid"])
+
+
+def cap_findings(
+    bucket: str,
+    result_files: List[Tuple[str, str]],
+    max_errors: int,
+    summary: ValidationSummary,
+) -> List[Tuple[str, str]]:
+    # each partition applied max_errors on its own, so together they can hold up to workers times as many
+    # findings as a single pass.  Keeps the first max_errors of them, in result file order, and takes the
+    # rest back out of the summary's findings counts
+    if sum(summary.validation_counts.values()) <= max_errors:
+        return result_files
+    storage = get_storage()
+    kept, dropped, remaining = [], [], max_errors
+    for result_file, phase in result_files:
+        lf = storage.scan_parquet(bucket, result_file)
+        long = is_long(lf.collect_schema())
+        if long:
+            # every finding has a field_1, so those rows are one per finding
+            lf = lf.filter(pl.col("field_index") == 1)
+        if remaining <= 0:
+            summary.discard_findings(
+                lf.select("validation_id", "validation_type").collect(), phase
+            )
+            dropped.append(result_file)
+            continue
+        count = lf.select(pl.len()).collect().item()
+        if count > remaining:
+            df = read_findings(bucket, result_file)
+            summary.discard_findings(df.slice(remaining), phase)
+            df = df.head(remaining)
+            if long:
+                df = to_long(df)
+            buffer = BytesIO()
+            write_frame(df, buffer)
+            buffer.seek(0)
+            write_parquet(buffer, bucket, result_file)
+        remaining -= count
+        kept.append((result_file, phase))
+    if dropped:
+        log.info("dropping {} result files past max errors".format(len(dropped)))
+        storage.delete_objects(bucket, dropped)
+    return kept
+
+
+def validate_partitions(
+    bucket: str,
+    key: str,
+    lei: str,
+    submission_id: str,
+    validation_result_path: str,
+    workers: int,
+    batch_size: int,
+    max_errors: int,
+    manifest: Dict = None,
+    use_cache: bool = True,
+) -> Tuple[ValidationSummary, List[Tuple[str, str]]]:
+    part_digests = {}
+    if manifest:
+        if use_cache:
+            part_digests = {part["key"]: part["digest"] for part in manifest["parts"]}
+        part_row_counts = sorted(
+            ((part["key"], part["rows"]) for part in manifest["parts"]),
+            key=lambda part: part_sort_key(part[0]),
+        )
+    else:
+        part_row_counts = get_part_row_counts(bucket, key)
+    partitions = plan_partitions(part_row_counts, workers)
+    if not partitions:
+        raise FileNotFoundError(f"no parquet files found in {bucket}/{key}")
+    log.info("validating {} in {} partitions".format(key, len(partitions)))
+    summary = ValidationSummary()
+    result_files = []
+    # polars' thread pool doesn't survive a fork, so workers are spawned by default
+    mp_context = multiprocessing.get_context(
+        os.getenv("VALIDATION_START_METHOD", "spawn")
+    )
+    with ProcessPoolExecutor(
+        max_workers=len(partitions), mp_context=mp_context, initializer=init_worker
+    ) as pool:
+        futures = []
+        for partition, (row_offset, part_keys) in enumerate(partitions, start=1):
+            # a partition whose parts are all unchanged from an earlier upload reuses that upload's findings
+            partition_cache_key = None
+            if all(part_key in part_digests for part_key in part_keys):
+                partition_cache_key = cache_key(
+                    [part_digests[part_key] for part_key in part_keys],
+                    lei=lei,
+                    batch_size=batch_size,
+                    max_errors=max_errors,
+                    findings_format=get_findings_format(),
+                    findings_layout=get_findings_layout(),
+                    scope="partition",
+                )
+            cached = None
+            if partition_cache_key and (
+                cache_entry := get_cached(bucket, partition_cache_key)
+            ):
+                cached = restore_cached(
+                    bucket,
+                    partition_cache_key,
+                    cache_entry,
+                    f"{validation_result_path}p{partition:03}_",
+                    submission_id,
+                    row_offset,
+                )
+            if cached:
+                futures.append((None, cached, partition_cache_key, row_offset))
+                continue
+            future = pool.submit(
+                validate_partition,
+                bucket,
+                part_keys,
+                row_offset,
+                partition,
+                lei,
+                submission_id,
+                validation_result_path,
+                batch_size,
+                max_errors,
+            )
+            futures.append((future, None, partition_cache_key, row_offset))
+        try:
+            for future, cached, partition_cache_key, row_offset in futures:
+                partition_summary, partition_files = cached or future.result()
+                if future and partition_cache_key:
+                    put_cached(
+                        bucket,
+                        partition_cache_key,
+                        partition_summary,
+                        partition_files,
+                        row_offset,
+                    )
+                summary.merge(partition_summary)
+                result_files.extend(partition_files)
+        except Exception as e:
+            for future, _, _, _ in futures:
+                if future:
+                    future.cancel()
+            raise e
+
+    if summary.has_syntax_errors:
+        # logic checks only count when the whole file passes syntax, the same as a single pass where the
+        # validator never gets to them
+        logic_files = [
+            result_file
+            for result_file, phase in result_files
+            if phase == str(ValidationPhase.LOGICAL)
+        ]
+        get_storage().delete_objects(bucket, logic_files)
+        summary.discard_phase(str(ValidationPhase.LOGICAL))
+        result_files = [
+            (result_file, phase)
+            for result_file, phase in result_files
+            if phase != str(ValidationPhase.LOGICAL)
+        ]
+        return summary, cap_findings(bucket, result_files, max_errors, summary)
+
+    with instrumentation.timer("collect_register_findings"):
+        register_results = validate_register(scan_parquets(bucket, key), lei)
+    register_findings = register_results.findings
+    summary.add_register_results(register_results, register_findings)
+    if register_findings.height:
+        # p000 sorts ahead of the partitions, where a single pass puts register findings
+        register_file = f"{validation_result_path}p000_00001.parquet"
+        result_files[:0] = [
+            (part_file, str(register_results.phase))
+            for part_file in write_findings(
+                prepare_findings(
+                    register_findings, register_results.phase, submission_id
+                ),
+                bucket,
+                register_file,
+            )
+        ]
+    return summary, cap_findings(bucket, result_files, max_errors, summary)
+
+
 def combine_results(results: List[ValidationResults]):
     if any(
         [
@@ -185,46 +623,8 @@ def combine_results(results: List[ValidationResults]):
 
 
 def get_db_session():
-    SessionLocal = sessionmaker(bind=get_filing_engine())
+    from sqlalchemy.orm import sessionmaker
+
+    SessionLocal = sessionmaker(bind=get_engine())
     session = SessionLocal()
     return session
-
-
-def get_filing_engine():
-    env = os.getenv("ENV", "S3")
-    if env == "LOCAL":
-        user = os.getenv("DB_USER")
-        passwd = os.getenv("DB_PWD")
-        host = os.getenv("DB_HOST")
-        db = os.getenv("DB_NAME")
-    else:
-        secret = get_secret(os.getenv("DB_SECRET", None))
-        user = secret["username"]
-        passwd = secret["password"]
-        host = secret["host"]
-        db = secret["database"]
-
-    postgres_dsn = PostgresDsn.build(
-        scheme="postgresql+psycopg2",
-        username=user,
-        password=urllib.parse.quote(passwd, safe=""),
-        host=host,
-        path=db,
-    )
-    conn_str = str(postgres_dsn)
-    return create_engine(conn_str)
-
-
-def get_secret(secret_name):
-    region_name = "us-east-1"
-
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
-
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        raise e
-
-    secret = get_secret_value_response["SecretString"]
-    return json.loads(secret)
@@ -0,0 +1,93 @@
+import io
+import logging
+import os
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+log = logging.getLogger()
+
+
+class RangedS3Reader(io.RawIOBase):
+    # Reads an S3 object as a stream by fetching byte ranges concurrently and handing them back in order, so
+    # large uploads aren't limited to the throughput of a single get_object connection.
+    def __init__(
+        self,
+        s3,
+        bucket: str,
+        key: str,
+        part_size: int = None,
+        parallelism: int = None,
+        size: int = None,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size or int(
+            os.getenv("S3_RANGE_PART_SIZE", 8 * 1024 * 1024)
+        )
+        self.parallelism = parallelism or int(os.getenv("S3_RANGE_PARALLELISM", 8))
+        if size is None:
+            size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.size = size
+        self._chunks = None
+        self._buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def _get_range(self, start: int, end: int) -> bytes:
+        response = self.s3.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end}"
+        )
+        return response["Body"].read()
+
+    def iter_ranges(self) -> Iterator[bytes]:
+        # keep at most 2x parallelism parts in memory, the pool stays busy while the consumer works through
+        # the parts that already arrived
+        offsets = iter(range(0, self.size, self.part_size))
+        max_in_flight = self.parallelism * 2
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            in_flight = deque()
+            for start in offsets:
+                end = min(start + self.part_size, self.size) - 1
+                in_flight.append(pool.submit(self._get_range, start, end))
+                if len(in_flight) >= max_in_flight:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        # stitch the ranges back together on row boundaries so every chunk ends on a newline.  A quoted field
+        # containing a newline can still straddle chunks, so chunks should be fed to a streaming parser
+        # rather than parsed independently.
+        carry = b""
+        for data in self.iter_ranges():
+            data = carry + data
+            cut = data.rfind(b"\n") + 1
+            if cut:
+                carry = data[cut:]
+                yield data[:cut]
+            else:
+                carry = data
+        if carry:
+            yield carry
+
+    def readinto(self, b):
+        if self._chunks is None:
+            self._chunks = self.iter_chunks()
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if self._chunks is not None:
+            self._chunks.close()
+        super().close()
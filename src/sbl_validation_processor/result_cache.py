@@ -0,0 +1,226 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import time
+
+from botocore.exceptions import ClientError
+from collections import defaultdict
+from importlib import metadata
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from sbl_validation_processor.storage import get_storage
+
+if TYPE_CHECKING:
+    from sbl_validation_processor.validation_summary import ValidationSummary
+
+log = logging.getLogger()
+
+
+class DigestReader(io.RawIOBase):
+    # passes a stream through unchanged while hashing everything read from it
+    def __init__(self, stream):
+        self._stream = stream
+        self._hash = hashlib.sha256()
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._stream.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self._hash.update(data)
+        self.bytes_read += n
+        return n
+
+    def hexdigest(self) -> str:
+        # reads anything the parser left behind so the digest always covers the whole stream
+        while self.read(1024 * 1024):
+            pass
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._stream.close()
+        super().close()
+
+
+def manifest_key(pqs_path: str) -> str:
+    # the manifest sits next to the parquet parts, e.g. 1_pqs/ -> 1_manifest.json
+    return f"{pqs_path.rstrip('/').removesuffix('_pqs')}_manifest.json"
+
+
+def write_manifest(bucket: str, pqs_path: str, csv_digest: str, parts: List[Dict]):
+    get_storage().write_bytes(
+        bucket,
+        manifest_key(pqs_path),
+        json.dumps({"csv_digest": csv_digest, "parts": parts}).encode("utf-8"),
+    )
+
+
+def load_manifest(bucket: str, pqs_path: str) -> Optional[Dict]:
+    try:
+        return json.loads(get_storage().read_bytes(bucket, manifest_key(pqs_path)))
+    except (ClientError, FileNotFoundError, KeyError):
+        log.info("no manifest for {}".format(pqs_path))
+        return None
+
+
+def get_validator_version() -> Optional[str]:
+    # the validator is installed from git, so the commit it was built from is part of its version
+    if version := os.getenv("VALIDATOR_VERSION"):
+        return version
+    try:
+        distribution = metadata.distribution("regtech-data-validator")
+    except metadata.PackageNotFoundError:
+        return None
+    version = distribution.version
+    if direct_url := distribution.read_text("direct_url.json"):
+        commit_id = json.loads(direct_url).get("vcs_info", {}).get("commit_id")
+        if commit_id:
+            version = f"{version}+{commit_id}"
+    return version
+
+
+def cache_key(digests: List[str], **settings) -> Optional[str]:
+    # results can only be reused for the same content, validator and validation settings.  Without a known
+    # validator version there's nothing safe to key on, so nothing is cached
+    version = get_validator_version()
+    if version is None:
+        return None
+    key_data = {"digests": digests, "validator_version": version, **settings}
+    return hashlib.sha256(
+        json.dumps(key_data, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _cache_root() -> str:
+    return os.getenv("RESULT_CACHE_PREFIX", "validation_cache").rstrip("/")
+
+
+def _entry_prefix(key: str) -> str:
+    return f"{_cache_root()}/{key}/"
+
+
+def get_cached(bucket: str, key: str) -> Optional[Dict]:
+    # entry.json is written last, so a half written entry is a miss
+    try:
+        entry = json.loads(
+            get_storage().read_bytes(bucket, f"{_entry_prefix(key)}entry.json")
+        )
+    except (ClientError, FileNotFoundError, KeyError):
+        return None
+    log.info("result cache hit {}".format(key))
+    return entry
+
+
+def restore_cached(
+    bucket: str,
+    key: str,
+    entry: Dict,
+    result_prefix: str,
+    submission_id: str,
+    row_offset: int = 0,
+) -> Optional[Tuple["ValidationSummary", List[Tuple[str, str]]]]:
+    # copies the cached findings into this submission's results, with its submission id and row numbers.
+    # An entry evicted after get_cached found it is a miss: whatever was already copied is deleted and None
+    # returned, so the caller validates instead.  polars and the validator are imported here rather than at
+    # the top, the csv splitter only needs the manifest functions
+    import polars as pl
+
+    from sbl_validation_processor.findings_format import partition_folder
+    from sbl_validation_processor.parquet_profile import write_frame
+    from sbl_validation_processor.validation_summary import ValidationSummary
+
+    storage = get_storage()
+    row_shift = row_offset - entry["row_offset"]
+    # result_prefix is the _res/ folder, plus a partition's p###_ name prefix.  A validation_id= folder
+    # goes between the two, where write_findings puts it
+    res_dir, _, name_prefix = result_prefix.rpartition("/")
+    result_files = []
+    for pq_idx, (file_name, phase) in enumerate(entry["files"], start=1):
+        try:
+            data = storage.read_bytes(bucket, f"{_entry_prefix(key)}{file_name}")
+        except (ClientError, FileNotFoundError, KeyError):
+            log.info("result cache entry {} was evicted while restoring it".format(key))
+            storage.delete_objects(
+                bucket, [result_file for result_file, _ in result_files]
+            )
+            return None
+        df = pl.read_parquet(io.BytesIO(data))
+        df = df.with_columns(submission_id=pl.lit(submission_id))
+        if row_shift:
+            df = df.with_columns((pl.col("row") + row_shift).cast(pl.UInt32))
+        buffer = io.BytesIO()
+        write_frame(df, buffer)
+        buffer.seek(0)
+        result_file = (
+            f"{res_dir}/{partition_folder(file_name)}{name_prefix}{pq_idx:05}.parquet"
+        )
+        storage.write_bytes(bucket, result_file, buffer)
+        result_files.append((result_file, phase))
+    # rewriting entry.json marks the entry as used, evict goes by when entries were last written
+    storage.write_bytes(
+        bucket, f"{_entry_prefix(key)}entry.json", json.dumps(entry).encode("utf-8")
+    )
+    return ValidationSummary.from_dict(entry["summary"]), result_files
+
+
+def put_cached(
+    bucket: str,
+    key: str,
+    summary: "ValidationSummary",
+    result_files: List[Tuple[str, str]],
+    row_offset: int = 0,
+):
+    from sbl_validation_processor.findings_format import partition_folder
+
+    storage = get_storage()
+    entry_prefix = _entry_prefix(key)
+    files = []
+    for pq_idx, (result_file, phase) in enumerate(result_files, start=1):
+        file_name = f"{partition_folder(result_file)}{pq_idx:05}.parquet"
+        storage.write_bytes(
+            bucket,
+            f"{entry_prefix}{file_name}",
+            storage.read_bytes(bucket, result_file),
+        )
+        files.append((file_name, phase))
+    entry = {"summary": summary.to_dict(), "files": files, "row_offset": row_offset}
+    storage.write_bytes(
+        bucket, f"{entry_prefix}entry.json", json.dumps(entry).encode("utf-8")
+    )
+    # evicting lists the whole cache, so only a sampled fraction of stores do it.  The cache can run over
+    # its limits by the entries stored in between, about 1 / RESULT_CACHE_EVICT_RATE of them
+    if random.random() < float(os.getenv("RESULT_CACHE_EVICT_RATE", 0.05)):
+        evict(bucket)
+
+
+def evict(bucket: str):
+    # drops entries not used for RESULT_CACHE_MAX_AGE_SECONDS, then the least recently used entries until the
+    # cache is under RESULT_CACHE_MAX_BYTES.  An entry's last use is when it was stored or last restored
+    max_age = int(os.getenv("RESULT_CACHE_MAX_AGE_SECONDS", 7 * 24 * 60 * 60))
+    max_bytes = int(os.getenv("RESULT_CACHE_MAX_BYTES", 10 * 1024 * 1024 * 1024))
+    storage = get_storage()
+    root = f"{_cache_root()}/"
+    now = time.time()
+    entries = defaultdict(list)
+    for obj in storage.list_prefix(bucket, root):
+        entries[obj.key[len(root) :].split("/")[0]].append(obj)
+    by_age = sorted(
+        entries.values(),
+        key=lambda objs: max(obj.last_modified or now for obj in objs),
+    )
+    total_bytes = sum(obj.size for objs in by_age for obj in objs)
+    evicted = []
+    for objs in by_age:
+        written = max(obj.last_modified or now for obj in objs)
+        if now - written > max_age or total_bytes > max_bytes:
+            evicted.extend(obj.key for obj in objs)
+            total_bytes -= sum(obj.size for obj in objs)
+    if evicted:
+        log.info("evicting {} objects from the result cache".format(len(evicted)))
+        storage.delete_objects(bucket, evicted)
@@ -2,17 +2,9 @@ import os
 import re
 import json
 import logging
-from typing import Dict, List
-import urllib.parse
+from typing import Dict, List, Optional
 import polars as pl
-import boto3
-import boto3.session
 import gc
-from botocore.exceptions import ClientError
-
-from io import BytesIO
-from pydantic import PostgresDsn
-from sqlalchemy import create_engine
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from sbl_filing_api.entities.models.dao import SubmissionDAO, SubmissionState, FilingDAO
 
@@ -24,181 +16,479 @@ from regtech_data_validator.data_formatters import (
 )
 from regtech_data_validator.checks import Severity
 
+from sbl_validation_processor import instrumentation
+from sbl_validation_processor.database import get_engine
+from sbl_validation_processor.findings_format import (
+    get_partitioned_parts,
+    is_long,
+    scan_long_findings,
+    wide_field_count,
+    widen,
+)
+from sbl_validation_processor.storage import (
+    StorageObject,
+    get_storage,
+    part_sort_key,
+)
+from sbl_validation_processor.validation_summary import (
+    get_findings_counts,
+    load_results,
+    load_summary,
+)
+
 logging.basicConfig()
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
 
-def get_parquet_paths(bucket: str, key: str):
-    env = os.getenv("ENV", "S3")
-    if env == "LOCAL":
-        dir_path = os.path.join(bucket, key)
-        if not os.path.isdir(dir_path):
-            return [], {}
-        return [
-            os.path.join(dir_path, file)
-            for file in os.listdir(dir_path)
-            if file.endswith(".parquet")
-        ], {}
-    else:
-        aws_session = boto3.session.Session()
-        creds = aws_session.get_credentials()
-        storage_options = {
-            "aws_access_key_id": creds.access_key,
-            "aws_secret_access_key": creds.secret_key,
-            "session_token": creds.token,
-            "aws_region": "us-east-1",
-        }
-
-        s3 = boto3.client("s3")
-        s3_objs = s3.list_objects_v2(Bucket=bucket, Prefix=key)
-        return [
-            f"s3://{bucket}/{obj['Key']}"
-            for obj in s3_objs.get("Contents", [])
-            if obj["Key"].endswith(".parquet")
-        ], storage_options
-
-
-def write_report(report_data: BytesIO, bucket: str, report_file: str):
-    env = os.getenv("ENV", "S3")
-    if env == "LOCAL":
-        file_path = os.path.join(bucket, report_file)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, "wb") as f:
-            f.write(report_data)
-    else:
-        s3 = boto3.client("s3")
-        s3.put_object(Body=report_data, Bucket=bucket, Key=report_file)
-        log.info("completed report upload")
-
-
-def aggregate_validation_results(bucket, key, results):
-    file_paths = [path for path in key.split("/") if path]
-    file_name = file_paths[-1]
-    period = file_paths[-3]
-    lei = file_paths[-2]
-    sub_id_regex = r"\d+"
-    sub_match = re.match(sub_id_regex, file_name)
-    sub_counter = int(sub_match.group())
-
-    if root := os.getenv("S3_ROOT"):
-        validation_report_path = (
-            f"{root}/{'/'.join(file_paths[1:-1])}/{sub_counter}_report.csv"
-        )
-    else:
-        validation_report_path = f"{'/'.join(file_paths[:-1])}/{sub_counter}_report.csv"
-
-    with get_db_session() as db_session:
-        query = db_session.query(SubmissionDAO).where(
-            SubmissionDAO.filing == FilingDAO.id,
-            FilingDAO.lei == lei,
-            FilingDAO.filing_period == period,
-            SubmissionDAO.counter == sub_counter,
+def get_parquet_paths(bucket: str, key: str) -> List[StorageObject]:
+    return sorted(
+        [
+            obj
+            for obj in get_storage().list_prefix(bucket, key)
+            if obj.key.endswith(".parquet")
+        ],
+        key=lambda obj: part_sort_key(obj.key),
+    )
+
+
+def scan_parts(
+    bucket: str,
+    parts: List[StorageObject],
+    long_parts: bool,
+    field_count: Optional[int] = None,
+) -> pl.LazyFrame:
+    storage = get_storage()
+    if long_parts:
+        return widen(
+            pl.concat([storage.scan_parquet(bucket, p.key) for p in parts]),
+            field_count,
         )
-        submission = query.one()
-
-        max_errors = int(os.getenv("MAX_ERRORS", 10000000))
-        max_group_size = int(os.getenv("MAX_GROUP_SIZE", 200))
-
-        if submission and submission.state not in [
-            SubmissionState.SUBMISSION_ACCEPTED,
-            SubmissionState.VALIDATION_EXPIRED,
-            SubmissionState.SUBMISSION_UPLOAD_MALFORMED,
-        ]:
-            submission.total_records = results["total_records"]
-            file_paths, storage_options = get_parquet_paths(bucket, key)
-
-            # scan each result parquet into a lazyframe then diagonally concat so all columns are merged into the final lf.  Otherwise
-            # this will error if trying to scan a parquet directory and the parquets don't contain the same columns (particularly the
-            # field/value columns)
-            lazyframes = [
-                pl.scan_parquet(
-                    file, allow_missing_columns=True, storage_options=storage_options
-                )
-                for file in file_paths
-            ]
-            lf = pl.LazyFrame()
-            if lazyframes:
-                lf = pl.concat(lazyframes, how="diagonal")
-            # get the real total count of errors and warnings before truncating based on max error length
-            error_counts, warning_counts = get_error_and_warning_totals(results)
-            # slice is start indice inclusive, so 0 to max_errors will return 1000000 errors (0-999999) if the
-            # max_errors is 1000000 and there are more than that.  Adding +1 actually returns
-            # max_errors + 1 which would be one more than the max_errors intended
+    # scan each result parquet into a lazyframe then diagonally concat so all columns are merged into the final lf.  Otherwise
+    # this will error if trying to scan a parquet directory and the parquets don't contain the same columns (particularly the
+    # field/value columns)
+    return pl.concat(
+        [
+            storage.scan_parquet(bucket, part.key, allow_missing_columns=True)
+            for part in parts
+        ],
+        how="diagonal",
+    )
 
-            max_err_lf = lf.slice(0, max_errors)
-            final_df = max_err_lf.collect()
 
-            # build report csv and push to S3
+class PartitionedFindings:
+    # findings the validator wrote in the partitioned layout, read a few validation_ids at a time from just
+    # their own parts instead of filtering every part.  Each validation's parts only have as many field
+    # columns as it checks, so every scan is brought to the schema of all the findings, in its column order,
+    # otherwise report batches written under the first batch's header would land in the wrong columns
+    def __init__(
+        self,
+        bucket: str,
+        parts_by_id: Dict[str, List[StorageObject]],
+        long_parts: bool,
+        schema: pl.Schema,
+    ):
+        self.bucket = bucket
+        self.parts_by_id = parts_by_id
+        self.long_parts = long_parts
+        self.schema = schema
+
+    @property
+    def validation_ids(self) -> List[str]:
+        return sorted(self.parts_by_id)
+
+    def scan(self, validation_ids: List[str]) -> pl.LazyFrame:
+        parts = [
+            part
+            for validation_id in validation_ids
+            for part in self.parts_by_id.get(validation_id, [])
+        ]
+        lf = scan_parts(
+            self.bucket, parts, self.long_parts, wide_field_count(self.schema)
+        )
+        columns = lf.collect_schema()
+        return lf.select(
+            (
+                pl.col(name).cast(dtype)
+                if name in columns
+                else pl.lit(None, dtype).alias(name)
+            )
+            for name, dtype in self.schema.items()
+        )
 
-            force_gc = bool(json.loads(os.getenv("FORCE_GC", "false").lower()))
 
-            if force_gc:
-                print(f"test gc collect: {gc.collect()}")
+def write_report(report_data: bytes, bucket: str, report_file: str):
+    get_storage().write_bytes(bucket, report_file, report_data)
+    log.info("completed report upload")
+
+
+def get_record_results(record: Dict) -> Dict:
+    # the pieces of a validator event record aggregate_validation_results needs: the results inline (events
+    # from before the claim check) or the reference to load them from
+    return {
+        "results": record.get("results"),
+        "results_ref": record.get("results_ref"),
+    }
+
+
+def aggregate_validation_results(
+    bucket, key, results: Dict = None, results_ref: Dict = None
+):
+    if results is None and results_ref is None:
+        raise ValueError("either results or results_ref is needed for {}".format(key))
+    with instrumentation.stage("aggregate") as metrics:
+        file_paths = [path for path in key.split("/") if path]
+        file_name = file_paths[-1]
+        period = file_paths[-3]
+        lei = file_paths[-2]
+        sub_id_regex = r"\d+"
+        sub_match = re.match(sub_id_regex, file_name)
+        sub_counter = int(sub_match.group())
+
+        if root := os.getenv("S3_ROOT"):
+            validation_report_path = (
+                f"{root}/{'/'.join(file_paths[1:-1])}/{sub_counter}_report.csv"
+            )
+        else:
+            validation_report_path = (
+                f"{'/'.join(file_paths[:-1])}/{sub_counter}_report.csv"
+            )
 
-            csv_content = df_to_download(
-                final_df, warning_counts, error_counts, max_errors
+        with get_db_session() as db_session:
+            query = db_session.query(SubmissionDAO).where(
+                SubmissionDAO.filing == FilingDAO.id,
+                FilingDAO.lei == lei,
+                FilingDAO.filing_period == period,
+                SubmissionDAO.counter == sub_counter,
             )
-            write_report(csv_content, bucket, validation_report_path)
+            submission = query.one()
+
+            max_errors = int(os.getenv("MAX_ERRORS", 10000000))
+            max_group_size = int(os.getenv("MAX_GROUP_SIZE", 200))
+
+            if submission and submission.state not in [
+                SubmissionState.SUBMISSION_ACCEPTED,
+                SubmissionState.VALIDATION_EXPIRED,
+                SubmissionState.SUBMISSION_UPLOAD_MALFORMED,
+            ]:
+                if results is None:
+                    # only loaded for submissions that are still being aggregated
+                    with metrics.timer("load_results"):
+                        results = load_results(bucket, results_ref)
+                submission.total_records = results["total_records"]
+                metrics.add("rows", results["total_records"])
+                storage = get_storage()
+                parquet_parts = get_parquet_paths(bucket, key)
+                metrics.add("bytes_read", sum(part.size for part in parquet_parts))
+                log.info(
+                    "aggregating {} result parts, {} bytes".format(
+                        len(parquet_parts), sum(part.size for part in parquet_parts)
+                    )
+                )
+
+                summary = load_summary(bucket, key)
+                lf = pl.LazyFrame()
+                long_parts = bool(parquet_parts) and is_long(
+                    storage.scan_parquet(bucket, parquet_parts[0].key).collect_schema()
+                )
+                if long_parts:
+                    # long parts all have the same schema, so _res/ is a single scan.  The summary has how many
+                    # field columns the findings had, so widening them doesn't need a scan of its own
+                    lf = scan_long_findings(
+                        bucket, key, summary.get("field_count") if summary else None
+                    )
+                elif parquet_parts:
+                    lf = scan_parts(bucket, parquet_parts, long_parts)
+                # with the partitioned layout each validation_id's findings can be read from its own parts
+                partitions = None
+                if parts_by_id := get_partitioned_parts(parquet_parts):
+                    partitions = PartitionedFindings(
+                        bucket, parts_by_id, long_parts, lf.collect_schema()
+                    )
+                # get the real total count of errors and warnings before truncating based on max error length
+                error_counts, warning_counts = get_error_and_warning_totals(results)
+                # slice is start indice inclusive, so 0 to max_errors will return 1000000 errors (0-999999) if the
+                # max_errors is 1000000 and there are more than that.  Adding +1 actually returns
+                # max_errors + 1 which would be one more than the max_errors intended
 
-            if force_gc:
-                del csv_content
-                print(f"test gc collect 2: {gc.collect()}")
+                max_err_lf = lf.slice(0, max_errors)
 
-            validation_group_results = []
+                # build report csv and push to S3
 
-            # truncate the final_df again for the json validation results we send to the frontend
-            if not final_df.is_empty():
-                use_max_err_lf = bool(
-                    json.loads(os.getenv("USE_MAX_ERR_LF", "false").lower())
+                force_gc = bool(json.loads(os.getenv("FORCE_GC", "false").lower()))
+                stream_report = bool(
+                    json.loads(os.getenv("STREAM_REPORT", "true").lower())
                 )
 
-                lf_to_use = max_err_lf if use_max_err_lf else lf
+                if force_gc:
+                    print(f"test gc collect: {gc.collect()}")
+
+                group_heads = None
+                if stream_report:
+                    # the validator's summary already has the findings per validation_id, as long as none of them
+                    # are cut off by max_errors it saves a full scan of the findings
+                    group_counts = None
+                    if summary:
+                        group_counts = get_findings_counts(summary)
+                        if group_counts["len"].sum() > max_errors:
+                            group_counts = None
+                    # the report batches also keep the head of each validation_id for the json results
+                    group_heads = GroupHeads(max_group_size)
+                    with metrics.timer("report"):
+                        report_rows = write_report_stream(
+                            max_err_lf if parquet_parts else None,
+                            bucket,
+                            validation_report_path,
+                            warning_counts,
+                            error_counts,
+                            max_errors,
+                            group_counts,
+                            # partitions can only stand in for the findings when none are cut off
+                            partitions if group_counts is not None else None,
+                            group_heads,
+                        )
+                    has_findings = report_rows > 0
+                else:
+                    with metrics.timer("collect_findings"):
+                        final_df = max_err_lf.collect()
+                    has_findings = not final_df.is_empty()
+                    with metrics.timer("report"):
+                        csv_content = df_to_download(
+                            final_df, warning_counts, error_counts, max_errors
+                        )
+                        write_report(csv_content, bucket, validation_report_path)
+                    metrics.add("bytes_written", len(csv_content))
+
+                    if force_gc:
+                        del csv_content
+                        print(f"test gc collect 2: {gc.collect()}")
 
-                use_lf_group_by = bool(
-                    json.loads(os.getenv("USE_LF_GROUP_BY", "false").lower())
-                )
+                validation_group_results = []
 
-                if use_lf_group_by:
-                    df = (
-                        lf_to_use.group_by(pl.col("validation_id"))
-                        .head(max_group_size)
-                        .collect()
+                # truncate the findings again for the json validation results we send to the frontend
+                if has_findings:
+                    use_max_err_lf = bool(
+                        json.loads(os.getenv("USE_MAX_ERR_LF", "false").lower())
                     )
-                    validation_group_results = df_to_dicts(df)
-                else:
-                    validation_groups = (
-                        lf_to_use.select("validation_id")
-                        .unique()
-                        .sort(pl.col("validation_id"))
-                        .collect()
+
+                    lf_to_use = max_err_lf if use_max_err_lf else lf
+
+                    use_lf_group_by = bool(
+                        json.loads(os.getenv("USE_LF_GROUP_BY", "false").lower())
                     )
 
-                    for validation_id in validation_groups["validation_id"]:
+                    use_group_loop = bool(
+                        json.loads(os.getenv("USE_GROUP_LOOP", "false").lower())
+                    )
 
-                        validation_group_result = (
-                            lf_to_use.filter(pl.col("validation_id") == validation_id)
-                            .head(max_group_size)
-                            .collect()
-                        )
+                    with metrics.timer("collect_groups"):
+                        if use_lf_group_by:
+                            df = (
+                                lf_to_use.group_by(pl.col("validation_id"))
+                                .head(max_group_size)
+                                .collect()
+                            )
+                            validation_group_results = df_to_dicts(df)
+                        elif use_group_loop:
+                            validation_group_results = build_group_results_by_loop(
+                                lf_to_use, max_group_size
+                            )
+                        elif group_heads is not None and (
+                            use_max_err_lf or report_rows < max_errors
+                        ):
+                            # the report had every finding (or all of max_err_lf), so its heads are the groups
+                            validation_group_results = group_heads.results()
+                        else:
+                            validation_group_results = build_group_results(
+                                lf_to_use,
+                                max_group_size,
+                                None if use_max_err_lf else partitions,
+                            )
+
+                if error_counts + warning_counts == 0:
+                    final_state = SubmissionState.VALIDATION_SUCCESSFUL
+                else:
+                    final_state = (
+                        SubmissionState.VALIDATION_WITH_ERRORS
+                        if error_counts != 0
+                        else SubmissionState.VALIDATION_WITH_WARNINGS
+                    )
 
-                        validation_group_results.extend(
-                            grouped_df_to_dicts(validation_group_result)
-                        )
+                build_final_json(validation_group_results, results)
+                submission.state = final_state
+                submission.validation_results = results
+                db_session.commit()
+
+
+def plan_report_batches(group_counts: pl.DataFrame, batch_size: int):
+    # packs consecutive (sorted) validation_ids into batches of at most batch_size findings, and splits any
+    # validation_id bigger than that into slices of its own, so each batch is a single bounded collect
+    batch_ids = []
+    batch_rows = 0
+    for validation_id, count in group_counts.iter_rows():
+        if count > batch_size:
+            if batch_ids:
+                yield batch_ids, None
+                batch_ids, batch_rows = [], 0
+            for offset in range(0, count, batch_size):
+                yield [validation_id], (offset, batch_size)
+            continue
+        if batch_rows + count > batch_size:
+            yield batch_ids, None
+            batch_ids, batch_rows = [], 0
+        batch_ids.append(validation_id)
+        batch_rows += count
+    if batch_ids:
+        yield batch_ids, None
+
+
+class GroupHeads:
+    # the first max_group_size findings of each validation_id, kept from the report batches as they're written,
+    # so the json results don't need a scan of their own.  Batches come in validation_id order and each is in
+    # file order, so these are the rows build_group_results would pick
+    def __init__(self, max_group_size: int):
+        self.max_group_size = max_group_size
+        self.frames = []
+
+    def add(self, batch_df: pl.DataFrame, offset: int = 0):
+        # offset is where a slice of a split validation_id starts, only its first max_group_size rows are kept
+        keep = self.max_group_size - offset
+        if keep > 0:
+            self.frames.append(
+                batch_df.filter(
+                    pl.col("validation_id").is_not_null()
+                    & (pl.int_range(pl.len()).over("validation_id") < keep)
+                )
+            )
 
-            if error_counts + warning_counts == 0:
-                final_state = SubmissionState.VALIDATION_SUCCESSFUL
+    def results(self) -> list[dict]:
+        if not self.frames:
+            return []
+        df = pl.concat(self.frames, how="diagonal").sort(
+            "validation_id", maintain_order=True
+        )
+        validation_group_results = []
+        for validation_group_result in df.partition_by(
+            "validation_id", maintain_order=True
+        ):
+            validation_group_results.extend(
+                grouped_df_to_dicts(validation_group_result)
+            )
+        return validation_group_results
+
+
+def write_report_stream(
+    lf: pl.LazyFrame,
+    bucket: str,
+    report_file: str,
+    warning_counts: int,
+    error_counts: int,
+    max_errors: int,
+    group_counts: pl.DataFrame = None,
+    partitions: PartitionedFindings = None,
+    group_heads: GroupHeads = None,
+) -> int:
+    # writes the report a batch of validation_ids at a time through a multipart upload, so peak memory is one
+    # batch of findings and its csv rather than every finding and the whole report.  Only the first batch
+    # carries the csv header (and the truncation notice), later batches drop their header line.  Each batch
+    # is also handed to group_heads, when given
+    batch_size = int(os.getenv("REPORT_BATCH_SIZE", 200000))
+    findings_count = 0
+    with get_storage().open_multipart_writer(bucket, report_file) as writer:
+        if lf is None:
+            group_counts = pl.DataFrame()
+        elif group_counts is None:
+            group_counts = (
+                lf.group_by("validation_id")
+                .len()
+                .filter(pl.col("validation_id").is_not_null())
+                .sort("validation_id")
+                .collect()
+            )
+        if group_counts.is_empty():
+            empty_df = lf.head(0).collect() if lf is not None else pl.DataFrame()
+            writer.write(
+                df_to_download(empty_df, warning_counts, error_counts, max_errors)
+            )
+            return findings_count
+
+        for validation_ids, batch_slice in plan_report_batches(
+            group_counts, batch_size
+        ):
+            if partitions:
+                batch_lf = partitions.scan(validation_ids)
             else:
-                final_state = (
-                    SubmissionState.VALIDATION_WITH_ERRORS
-                    if error_counts != 0
-                    else SubmissionState.VALIDATION_WITH_WARNINGS
+                batch_lf = lf.filter(pl.col("validation_id").is_in(validation_ids))
+            if batch_slice:
+                batch_lf = batch_lf.slice(*batch_slice)
+            with instrumentation.timer("collect_report_batch"):
+                batch_df = batch_lf.collect()
+            if group_heads is not None:
+                group_heads.add(batch_df, batch_slice[0] if batch_slice else 0)
+            if findings_count == 0:
+                csv_content = df_to_download(
+                    batch_df, warning_counts, error_counts, max_errors
                 )
+            else:
+                csv_content = df_to_download(batch_df, 0, 0, max_errors)
+                csv_content = csv_content.split(b"\n", 1)[1]
+            findings_count += batch_df.height
+            writer.write(csv_content)
+            instrumentation.add("bytes_written", len(csv_content))
+    log.info("completed report upload, {} findings".format(findings_count))
+    return findings_count
+
+
+def build_group_results(
+    lf: pl.LazyFrame, max_group_size: int, partitions: PartitionedFindings = None
+) -> list[dict]:
+    # one scan of the findings: number the rows of each validation_id in file order, keep the first
+    # max_group_size of each, and sort the groups by validation_id.  The stable sort keeps file order
+    # within a group, so every group matches what filter(validation_id).head(max_group_size) returns.
+    # Partitioned findings take the head of each validation_id's own parts, which only reads as many row
+    # groups as that needs
+    if partitions:
+        df = pl.concat(
+            [
+                partitions.scan([validation_id]).head(max_group_size)
+                for validation_id in partitions.validation_ids
+            ],
+            how="diagonal",
+        ).collect()
+    else:
+        df = (
+            lf.filter(
+                pl.col("validation_id").is_not_null()
+                & (pl.int_range(pl.len()).over("validation_id") < max_group_size)
+            )
+            .sort("validation_id", maintain_order=True)
+            .collect()
+        )
+    validation_group_results = []
+    for validation_group_result in df.partition_by(
+        "validation_id", maintain_order=True
+    ):
+        validation_group_results.extend(grouped_df_to_dicts(validation_group_result))
+    return validation_group_results
+
+
+def build_group_results_by_loop(lf: pl.LazyFrame, max_group_size: int) -> list[dict]:
+    # one query per validation_id, each scanning all of the findings
+    validation_group_results = []
+    validation_groups = (
+        lf.select("validation_id").unique().sort(pl.col("validation_id")).collect()
+    )
+
+    for validation_id in validation_groups["validation_id"]:
+
+        validation_group_result = (
+            lf.filter(pl.col("validation_id") == validation_id)
+            .head(max_group_size)
+            .collect()
+        )
 
-            build_final_json(validation_group_results, results)
-            submission.state = final_state
-            submission.validation_results = results
-            db_session.commit()
+        validation_group_results.extend(grouped_df_to_dicts(validation_group_result))
+    return validation_group_results
 
 
 def grouped_df_to_dicts(
@@ -277,44 +567,5 @@ def build_validation_results(final_df: pl.DataFrame, results: dict):
 
 
 def get_db_session() -> Session:
-    env = os.getenv("ENV", "S3")
-    if env == "LOCAL":
-        user = os.getenv("DB_USER")
-        passwd = os.getenv("DB_PWD")
-        host = os.getenv("DB_HOST")
-        db = os.getenv("DB_NAME")
-    else:
-        secret = get_secret(os.getenv("DB_SECRET", None))
-        user = secret["username"]
-        passwd = secret["password"]
-        host = secret["host"]
-        db = secret["database"]
-
-    postgres_dsn = PostgresDsn.build(
-        scheme="postgresql+psycopg2",
-        username=user,
-        password=urllib.parse.quote(passwd, safe=""),
-        host=host,
-        path=db,
-    )
-    engine = create_engine(
-        postgres_dsn.unicode_string(),
-        echo=True,
-    )
-    SessionLocal = scoped_session(sessionmaker(engine, expire_on_commit=False))
+    SessionLocal = scoped_session(sessionmaker(get_engine(), expire_on_commit=False))
     return SessionLocal()
-
-
-def get_secret(secret_name):
-    region_name = "us-east-1"
-
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
-
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        raise e
-
-    secret = get_secret_value_response["SecretString"]
-    return json.loads(secret)
@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from functools import partial
+from typing import Callable, Dict, List
+
+from sbl_validation_processor.worker_pool import WorkerPool, get_worker_mode
+
+logger = logging.getLogger()
+
+# receive, delete and change visibility all take at most 10 messages per call
+SQS_BATCH_SIZE = 10
+
+
+class SQSConsumer:
+    # Shared receive loop for the listeners.  Each poll takes up to 10 messages (bounded by free worker
+    # slots, of which job mode has a full receive's worth by default), runs handler on the parsed body of each on a WorkerPool, keeps long running messages hidden by
+    # extending their visibility, and deletes handled messages in batches.  A message whose handler raises is
+    # left on the queue, so it's retried once its visibility times out.
+    def __init__(
+        self,
+        sqs,
+        queue_url: str,
+        handler: Callable[[Dict], None],
+        pool: WorkerPool = None,
+    ):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.handler = handler
+        if pool is None and get_worker_mode() == "job":
+            # a job mode handler only launches a kubernetes job, so an idle listener takes a full receive
+            pool = WorkerPool(int(os.getenv("WORKER_CONCURRENCY", SQS_BATCH_SIZE)))
+        self.pool = pool or WorkerPool()
+        self.visibility_timeout = int(os.getenv("SQS_VISIBILITY_TIMEOUT", 1200))
+        self.wait_time = int(os.getenv("SQS_WAIT_TIME_SECONDS", 20))
+        self.heartbeat_interval = float(
+            os.getenv("SQS_HEARTBEAT_SECONDS", self.visibility_timeout / 3)
+        )
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._to_delete = []
+        self._stopped = threading.Event()
+
+    def _reserve_slots(self) -> int:
+        # waits for one free slot, then takes any others that are free without waiting
+        self.pool.reserve()
+        slots = 1
+        while slots < SQS_BATCH_SIZE and self.pool.reserve(timeout=0):
+            slots += 1
+        return slots
+
+    def _handle(self, message: Dict):
+        self.handler(json.loads(message["Body"]))
+
+    def _acknowledge(self, message: Dict):
+        with self._lock:
+            self._to_delete.append(message["ReceiptHandle"])
+
+    def _done(self, message: Dict):
+        with self._lock:
+            self._in_flight.pop(message["MessageId"], None)
+
+    def _batches(self, items: List) -> List[List]:
+        return [
+            items[i : i + SQS_BATCH_SIZE] for i in range(0, len(items), SQS_BATCH_SIZE)
+        ]
+
+    def flush_deletes(self):
+        with self._lock:
+            receipts, self._to_delete = self._to_delete, []
+        for batch in self._batches(receipts):
+            response = self.sqs.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": receipt}
+                    for i, receipt in enumerate(batch)
+                ],
+            )
+            for failed in response.get("Failed", []):
+                logger.error("Failed to delete SQS message: {}".format(failed))
+
+    def extend_visibility(self):
+        with self._lock:
+            receipts = list(self._in_flight.values())
+        for batch in self._batches(receipts):
+            self.sqs.change_message_visibility_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {
+                        "Id": str(i),
+                        "ReceiptHandle": receipt,
+                        "VisibilityTimeout": self.visibility_timeout,
+                    }
+                    for i, receipt in enumerate(batch)
+                ],
+            )
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            try:
+                self.extend_visibility()
+                self.flush_deletes()
+            except Exception:
+                logger.exception("Error extending SQS message visibility")
+
+    def dispatch(self, message: Dict):
+        with self._lock:
+            self._in_flight[message["MessageId"]] = message["ReceiptHandle"]
+        self.pool.run(
+            self._handle,
+            message,
+            on_success=partial(self._acknowledge, message),
+            on_done=partial(self._done, message),
+        )
+
+    def run(self, max_polls: int = None):
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        polls = 0
+        try:
+            while not self._stopped.is_set() and (
+                max_polls is None or polls < max_polls
+            ):
+                slots = self._reserve_slots()
+                try:
+                    response = self.sqs.receive_message(
+                        QueueUrl=self.queue_url,
+                        MessageSystemAttributeNames=["All"],
+                        MessageAttributeNames=[".*"],
+                        MaxNumberOfMessages=slots,
+                        VisibilityTimeout=self.visibility_timeout,
+                        WaitTimeSeconds=self.wait_time,
+                    )
+                    messages = response.get("Messages", [])
+                    logger.info(f"Received {len(messages)} SQS messages")
+                    for message in messages:
+                        slots -= 1
+                        self.dispatch(message)
+                finally:
+                    for _ in range(slots):
+                        self.pool.release()
+                self.flush_deletes()
+                polls += 1
+        finally:
+            self.pool.shutdown()
+            self._stopped.set()
+            heartbeat.join()
+            self.flush_deletes()
+
+    def stop(self):
+        self._stopped.set()
+
+
+class InMemorySQS:
+    # Enough of the boto3 SQS client for SQSConsumer, with the same visibility semantics: a received message
+    # is hidden until its visibility timeout runs out, and only its latest receipt handle can delete it.
+    def __init__(self):
+        self.messages = {}
+        self._condition = threading.Condition()
+
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs) -> Dict:
+        message_id = str(uuid.uuid4())
+        with self._condition:
+            self.messages[message_id] = {
+                "Body": MessageBody,
+                "ReceiptHandle": None,
+                "VisibleAt": 0.0,
+                "ReceiveCount": 0,
+            }
+            self._condition.notify_all()
+        return {"MessageId": message_id}
+
+    def _visible(self, now: float) -> List[str]:
+        return [
+            message_id
+            for message_id, message in self.messages.items()
+            if message["VisibleAt"] <= now
+        ]
+
+    def receive_message(
+        self,
+        QueueUrl: str,
+        MaxNumberOfMessages: int = 1,
+        VisibilityTimeout: int = 30,
+        WaitTimeSeconds: int = 0,
+        **kwargs,
+    ) -> Dict:
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self._condition:
+            while not self._visible(time.monotonic()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return {}
+                self._condition.wait(min(remaining, 0.1))
+            now = time.monotonic()
+            received = []
+            for message_id in self._visible(now)[:MaxNumberOfMessages]:
+                message = self.messages[message_id]
+                message["ReceiptHandle"] = str(uuid.uuid4())
+                message["VisibleAt"] = now + VisibilityTimeout
+                message["ReceiveCount"] += 1
+                received.append(
+                    {
+                        "MessageId": message_id,
+                        "ReceiptHandle": message["ReceiptHandle"],
+                        "Body": message["Body"],
+                    }
+                )
+            return {"Messages": received}
+
+    def _find(self, receipt: str) -> str:
+        for message_id, message in self.messages.items():
+            if message["ReceiptHandle"] == receipt:
+                return message_id
+        return None
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str):
+        with self._condition:
+            self.messages.pop(self._find(ReceiptHandle), None)
+
+    def delete_message_batch(self, QueueUrl: str, Entries: List[Dict]) -> Dict:
+        successful, failed = [], []
+        with self._condition:
+            for entry in Entries:
+                message_id = self._find(entry["ReceiptHandle"])
+                if message_id is None:
+                    failed.append({"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid"})
+                else:
+                    del self.messages[message_id]
+                    successful.append({"Id": entry["Id"]})
+        return {"Successful": successful, "Failed": failed}
+
+    def change_message_visibility_batch(
+        self, QueueUrl: str, Entries: List[Dict]
+    ) -> Dict:
+        successful = []
+        with self._condition:
+            now = time.monotonic()
+            for entry in Entries:
+                message_id = self._find(entry["ReceiptHandle"])
+                if message_id is not None:
+                    self.messages[message_id]["VisibleAt"] = (
+                        now + entry["VisibilityTimeout"]
+                    )
+                    successful.append({"Id": entry["Id"]})
+        return {"Successful": successful, "Failed": []}
@@ -1,16 +1,17 @@
 import argparse
 import os
-import boto3
 import json
 import logging
 
 from sbl_validation_processor.csv_to_parquet import split_csv_into_parquet
+from sbl_validation_processor.fused_pipeline import run_fused, should_fuse
+from sbl_validation_processor.aws_clients import get_client
 
 logger = logging.getLogger()
 
 
 def fire_parquet_done(response):
-    eb = boto3.client("events")
+    eb = get_client("events")
     eb.put_events(
         Entries=[
             {
@@ -24,6 +25,11 @@ def fire_parquet_done(response):
 
 
 def do_validation(bucket: str, key: str):
+    # small uploads are validated and aggregated here, with no parquet event for the next job
+    if should_fuse(bucket, key):
+        run_fused(bucket, key)
+        return
+
     response = split_csv_into_parquet(bucket, key)
 
     fire_parquet_done(response)
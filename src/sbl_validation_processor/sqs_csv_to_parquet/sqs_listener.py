@@ -1,59 +1,45 @@
 import os
-import boto3
-import json
 import logging
 
 from datetime import datetime
 from kubernetes import client, config
 
+from sbl_validation_processor.aws_clients import get_client
+from sbl_validation_processor.sqs_consumer import SQSConsumer
+from sbl_validation_processor.worker_pool import get_worker_mode
+
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
 
-def watch_queue():
-    region_name = "us-east-1"
+def handle_message(event: dict):
+    if "Records" in event and "s3" in event["Records"][0]:
+        bucket = event["Records"][0]["s3"]["bucket"]["name"]
+        key = event["Records"][0]["s3"]["object"]["key"]
+        logger.info(f"Received Event from Bucket {bucket}, File {key}")
+        if "report.csv" not in key:
+            paths = key.split("/")
+            sub_id = paths[-1].split(".")[0]
 
-    session = boto3.session.Session()
-    sqs = session.client(service_name="sqs", region_name=region_name)
+            if get_worker_mode() == "inprocess":
+                # only imported when the work runs here, job mode listeners stay light
+                from sbl_validation_processor.sqs_csv_to_parquet.job import (
+                    do_validation,
+                )
 
-    while True:
-        response = sqs.receive_message(
-            QueueUrl=os.getenv("QUEUE_URL", None),
-            MessageSystemAttributeNames=["All"],
-            MessageAttributeNames=[".*"],
-            MaxNumberOfMessages=1,
-            VisibilityTimeout=1200,
-            WaitTimeSeconds=20,
-        )
-        logger.info(f"Received SQS event {response}")
-        if response and "Messages" in response:
-            receipt = response["Messages"][0]["ReceiptHandle"]
-            event = json.loads(response["Messages"][0]["Body"])
-            if "Records" in event and "s3" in event["Records"][0]:
-                try:
-                    bucket = event["Records"][0]["s3"]["bucket"]["name"]
-                    key = event["Records"][0]["s3"]["object"]["key"]
-                    logger.info(f"Received Event from Bucket {bucket}, File {key}")
-                    if "report.csv" not in key:
-                        paths = key.split("/")
-                        sub_id = paths[-1].split(".")[0]
+                do_validation(bucket, key)
+            else:
+                fire_k8s_job(bucket, key, f"{sub_id}-{paths[-2]}-{paths[-3]}")
+        else:
+            logger.warn("not processing report.csv: %s", key)
+    # anything that isn't one of our S3 events is just deleted from the queue
 
-                        fire_k8s_job(bucket, key, f"{sub_id}-{paths[-2]}-{paths[-3]}")
-                    else:
-                        logger.warn("not processing report.csv: %s", key)
 
-                    # delete message after successfully processing the file
-                    response = sqs.delete_message(
-                        QueueUrl=os.getenv("QUEUE_URL", None), ReceiptHandle=receipt
-                    )
+def watch_queue():
+    region_name = "us-east-1"
 
-                except Exception as e:
-                    logger.exception("Error processing S3 SQS message event.", e)
-            else:
-                # if a message comes in that isn't part of our S3 events, delete from queue
-                response = sqs.delete_message(
-                    QueueUrl=os.getenv("QUEUE_URL", None), ReceiptHandle=receipt
-                )
+    sqs = get_client("sqs", region_name=region_name)
+    SQSConsumer(sqs, os.getenv("QUEUE_URL", None), handle_message).run()
 
 
 def fire_k8s_job(bucket: str, key: str, job_id: str):
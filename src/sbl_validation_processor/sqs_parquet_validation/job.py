@@ -1,16 +1,16 @@
 import argparse
 import os
-import boto3
 import json
 import logging
 
 from sbl_validation_processor.parquet_validator import validate_parquets
+from sbl_validation_processor.aws_clients import get_client
 
 logger = logging.getLogger()
 
 
 def fire_validation_done(response):
-    eb = boto3.client("events")
+    eb = get_client("events")
     eb.put_events(
         Entries=[
             {
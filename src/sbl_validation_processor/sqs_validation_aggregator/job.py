@@ -11,10 +11,22 @@ if __name__ == "__main__":
     parser.add_argument("--bucket")
     parser.add_argument("--key")
     parser.add_argument("--results")
+    parser.add_argument("--results-key")
+    parser.add_argument("--results-digest")
     args = parser.parse_args()
-    if not args.bucket or not args.key or not args.results:
+    has_ref = args.results_key and args.results_digest
+    if not args.bucket or not args.key or not (args.results or has_ref):
         logger.error(
-            "Error running parquet aggregator job.  --bucket, --key, and --results must be present."
+            "Error running parquet aggregator job.  --bucket, --key, and --results (or --results-key and --results-digest) must be present."
         )
     else:
-        aggregate_validation_results(args.bucket, args.key, json.loads(args.results))
+        aggregate_validation_results(
+            args.bucket,
+            args.key,
+            results=json.loads(args.results) if args.results else None,
+            results_ref=(
+                {"key": args.results_key, "digest": args.results_digest}
+                if has_ref
+                else None
+            ),
+        )
@@ -1,62 +1,64 @@
 import os
-import boto3
 import json
 import logging
 
 from datetime import datetime
 from kubernetes import client, config
 
+from sbl_validation_processor.aws_clients import get_client
+from sbl_validation_processor.sqs_consumer import SQSConsumer
+from sbl_validation_processor.worker_pool import get_worker_mode
+
 logger = logging.getLogger()
 logger.setLevel("INFO")
 
 
+def handle_message(event: dict):
+    if "detail" in event and "s3" in event["detail"]["Records"][0]:
+        record = event["detail"]["Records"][0]
+        bucket = record["s3"]["bucket"]["name"]
+        key = record["s3"]["object"]["key"]
+        logger.info(f"Received Event from Bucket {bucket}, File {key}")
+
+        paths = key.split("/")
+        sub_id = paths[-1].split("_res")[0]
+        if get_worker_mode() == "inprocess":
+            # only imported when the work runs here, job mode listeners stay light
+            from sbl_validation_processor.results_aggregator import (
+                aggregate_validation_results,
+            )
+
+            aggregate_validation_results(
+                bucket,
+                key,
+                results=record.get("results"),
+                results_ref=record.get("results_ref"),
+            )
+        else:
+            fire_k8s_job(bucket, key, record, f"{sub_id}-{paths[-2]}-{paths[-3]}")
+    # anything that isn't one of our S3 events is just deleted from the queue
+
+
 def watch_queue():
     region_name = "us-east-1"
 
-    session = boto3.session.Session()
-    sqs = session.client(service_name="sqs", region_name=region_name)
-
-    while True:
-        response = sqs.receive_message(
-            QueueUrl=os.getenv("QUEUE_URL", None),
-            MessageSystemAttributeNames=["All"],
-            MessageAttributeNames=[".*"],
-            MaxNumberOfMessages=1,
-            VisibilityTimeout=1200,
-            WaitTimeSeconds=20,
-        )
-        logger.info(f"Received SQS event {response}")
-        if response and "Messages" in response:
-            receipt = response["Messages"][0]["ReceiptHandle"]
-            event = json.loads(response["Messages"][0]["Body"])
-            if "detail" in event and "s3" in event["detail"]["Records"][0]:
-                try:
-                    bucket = event["detail"]["Records"][0]["s3"]["bucket"]["name"]
-                    key = event["detail"]["Records"][0]["s3"]["object"]["key"]
-                    results = event["detail"]["Records"][0]["results"]
-                    logger.info(f"Received Event from Bucket {bucket}, File {key}")
-
-                    paths = key.split("/")
-                    sub_id = paths[-1].split("_res")[0]
-                    fire_k8s_job(
-                        bucket, key, results, f"{sub_id}-{paths[-2]}-{paths[-3]}"
-                    )
-
-                    # delete message after successfully processing the file
-                    response = sqs.delete_message(
-                        QueueUrl=os.getenv("QUEUE_URL", None), ReceiptHandle=receipt
-                    )
-
-                except Exception as e:
-                    logger.exception("Error processing S3 SQS message event.", e)
-            else:
-                # if a message comes in that isn't part of our S3 events, delete from queue
-                response = sqs.delete_message(
-                    QueueUrl=os.getenv("QUEUE_URL", None), ReceiptHandle=receipt
-                )
+    sqs = get_client("sqs", region_name=region_name)
+    SQSConsumer(sqs, os.getenv("QUEUE_URL", None), handle_message).run()
+
 
+def get_results_args(record: dict) -> list:
+    # the job loads the results from the validator's summary, older events still have them inline
+    if results_ref := record.get("results_ref"):
+        return [
+            "--results-key",
+            results_ref["key"],
+            "--results-digest",
+            results_ref["digest"],
+        ]
+    return ["--results", json.dumps(record["results"])]
 
-def fire_k8s_job(bucket: str, key: str, results: dict, job_id: str):
+
+def fire_k8s_job(bucket: str, key: str, record: dict, job_id: str):
     config.load_incluster_config()
     batch_v1 = client.BatchV1Api()
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
@@ -72,14 +74,8 @@ def fire_k8s_job(bucket: str, key: str, results: dict, job_id: str):
                             name=f"aggregator-job-{timestamp}",
                             image=os.getenv("JOB_IMAGE"),
                             command=["python", "job.py"],
-                            args=[
-                                "--bucket",
-                                bucket,
-                                "--key",
-                                key,
-                                "--results",
-                                json.dumps(results),
-                            ],
+                            args=["--bucket", bucket, "--key", key]
+                            + get_results_args(record),
                             env=[
                                 client.V1EnvVar(
                                     name="DB_SECRET", value=os.getenv("DB_SECRET")
@@ -0,0 +1,423 @@
+import io
+import logging
+import os
+import re
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, BinaryIO, List, Tuple, Union
+
+from sbl_validation_processor.aws_clients import get_client, get_storage_options
+from sbl_validation_processor.ranged_reader import RangedS3Reader
+
+if TYPE_CHECKING:
+    import polars as pl
+
+log = logging.getLogger()
+
+
+@dataclass
+class StorageObject:
+    key: str
+    size: int
+    etag: str = None
+    last_modified: float = None
+
+
+def part_sort_key(key: str) -> Tuple:
+    # orders parts by folder, then by the numbers in their file name (00001.parquet, 00002.parquet, ...)
+    # rather than by how the backend happened to list them
+    folder, _, file_name = key.rpartition("/")
+    return folder, tuple(int(n) for n in re.findall(r"\d+", file_name)), key
+
+
+class MultipartWriter(ABC):
+    # Writes an object incrementally.  Used as a context manager, the object is only made visible if the
+    # block completes; an exception aborts the write.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @abstractmethod
+    def write(self, data: bytes):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    @abstractmethod
+    def abort(self):
+        pass
+
+
+class Storage(ABC):
+    # polars is only imported by the methods that return frames, so the csv splitter doesn't pay for it
+
+    @abstractmethod
+    def open_read(self, bucket: str, key: str) -> BinaryIO:
+        pass
+
+    @abstractmethod
+    def read_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        # start and end are inclusive, the same as an http Range header
+        pass
+
+    @abstractmethod
+    def list_prefix(self, bucket: str, prefix: str) -> List[StorageObject]:
+        pass
+
+    @abstractmethod
+    def size(self, bucket: str, key: str) -> int:
+        pass
+
+    @abstractmethod
+    def write_bytes(self, bucket: str, key: str, data: Union[bytes, BinaryIO]):
+        pass
+
+    @abstractmethod
+    def open_multipart_writer(self, bucket: str, key: str) -> MultipartWriter:
+        pass
+
+    @abstractmethod
+    def scan_parquet(self, bucket: str, key: str, **kwargs) -> "pl.LazyFrame":
+        pass
+
+    @abstractmethod
+    def delete_objects(self, bucket: str, keys: List[str]):
+        pass
+
+    def read_bytes(self, bucket: str, key: str) -> bytes:
+        with self.open_read(bucket, key) as f:
+            return f.read()
+
+
+class _LocalMultipartWriter(MultipartWriter):
+    def __init__(self, file_path: str):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        self.file_path = file_path
+        self.tmp_path = f"{file_path}.tmp"
+        self.file = open(self.tmp_path, "wb")
+
+    def write(self, data: bytes):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.file_path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+
+class LocalStorage(Storage):
+    # the bucket is a root directory on local disk
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(bucket, key)
+
+    def open_read(self, bucket: str, key: str) -> BinaryIO:
+        return open(self._path(bucket, key), "rb")
+
+    def read_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        with open(self._path(bucket, key), "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def list_prefix(self, bucket: str, prefix: str) -> List[StorageObject]:
+        # prefixes are directories on local disk
+        dir_path = self._path(bucket, prefix)
+        if not os.path.isdir(dir_path):
+            return []
+        objects = []
+        for root, _, files in os.walk(dir_path):
+            for file in files:
+                file_path = os.path.join(root, file)
+                stat = os.stat(file_path)
+                objects.append(
+                    StorageObject(
+                        key=os.path.relpath(file_path, bucket).replace(os.sep, "/"),
+                        size=stat.st_size,
+                        etag=f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+                        last_modified=stat.st_mtime,
+                    )
+                )
+        return objects
+
+    def size(self, bucket: str, key: str) -> int:
+        return os.path.getsize(self._path(bucket, key))
+
+    def write_bytes(self, bucket: str, key: str, data: Union[bytes, BinaryIO]):
+        file_path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(data if isinstance(data, bytes) else data.read())
+
+    def open_multipart_writer(self, bucket: str, key: str) -> MultipartWriter:
+        return _LocalMultipartWriter(self._path(bucket, key))
+
+    def scan_parquet(self, bucket: str, key: str, **kwargs) -> "pl.LazyFrame":
+        import polars as pl
+
+        return pl.scan_parquet(self._path(bucket, key), **kwargs)
+
+    def delete_objects(self, bucket: str, keys: List[str]):
+        for key in keys:
+            try:
+                os.remove(self._path(bucket, key))
+            except FileNotFoundError:
+                pass
+
+
+class _S3MultipartWriter(MultipartWriter):
+    def __init__(self, s3, bucket: str, key: str, part_size: int):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )["UploadId"]
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer),
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer = bytearray()
+
+    def write(self, data: bytes):
+        self.buffer.extend(data)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def close(self):
+        if self.upload_id is None:
+            # never reached a full part, a single put is cheaper than a one part multipart upload
+            self.s3.put_object(
+                Body=bytes(self.buffer), Bucket=self.bucket, Key=self.key
+            )
+            return
+        if self.buffer:
+            self._upload_part()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+
+class S3Storage(Storage):
+
+    @property
+    def s3(self):
+        return get_client("s3")
+
+    def open_read(self, bucket: str, key: str) -> BinaryIO:
+        if int(os.getenv("S3_RANGE_PARALLELISM", 8)) > 1:
+            return RangedS3Reader(self.s3, bucket, key)
+        return self.s3.get_object(Bucket=bucket, Key=key)["Body"]
+
+    def read_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        response = self.s3.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={start}-{end}"
+        )
+        return response["Body"].read()
+
+    def _list_level(self, bucket: str, prefix: str):
+        objects = []
+        sub_prefixes = []
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+            objects.extend(
+                StorageObject(
+                    key=obj["Key"],
+                    size=obj["Size"],
+                    etag=obj.get("ETag"),
+                    last_modified=(
+                        obj["LastModified"].timestamp()
+                        if "LastModified" in obj
+                        else None
+                    ),
+                )
+                for obj in page.get("Contents", [])
+            )
+            sub_prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+        return objects, sub_prefixes
+
+    def list_prefix(self, bucket: str, prefix: str) -> List[StorageObject]:
+        # each "directory" level is paginated, and sibling sub prefixes (e.g. partition folders) are listed
+        # concurrently instead of walking one flat listing 1000 keys at a time
+        objects, pending = self._list_level(bucket, prefix)
+        with ThreadPoolExecutor(
+            max_workers=int(os.getenv("S3_LIST_PARALLELISM", 8))
+        ) as pool:
+            while pending:
+                levels = list(pool.map(lambda p: self._list_level(bucket, p), pending))
+                pending = []
+                for level_objects, sub_prefixes in levels:
+                    objects.extend(level_objects)
+                    pending.extend(sub_prefixes)
+        return objects
+
+    def size(self, bucket: str, key: str) -> int:
+        return self.s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+    def write_bytes(self, bucket: str, key: str, data: Union[bytes, BinaryIO]):
+        if isinstance(data, bytes):
+            data = io.BytesIO(data)
+        self.s3.upload_fileobj(data, bucket, key)
+
+    def open_multipart_writer(self, bucket: str, key: str) -> MultipartWriter:
+        # s3 requires every part but the last to be at least 5MiB
+        part_size = max(
+            int(os.getenv("S3_MULTIPART_PART_SIZE", 8 * 1024 * 1024)), 5 * 1024 * 1024
+        )
+        return _S3MultipartWriter(self.s3, bucket, key, part_size)
+
+    def scan_parquet(self, bucket: str, key: str, **kwargs) -> "pl.LazyFrame":
+        import polars as pl
+
+        return pl.scan_parquet(
+            f"s3://{bucket}/{key}", storage_options=get_storage_options(), **kwargs
+        )
+
+    def delete_objects(self, bucket: str, keys: List[str]):
+        # delete_objects takes at most 1000 keys per request
+        for i in range(0, len(keys), 1000):
+            self.s3.delete_objects(
+                Bucket=bucket,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys[i : i + 1000]],
+                    "Quiet": True,
+                },
+            )
+
+
+class _MemoryMultipartWriter(MultipartWriter):
+    def __init__(self, storage: "MemoryStorage", bucket: str, key: str):
+        self.storage = storage
+        self.bucket = bucket
+        self.key = key
+        self.buffer = bytearray()
+
+    def write(self, data: bytes):
+        self.buffer.extend(data)
+
+    def close(self):
+        self.storage.write_bytes(self.bucket, self.key, bytes(self.buffer))
+
+    def abort(self):
+        self.buffer = bytearray()
+
+
+class MemoryStorage(Storage):
+    # keeps objects in a dict, useful for tests and benchmarks that shouldn't touch disk or the network
+
+    def __init__(self):
+        self.objects = {}
+        self.modified = {}
+        self._lock = threading.Lock()
+
+    def open_read(self, bucket: str, key: str) -> BinaryIO:
+        return io.BytesIO(self.objects[(bucket, key)])
+
+    def read_range(self, bucket: str, key: str, start: int, end: int) -> bytes:
+        return self.objects[(bucket, key)][start : end + 1]
+
+    def list_prefix(self, bucket: str, prefix: str) -> List[StorageObject]:
+        with self._lock:
+            items = list(self.objects.items())
+        return [
+            StorageObject(
+                key=key,
+                size=len(data),
+                etag=f"{hash(data):x}",
+                last_modified=self.modified.get((bucket, key)),
+            )
+            for (obj_bucket, key), data in items
+            if obj_bucket == bucket and key.startswith(prefix)
+        ]
+
+    def size(self, bucket: str, key: str) -> int:
+        return len(self.objects[(bucket, key)])
+
+    def write_bytes(self, bucket: str, key: str, data: Union[bytes, BinaryIO]):
+        data = data if isinstance(data, bytes) else data.read()
+        with self._lock:
+            self.objects[(bucket, key)] = data
+            self.modified[(bucket, key)] = time.time()
+
+    def open_multipart_writer(self, bucket: str, key: str) -> MultipartWriter:
+        return _MemoryMultipartWriter(self, bucket, key)
+
+    def scan_parquet(self, bucket: str, key: str, **kwargs) -> "pl.LazyFrame":
+        import polars as pl
+
+        if key.endswith("/"):
+            keys = sorted(
+                obj.key
+                for obj in self.list_prefix(bucket, key)
+                if obj.key.endswith(".parquet")
+            )
+        else:
+            keys = [key]
+        if not keys:
+            raise FileNotFoundError(f"no parquet files found in {bucket}/{key}")
+        return pl.concat(
+            [pl.read_parquet(self.objects[(bucket, k)]).lazy() for k in keys],
+            how="diagonal",
+        )
+
+    def delete_objects(self, bucket: str, keys: List[str]):
+        with self._lock:
+            for key in keys:
+                self.objects.pop((bucket, key), None)
+                self.modified.pop((bucket, key), None)
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    # ENV picks the backend: LOCAL disk, in process MEMORY, or S3 (the default)
+    env = os.getenv("ENV", "S3")
+    storage = _storages.get(env)
+    if storage is None:
+        with _storages_lock:
+            storage = _storages.get(env)
+            if storage is None:
+                if env == "LOCAL":
+                    storage = LocalStorage()
+                elif env == "MEMORY":
+                    storage = MemoryStorage()
+                else:
+                    storage = S3Storage()
+                _storages[env] = storage
+    return storage
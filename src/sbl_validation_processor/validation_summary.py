@@ -0,0 +1,247 @@
+import hashlib
+import json
+import logging
+import polars as pl
+
+from botocore.exceptions import ClientError
+from collections import defaultdict
+from typing import Dict, Optional
+
+from regtech_data_validator.validation_results import ValidationResults, ValidationPhase
+
+from sbl_validation_processor.findings_format import wide_field_count
+from sbl_validation_processor.storage import get_storage
+
+log = logging.getLogger()
+
+COUNT_FIELDS = [
+    "single_field_count",
+    "multi_field_count",
+    "register_count",
+    "total_count",
+]
+
+
+def _empty_counts() -> Dict[str, int]:
+    return dict.fromkeys(COUNT_FIELDS, 0)
+
+
+def summary_key(validation_result_path: str) -> str:
+    # the summary sits next to the results folder, e.g. 1_res/ -> 1_summary.json
+    return f"{validation_result_path.rstrip('/').removesuffix('_res')}_summary.json"
+
+
+class ValidationSummary:
+    # Running totals kept while the validator works through batches, so the final counts don't need every
+    # ValidationResults object kept around and the aggregator doesn't need to rescan the findings for them.
+    # Summaries are picklable so partitioned validation workers can send theirs back to be merged.
+    def __init__(self):
+        self.record_counts = defaultdict(int)
+        self.error_counts = defaultdict(_empty_counts)
+        self.warning_counts = defaultdict(_empty_counts)
+        self.validation_counts = defaultdict(int)
+        self.has_syntax_errors = False
+        # the most field_N/value_N columns any findings had, so long findings widen back to the same columns
+        self.field_count = 0
+
+    def add(
+        self,
+        validation_results: ValidationResults,
+        findings: pl.DataFrame,
+        include_register: bool = True,
+    ):
+        phase = str(validation_results.phase)
+        self.record_counts[phase] += validation_results.record_count
+        for counts, results_counts in [
+            (self.error_counts[phase], validation_results.error_counts),
+            (self.warning_counts[phase], validation_results.warning_counts),
+        ]:
+            for field in COUNT_FIELDS:
+                counts[field] += getattr(results_counts, field)
+            if not include_register:
+                # register checks counted elsewhere (over the whole file) are taken back out
+                counts["register_count"] -= results_counts.register_count
+                counts["total_count"] -= results_counts.register_count
+        if (
+            validation_results.phase == ValidationPhase.SYNTACTICAL
+            and not validation_results.is_valid
+        ):
+            self.has_syntax_errors = True
+        self._count_findings(findings, phase)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ValidationSummary":
+        # rebuilds a summary from to_dict, e.g. one kept in the result cache
+        summary = cls()
+        for phase, phase_counts in data["phases"].items():
+            summary.record_counts[phase] = phase_counts["record_count"]
+            summary.error_counts[phase] = dict(phase_counts["errors"])
+            summary.warning_counts[phase] = dict(phase_counts["warnings"])
+        for validation in data["validations"]:
+            summary.validation_counts[
+                (
+                    validation["validation_id"],
+                    validation["validation_type"],
+                    validation["phase"],
+                )
+            ] = validation["findings_count"]
+        summary.has_syntax_errors = "logic_errors" not in data["results"]
+        summary.field_count = data.get("field_count", 0)
+        return summary
+
+    def _count_findings(self, findings: pl.DataFrame, phase: str):
+        if findings is not None and findings.height:
+            self.field_count = max(self.field_count, wide_field_count(findings.columns))
+            for validation_id, validation_type, count in (
+                findings.group_by("validation_id", "validation_type").len().iter_rows()
+            ):
+                self.validation_counts[(validation_id, validation_type, phase)] += count
+
+    def add_register_results(
+        self, validation_results: ValidationResults, findings: pl.DataFrame
+    ):
+        # register checks run over the whole file rather than a single batch, so only their counts are
+        # added, the file's records were already counted by the batches
+        phase = str(validation_results.phase)
+        for counts, results_counts in [
+            (self.error_counts[phase], validation_results.error_counts),
+            (self.warning_counts[phase], validation_results.warning_counts),
+        ]:
+            counts["register_count"] += results_counts.register_count
+            counts["total_count"] += results_counts.register_count
+        self._count_findings(findings, phase)
+
+    def discard_findings(self, findings: pl.DataFrame, phase: str):
+        # findings that were validated but not kept, e.g. past max errors.  The error and warning counts
+        # stay the real totals
+        for validation_id, validation_type, count in (
+            findings.group_by("validation_id", "validation_type").len().iter_rows()
+        ):
+            validation = (validation_id, validation_type, phase)
+            self.validation_counts[validation] -= count
+            if not self.validation_counts[validation]:
+                del self.validation_counts[validation]
+
+    def merge(self, other: "ValidationSummary"):
+        for phase, record_count in other.record_counts.items():
+            self.record_counts[phase] += record_count
+        for counts, other_counts in [
+            (self.error_counts, other.error_counts),
+            (self.warning_counts, other.warning_counts),
+        ]:
+            for phase, phase_counts in other_counts.items():
+                for field in COUNT_FIELDS:
+                    counts[phase][field] += phase_counts[field]
+        for validation, count in other.validation_counts.items():
+            self.validation_counts[validation] += count
+        self.has_syntax_errors = self.has_syntax_errors or other.has_syntax_errors
+        self.field_count = max(self.field_count, other.field_count)
+
+    def discard_phase(self, phase: str):
+        self.record_counts.pop(phase, None)
+        self.error_counts.pop(phase, None)
+        self.warning_counts.pop(phase, None)
+        for validation in [v for v in self.validation_counts if v[2] == phase]:
+            del self.validation_counts[validation]
+
+    def _sum(self, counts: Dict, field: str) -> int:
+        return sum(phase_counts[field] for phase_counts in counts.values())
+
+    def to_results(self) -> Dict:
+        # same shape as combine_results
+        if self.has_syntax_errors:
+            syntax_error_counts = self._sum(self.error_counts, "single_field_count")
+            return {
+                "total_records": sum(self.record_counts.values()),
+                "syntax_errors": {
+                    "single_field_count": syntax_error_counts,
+                    "multi_field_count": 0,  # this will always be zero for syntax errors
+                    "register_count": 0,  # this will always be zero for syntax errors
+                    "total_count": syntax_error_counts,
+                },
+            }
+        return {
+            "total_records": self.record_counts[str(ValidationPhase.LOGICAL)],
+            "syntax_errors": dict.fromkeys(COUNT_FIELDS, 0),
+            "logic_errors": {
+                field: self._sum(self.error_counts, field) for field in COUNT_FIELDS
+            },
+            "logic_warnings": {
+                field: self._sum(self.warning_counts, field) for field in COUNT_FIELDS
+            },
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            "results": self.to_results(),
+            "phases": {
+                phase: {
+                    "record_count": record_count,
+                    "errors": self.error_counts[phase],
+                    "warnings": self.warning_counts[phase],
+                }
+                for phase, record_count in self.record_counts.items()
+            },
+            "validations": [
+                {
+                    "validation_id": validation_id,
+                    "validation_type": validation_type,
+                    "phase": phase,
+                    "findings_count": count,
+                }
+                for (validation_id, validation_type, phase), count in sorted(
+                    self.validation_counts.items()
+                )
+            ],
+            "field_count": self.field_count,
+        }
+
+
+def write_summary(
+    summary: ValidationSummary, bucket: str, validation_result_path: str
+) -> Dict[str, str]:
+    # the summary doubles as the claim check for the validator's results: events and jobs carry the returned
+    # reference instead of the results themselves, so their size doesn't grow with the findings
+    data = json.dumps(summary.to_dict()).encode("utf-8")
+    key = summary_key(validation_result_path)
+    get_storage().write_bytes(bucket, key, data)
+    return {"key": key, "digest": hashlib.sha256(data).hexdigest()}
+
+
+def load_results(bucket: str, results_ref: Dict[str, str]) -> Dict:
+    # the results a write_summary reference points to, as long as the summary hasn't changed since
+    data = get_storage().read_bytes(bucket, results_ref["key"])
+    if hashlib.sha256(data).hexdigest() != results_ref["digest"]:
+        raise ValueError(
+            "validation results {} don't match their digest".format(results_ref["key"])
+        )
+    return json.loads(data)["results"]
+
+
+def load_summary(bucket: str, validation_result_path: str) -> Optional[Dict]:
+    try:
+        return json.loads(
+            get_storage().read_bytes(bucket, summary_key(validation_result_path))
+        )
+    except (ClientError, FileNotFoundError, KeyError):
+        # results written before the summary existed, callers fall back to scanning the findings
+        log.info("no validation summary for {}".format(validation_result_path))
+        return None
+
+
+def get_findings_counts(summary: Dict) -> pl.DataFrame:
+    # findings per validation_id, sorted, in the same shape as group_by("validation_id").len()
+    return (
+        pl.DataFrame(
+            summary["validations"],
+            schema={
+                "validation_id": pl.String,
+                "validation_type": pl.String,
+                "phase": pl.String,
+                "findings_count": pl.Int64,
+            },
+        )
+        .group_by("validation_id")
+        .agg(pl.col("findings_count").sum().cast(pl.UInt32).alias("len"))
+        .sort("validation_id")
+    )
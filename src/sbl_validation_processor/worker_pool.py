@@ -0,0 +1,59 @@
+import logging
+import os
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+logger = logging.getLogger()
+
+
+class WorkerPool:
+    # Runs jobs on threads of a long running listener instead of a new kubernetes job per message, so the
+    # interpreter, imports, boto3 clients and db pools stay warm between submissions.  Listeners reserve a
+    # slot before pulling a message, so no more than WORKER_CONCURRENCY messages are held at once.
+    def __init__(self, concurrency: int = None):
+        self.concurrency = concurrency or int(os.getenv("WORKER_CONCURRENCY", 2))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="worker"
+        )
+
+    def reserve(self, timeout: float = None) -> bool:
+        return self._slots.acquire(timeout=timeout)
+
+    def release(self):
+        self._slots.release()
+
+    def run(
+        self,
+        fn: Callable,
+        *args,
+        on_success: Callable = None,
+        on_done: Callable = None,
+    ) -> Future:
+        # runs fn on a slot already taken with reserve, freeing it when fn finishes.  on_success (e.g.
+        # deleting the message) only runs if fn didn't raise, so a failed message is retried once its
+        # visibility timeout runs out.  on_done always runs
+        def task():
+            try:
+                fn(*args)
+                if on_success:
+                    on_success()
+            except Exception:
+                logger.exception("Error running {} with {}".format(fn.__name__, args))
+            finally:
+                if on_done:
+                    on_done()
+                self._slots.release()
+
+        return self._executor.submit(task)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def get_worker_mode() -> str:
+    # job fires a kubernetes job per message, which keeps every submission isolated in its own pod.
+    # inprocess runs the work in the listener on a WorkerPool
+    return os.getenv("WORKER_MODE", "job")
@@ -0,0 +1,35 @@
+import json
+import os
+import pytest
+
+from pathlib import Path
+
+
+def pytest_collection_modifyitems(config, items):
+    # benchmarks generate files of up to 5M records, so they only run when asked for
+    if bool(json.loads(os.getenv("RUN_BENCHMARKS", "false").lower())):
+        return
+    skip = pytest.mark.skip(reason="set RUN_BENCHMARKS=true to run benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def benchmark_records():
+    # every stage's measurements, written to BENCHMARK_OUTPUT at the end of the session to keep as the next
+    # BENCHMARK_BASELINE
+    records = []
+    yield records
+    if records and (output := os.getenv("BENCHMARK_OUTPUT")):
+        Path(output).write_text(json.dumps(records, indent=2))
+
+
+@pytest.fixture(scope="session")
+def benchmark_baseline():
+    if baseline := os.getenv("BENCHMARK_BASELINE"):
+        return {
+            (r["stage"], r["rows"], r["error_density"]): r
+            for r in json.loads(Path(baseline).read_text())
+        }
+    return {}
@@ -0,0 +1,213 @@
+import polars as pl
+
+SBL_COLUMNS = [
+    "uid",
+    "app_date",
+    "app_method",
+    "app_recipient",
+    "ct_credit_product",
+    "ct_credit_product_ff",
+    "ct_guarantee",
+    "ct_guarantee_ff",
+    "ct_loan_term_flag",
+    "ct_loan_term",
+    "credit_purpose",
+    "credit_purpose_ff",
+    "amount_applied_for_flag",
+    "amount_applied_for",
+    "amount_approved",
+    "action_taken",
+    "action_taken_date",
+    "denial_reasons",
+    "denial_reasons_ff",
+    "pricing_interest_rate_type",
+    "pricing_init_rate_period",
+    "pricing_fixed_rate",
+    "pricing_adj_margin",
+    "pricing_adj_index_name",
+    "pricing_adj_index_name_ff",
+    "pricing_adj_index_value",
+    "pricing_origination_charges",
+    "pricing_broker_fees",
+    "pricing_initial_charges",
+    "pricing_mca_addcost_flag",
+    "pricing_mca_addcost",
+    "pricing_prepenalty_allowed",
+    "pricing_prepenalty_exists",
+    "census_tract_adr_type",
+    "census_tract_number",
+    "gross_annual_revenue_flag",
+    "gross_annual_revenue",
+    "naics_code_flag",
+    "naics_code",
+    "number_of_workers",
+    "time_in_business_type",
+    "time_in_business",
+    "business_ownership_status",
+    "num_principal_owners_flag",
+    "num_principal_owners",
+] + [
+    f"po_{owner}_{field}"
+    for owner in range(1, 5)
+    for field in [
+        "ethnicity",
+        "ethnicity_ff",
+        "race",
+        "race_anai_ff",
+        "race_asian_ff",
+        "race_baa_ff",
+        "race_pi_ff",
+        "gender_flag",
+        "gender_ff",
+    ]
+]
+
+# an originated term loan with one principal owner, meant to pass every check
+CLEAN_ROW = dict.fromkeys(SBL_COLUMNS[1:], "") | {
+    "app_date": "20241201",
+    "app_method": "1",
+    "app_recipient": "1",
+    "ct_credit_product": "1",
+    "ct_guarantee": "999",
+    "ct_loan_term_flag": "900",
+    "ct_loan_term": "36",
+    "credit_purpose": "1",
+    "amount_applied_for_flag": "900",
+    "amount_applied_for": "100000",
+    "amount_approved": "100000",
+    "action_taken": "1",
+    "action_taken_date": "20241215",
+    "denial_reasons": "999",
+    "pricing_interest_rate_type": "1",
+    "pricing_fixed_rate": "5.5",
+    "pricing_adj_index_name": "999",
+    "pricing_origination_charges": "100",
+    "pricing_broker_fees": "0",
+    "pricing_initial_charges": "0",
+    "pricing_mca_addcost_flag": "999",
+    "pricing_prepenalty_allowed": "2",
+    "pricing_prepenalty_exists": "2",
+    "census_tract_adr_type": "1",
+    "census_tract_number": "01001020100",
+    "gross_annual_revenue_flag": "900",
+    "gross_annual_revenue": "500000",
+    "naics_code_flag": "900",
+    "naics_code": "111",
+    "number_of_workers": "2",
+    "time_in_business_type": "1",
+    "time_in_business": "5",
+    "business_ownership_status": "1",
+    "num_principal_owners_flag": "900",
+    "num_principal_owners": "1",
+    "po_1_ethnicity": "2",
+    "po_1_race": "5",
+    "po_1_gender_flag": "1",
+}
+
+# the first record of tests/test_files/1_pqs, which has logic errors and warnings but passes syntax
+ERROR_ROW = CLEAN_ROW | {
+    "ct_credit_product": "988",
+    "ct_credit_product_ff": "test",
+    "ct_guarantee": "999;999;999;999;999;999",
+    "ct_guarantee_ff": "test",
+    "ct_loan_term_flag": "988",
+    "ct_loan_term": "0",
+    "credit_purpose": "999;999;999;999",
+    "credit_purpose_ff": "test",
+    "amount_applied_for_flag": "999",
+    "amount_applied_for": "0",
+    "amount_approved": "0",
+    "action_taken": "3",
+    "action_taken_date": "20201231",
+    "denial_reasons": "999;999;999;999;999",
+    "denial_reasons_ff": "test",
+    "pricing_interest_rate_type": "5",
+    "pricing_fixed_rate": "0",
+    "pricing_adj_index_name_ff": "test",
+    "pricing_adj_index_value": "0",
+    "pricing_origination_charges": "",
+    "pricing_broker_fees": "",
+    "pricing_initial_charges": "",
+    "pricing_mca_addcost_flag": "900",
+    "pricing_prepenalty_allowed": "999",
+    "pricing_prepenalty_exists": "999",
+    "census_tract_adr_type": "988",
+    "gross_annual_revenue_flag": "988",
+    "gross_annual_revenue": "0",
+    "naics_code_flag": "988",
+    "naics_code": "1234",
+    "number_of_workers": "988",
+    "time_in_business_type": "988",
+    "time_in_business": "-1",
+    "business_ownership_status": "988;988",
+    "num_principal_owners_flag": "900",
+    "num_principal_owners": "0",
+    "po_1_ethnicity": "1",
+    "po_1_race": "",
+    "po_1_gender_flag": "",
+}
+
+
+def generate_sbl_frame(
+    rows: int,
+    error_density: float = 0.0,
+    duplicate_density: float = 0.0,
+    lei: str = "123456789TESTBANK01",
+    offset: int = 0,
+    seed: int = 0,
+) -> pl.DataFrame:
+    # error_density of the records take ERROR_ROW's values and duplicate_density of them reuse the previous
+    # record's uid (a register error).  The rest are CLEAN_ROW, so findings scale with the densities
+    index = pl.int_range(offset, offset + rows, eager=True)
+    draws = pl.DataFrame(
+        {
+            "index": index,
+            "error_draw": _uniform(rows, seed),
+            "duplicate_draw": _uniform(rows, seed + 1),
+        }
+    )
+    is_error = pl.col("error_draw") < error_density
+    uid_number = (
+        pl.when((pl.col("duplicate_draw") < duplicate_density) & (pl.col("index") > 0))
+        .then(pl.col("index") - 1)
+        .otherwise(pl.col("index"))
+    )
+    return draws.select(
+        uid=pl.lit(lei) + uid_number.cast(pl.String).str.zfill(10),
+        **{
+            column: pl.when(is_error)
+            .then(pl.lit(ERROR_ROW[column]))
+            .otherwise(pl.lit(CLEAN_ROW[column]))
+            for column in SBL_COLUMNS[1:]
+        },
+    )
+
+
+def _uniform(rows: int, seed: int) -> pl.Series:
+    # a cheap deterministic uniform [0, 1) sample, polars has no seeded random column expression
+    return (pl.int_range(0, rows, eager=True).hash(seed) % 1_000_000).cast(
+        pl.Float64
+    ) / 1_000_000
+
+
+def generate_sbl_csv(
+    path,
+    rows: int,
+    error_density: float = 0.0,
+    duplicate_density: float = 0.0,
+    lei: str = "123456789TESTBANK01",
+    chunk_size: int = 500_000,
+) -> int:
+    # writes in chunks so a 5M record file doesn't have to fit in memory, returns the file's size
+    with open(path, "wb") as f:
+        f.write((",".join(SBL_COLUMNS) + "\n").encode("utf-8"))
+        for offset in range(0, rows, chunk_size):
+            generate_sbl_frame(
+                min(chunk_size, rows - offset),
+                error_density,
+                duplicate_density,
+                lei,
+                offset,
+                seed=offset,
+            ).write_csv(f, include_header=False)
+        return f.tell()
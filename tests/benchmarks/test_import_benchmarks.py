@@ -0,0 +1,25 @@
+import os
+import pytest
+
+from sbl_validation_processor.import_profile import (
+    cost_by_package,
+    profile_imports,
+    total_us,
+)
+
+# cold start import budgets, in ms, with the processors dependency group installed.  They're ceilings that
+# catch a heavy import sneaking back into an entry point rather than machine noise, IMPORT_BUDGET_SCALE
+# adjusts them for the machine
+ENTRY_POINT_BUDGETS = [
+    ("sbl_validation_processor.lambda_csv_to_parquet.lambda_function", 1500),
+    ("sbl_validation_processor.lambda_parquet_validator.lambda_function", 500),
+    ("sbl_validation_processor.lambda_validation_aggregator.lambda_function", 500),
+]
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("module,budget_ms", ENTRY_POINT_BUDGETS)
+def test_entry_point_import_time(module, budget_ms):
+    timings = profile_imports(module)
+    budget_ms *= float(os.getenv("IMPORT_BUDGET_SCALE", 1))
+    assert total_us(timings, module) / 1000 < budget_ms, cost_by_package(timings)
@@ -0,0 +1,223 @@
+import logging
+import multiprocessing
+import os
+import polars as pl
+import pytest
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sbl_validation_processor import instrumentation
+from sbl_validation_processor.csv_to_parquet import split_csv_into_parquet
+from sbl_validation_processor.storage import get_storage
+from tests.benchmarks.sbl_generator import generate_sbl_csv
+
+log = logging.getLogger()
+
+BENCHMARK_ROWS = [
+    int(rows)
+    for rows in os.getenv("BENCHMARK_ROWS", "10000,100000,1000000,5000000").split(",")
+]
+ERROR_DENSITIES = [
+    float(density)
+    for density in os.getenv("BENCHMARK_ERROR_DENSITIES", "0.01,0.25").split(",")
+]
+# how much slower or bigger than the baseline a stage can get before it fails
+TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", 0.25))
+
+KEY = "123456789TESTBANK01/1.csv"
+PQS_KEY = "123456789TESTBANK01/1_pqs/"
+RES_KEY = "123456789TESTBANK01/1_res/"
+
+sizes = pytest.mark.parametrize("rows", BENCHMARK_ROWS)
+densities = pytest.mark.parametrize("error_density", ERROR_DENSITIES)
+
+
+def isolated(fn, *args):
+    # each stage runs in a fresh process, so the peak RSS it reports is its own
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def run_split(bucket: str) -> dict:
+    return split_csv_into_parquet(bucket, KEY)["metrics"]
+
+
+def run_validate(bucket: str) -> dict:
+    # the validator (and its dependencies) is only imported where it runs
+    from sbl_validation_processor.parquet_validator import validate_parquets
+    from sbl_validation_processor.validation_summary import load_results
+
+    response = validate_parquets(bucket, PQS_KEY)
+    results = load_results(bucket, response["Records"][0]["results_ref"])
+    return {**response["metrics"], "results": results}
+
+
+def run_aggregate(bucket: str, results: dict) -> dict:
+    # the report and grouped json, which is everything the aggregator does apart from updating the submission
+    from sbl_validation_processor.results_aggregator import (
+        build_group_results,
+        get_error_and_warning_totals,
+        write_report_stream,
+    )
+    from sbl_validation_processor.validation_summary import (
+        get_findings_counts,
+        load_summary,
+    )
+
+    with instrumentation.stage("aggregate") as metrics:
+        storage = get_storage()
+        parts = [
+            obj
+            for obj in storage.list_prefix(bucket, RES_KEY)
+            if obj.key.endswith(".parquet")
+        ]
+        metrics.add("rows", results["total_records"])
+        metrics.add("bytes_read", sum(part.size for part in parts))
+        lf = pl.LazyFrame()
+        if parts:
+            lf = pl.concat(
+                [
+                    storage.scan_parquet(bucket, part.key, allow_missing_columns=True)
+                    for part in parts
+                ],
+                how="diagonal",
+            )
+        error_counts, warning_counts = get_error_and_warning_totals(results)
+        with metrics.timer("report"):
+            write_report_stream(
+                lf if parts else None,
+                bucket,
+                "123456789TESTBANK01/1_report.csv",
+                warning_counts,
+                error_counts,
+                int(os.getenv("MAX_ERRORS", 1000000)),
+                get_findings_counts(load_summary(bucket, RES_KEY)),
+            )
+        if parts:
+            with metrics.timer("collect_groups"):
+                build_group_results(lf, int(os.getenv("MAX_GROUP_SIZE", 200)))
+    return metrics.summary()
+
+
+def folder_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+class Submissions:
+    # one generated submission per size and density, shared by the stages.  A stage whose input is missing
+    # (e.g. only the validator benchmarks were selected) runs the stages before it first
+    def __init__(self, root: Path):
+        self.root = root
+        self.results = {}
+
+    def bucket(self, rows: int, error_density: float) -> Path:
+        bucket = self.root / f"{rows}_{error_density}"
+        if not (bucket / KEY).exists():
+            (bucket / KEY).parent.mkdir(parents=True)
+            generate_sbl_csv(bucket / KEY, rows, error_density, error_density / 10)
+        return bucket
+
+    def split(self, rows: int, error_density: float) -> Path:
+        bucket = self.bucket(rows, error_density)
+        if not (bucket / PQS_KEY).exists():
+            isolated(run_split, str(bucket))
+        return bucket
+
+    def validate(self, rows: int, error_density: float):
+        bucket = self.split(rows, error_density)
+        if (rows, error_density) not in self.results:
+            metrics = isolated(run_validate, str(bucket))
+            self.results[(rows, error_density)] = metrics["results"]
+        return bucket, self.results[(rows, error_density)]
+
+
+@pytest.fixture(scope="module")
+def submissions(tmp_path_factory):
+    return Submissions(tmp_path_factory.mktemp("benchmarks"))
+
+
+def check(metrics, rows, error_density, input_bytes, output_bytes, records, baseline):
+    record = {
+        "stage": metrics["stage"],
+        "rows": rows,
+        "error_density": error_density,
+        "wall_seconds": metrics["wall_seconds"],
+        "rows_per_second": metrics["rows_per_second"],
+        "process_peak_rss_bytes": metrics["process_peak_rss_bytes"],
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+    }
+    log.info("benchmark: {}".format(record))
+    records.append(record)
+    if previous := baseline.get((record["stage"], rows, error_density)):
+        assert record["rows_per_second"] >= previous["rows_per_second"] * (
+            1 - TOLERANCE
+        ), f"throughput regressed from {previous['rows_per_second']} rows/s"
+        previous_peak = previous["process_peak_rss_bytes"]
+        assert record["process_peak_rss_bytes"] <= previous_peak * (
+            1 + TOLERANCE
+        ), f"peak memory regressed from {previous_peak} bytes"
+        assert record["output_bytes"] <= previous["output_bytes"] * (
+            1 + TOLERANCE
+        ), f"output size regressed from {previous['output_bytes']} bytes"
+
+
+@pytest.mark.benchmark
+class TestPipelineBenchmarks:
+
+    @sizes
+    @densities
+    def test_csv_to_parquet(
+        self, submissions, rows, error_density, benchmark_records, benchmark_baseline
+    ):
+        bucket = submissions.bucket(rows, error_density)
+        metrics = isolated(run_split, str(bucket))
+        assert metrics["rows"] == rows
+        check(
+            metrics,
+            rows,
+            error_density,
+            (bucket / KEY).stat().st_size,
+            folder_bytes(bucket / PQS_KEY),
+            benchmark_records,
+            benchmark_baseline,
+        )
+
+    @sizes
+    @densities
+    def test_parquet_validator(
+        self, submissions, rows, error_density, benchmark_records, benchmark_baseline
+    ):
+        bucket = submissions.split(rows, error_density)
+        metrics = isolated(run_validate, str(bucket))
+        submissions.results[(rows, error_density)] = metrics["results"]
+        assert metrics["rows"] == rows
+        check(
+            metrics,
+            rows,
+            error_density,
+            folder_bytes(bucket / PQS_KEY),
+            folder_bytes(bucket / RES_KEY),
+            benchmark_records,
+            benchmark_baseline,
+        )
+
+    @sizes
+    @densities
+    def test_results_aggregator(
+        self, submissions, rows, error_density, benchmark_records, benchmark_baseline
+    ):
+        bucket, results = submissions.validate(rows, error_density)
+        metrics = isolated(run_aggregate, str(bucket), results)
+        check(
+            metrics,
+            rows,
+            error_density,
+            folder_bytes(bucket / RES_KEY),
+            (bucket / "123456789TESTBANK01/1_report.csv").stat().st_size,
+            benchmark_records,
+            benchmark_baseline,
+        )
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor import aws_clients
+
+
+class TestAwsClients:
+
+    def test_clients_are_reused(self, mocker: MockerFixture):
+        aws_clients.reset_clients()
+        mock_session = mocker.patch(
+            "sbl_validation_processor.aws_clients.boto3.session.Session"
+        )
+        mock_session.return_value.client.side_effect = lambda **kwargs: object()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            s3_clients = list(
+                pool.map(lambda _: aws_clients.get_client("s3"), range(32))
+            )
+        sqs_client = aws_clients.get_client("sqs", region_name="us-east-1")
+
+        assert all(c is s3_clients[0] for c in s3_clients)
+        assert sqs_client is aws_clients.get_client("sqs", region_name="us-east-1")
+        assert mock_session.call_count == 1
+        assert mock_session.return_value.client.call_count == 2
+        config = mock_session.return_value.client.call_args.kwargs["config"]
+        assert config.max_pool_connections == 50
+        assert config.retries == {"max_attempts": 5, "mode": "standard"}
+        aws_clients.reset_clients()
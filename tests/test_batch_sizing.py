@@ -0,0 +1,23 @@
+import os
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor.batch_sizing import batch_size_from_manifest
+
+
+class TestBatchSizing:
+
+    def test_batch_size_from_manifest(self, mocker: MockerFixture):
+        mocker.patch.dict(
+            os.environ, {"BATCH_MIN_ROWS": "100", "BATCH_MAX_ROWS": "5000"}
+        )
+        parts = [
+            {"rows": 1000, "data_bytes": 100000},
+            {"rows": 1000, "data_bytes": 300000},
+        ]
+        # 200 bytes a row on average
+        assert batch_size_from_manifest(parts, 200000, 50000) == 1000
+        assert batch_size_from_manifest(parts, 10000, 50000) == 100
+        assert batch_size_from_manifest(parts, 10**9, 50000) == 5000
+        # manifests from before data_bytes was recorded keep the fixed batch size
+        assert batch_size_from_manifest([{"rows": 1000}], 200000, 50000) == 50000
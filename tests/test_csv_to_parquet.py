@@ -1,4 +1,8 @@
+import hashlib
+import json
 import os
+import polars as pl
+import pytest
 import shutil
 
 from pytest_mock import MockerFixture
@@ -25,6 +29,14 @@ class TestCsvToParquet:
                 "00007.parquet",
             ]
         )
+        metrics = results.pop("metrics")
+        assert metrics["stage"] == "csv_to_parquet"
+        assert metrics["rows"] == 300003
+        assert metrics["batches"] == 7
+        assert metrics["bytes_read"] == os.path.getsize(test_dir / "1.csv")
+        assert metrics["bytes_written"] == sum(
+            os.path.getsize(test_dir / "1_pqs" / f) for f in parquet_files
+        )
         assert results == {
             "statusCode": 200,
             "body": '"done converting!"',
@@ -37,3 +49,127 @@ class TestCsvToParquet:
                 }
             ],
         }
+
+    @pytest.mark.parametrize("engine", ["pandas", "pyarrow", "polars"])
+    def test_csv_engines(self, mocker: MockerFixture, tmp_path, engine):
+        mocker.patch.dict(os.environ, {"CSV_ENGINE": engine, "BATCH_SIZE": "2"})
+        test_dir = tmp_path / "test_files"
+        test_dir.mkdir()
+        (test_dir / "2.csv").write_bytes(
+            b'uid,app_date\r\nA1,20241201\r\n\r\nA2,""\r\nA3,\r\nA4,"multi\nline"\r\n'
+        )
+        split_csv_into_parquet(bucket=str(tmp_path), key="test_files/2.csv")
+        parquet_files = sorted(os.listdir(test_dir / "2_pqs"))
+        assert parquet_files == ["00001.parquet", "00002.parquet"]
+        df = pl.read_parquet(test_dir / "2_pqs")
+        assert df.schema == {"uid": pl.String, "app_date": pl.String}
+        assert df.to_dict(as_series=False) == {
+            "uid": ["A1", "A2", "A3", "A4"],
+            "app_date": ["20241201", "", "", "multi\nline"],
+        }
+        manifest = json.loads((test_dir / "2_manifest.json").read_text())
+        assert (
+            manifest["csv_digest"]
+            == hashlib.sha256((test_dir / "2.csv").read_bytes()).hexdigest()
+        )
+        assert [(p["key"], p["rows"]) for p in manifest["parts"]] == [
+            ("test_files/2_pqs/00001.parquet", 2),
+            ("test_files/2_pqs/00002.parquet", 2),
+        ]
+
+    def test_ragged_rows(self, mocker: MockerFixture, tmp_path):
+        # rows with too few fields are padded with empty strings by every engine, the same as pandas always has
+        mocker.patch.dict(os.environ, {"BATCH_SIZE": "3", "CSV_BLOCK_SIZE": "64"})
+        test_dir = tmp_path / "test_files"
+        test_dir.mkdir()
+        rows = [f'A{i},"x,{i}",20241201' for i in range(20)]
+        rows[3], rows[4], rows[11], rows[19] = "A3,y", "", "A11", "A19,z"
+        (test_dir / "5.csv").write_text("uid,name,app_date\n" + "\n".join(rows) + "\n")
+        digests = {}
+        for engine in ["pandas", "pyarrow", "polars"]:
+            mocker.patch.dict(os.environ, {"CSV_ENGINE": engine})
+            split_csv_into_parquet(bucket=str(tmp_path), key="test_files/5.csv")
+            manifest = json.loads((test_dir / "5_manifest.json").read_text())
+            digests[engine] = [part["digest"] for part in manifest["parts"]]
+        assert digests["pyarrow"] == digests["pandas"]
+        assert digests["polars"] == digests["pandas"]
+        df = pl.read_parquet(test_dir / "5_pqs")
+        assert df.height == 19
+        assert df.row(3) == ("A3", "y", "")
+        assert df.row(10) == ("A11", "", "")
+
+    def test_multiline_values(self, mocker: MockerFixture, tmp_path):
+        # quoted values with newlines in them, long enough that reader blocks start and end inside them
+        mocker.patch.dict(os.environ, {"BATCH_SIZE": "4", "CSV_BLOCK_SIZE": "64"})
+        test_dir = tmp_path / "test_files"
+        test_dir.mkdir()
+        values = ["line\n" * i + "end" for i in range(8)]
+        rows = [f'A{i},"{value}",20241201' for i, value in enumerate(values)]
+        (test_dir / "6.csv").write_text("uid,name,app_date\n" + "\n".join(rows) + "\n")
+        digests = {}
+        for engine in ["pandas", "pyarrow", "polars"]:
+            mocker.patch.dict(os.environ, {"CSV_ENGINE": engine})
+            split_csv_into_parquet(bucket=str(tmp_path), key="test_files/6.csv")
+            manifest = json.loads((test_dir / "6_manifest.json").read_text())
+            digests[engine] = [part["digest"] for part in manifest["parts"]]
+        assert digests["pyarrow"] == digests["pandas"]
+        assert digests["polars"] == digests["pandas"]
+        df = pl.read_parquet(test_dir / "6_pqs")
+        assert df.height == 8
+        assert df["name"].to_list() == values
+
+    def test_duplicate_header(self, mocker: MockerFixture, tmp_path):
+        test_dir = tmp_path / "test_files"
+        test_dir.mkdir()
+        (test_dir / "7.csv").write_bytes(b"uid,app_date,uid\nA1,20241201,A2\n")
+        # pandas renames the repeated column, pyarrow would drop one of them so it refuses the upload
+        split_csv_into_parquet(bucket=str(tmp_path), key="test_files/7.csv")
+        df = pl.read_parquet(test_dir / "7_pqs")
+        assert df.row(0, named=True) == {
+            "uid": "A1",
+            "app_date": "20241201",
+            "uid.1": "A2",
+        }
+        mocker.patch.dict(os.environ, {"CSV_ENGINE": "pyarrow"})
+        with pytest.raises(ValueError, match="Duplicate column names"):
+            split_csv_into_parquet(bucket=str(tmp_path), key="test_files/7.csv")
+
+    def test_failed_upload_fails_job(self, mocker: MockerFixture, tmp_path):
+        mocker.patch.dict(os.environ, {"BATCH_SIZE": "1", "MAX_IN_FLIGHT": "2"})
+        test_dir = tmp_path / "test_files"
+        test_dir.mkdir()
+        (test_dir / "3.csv").write_bytes(b"uid\nA1\nA2\nA3\nA4\nA5\n")
+
+        def fail_second_part(buffer, bucket, parquet_file):
+            if parquet_file.endswith("00002.parquet"):
+                raise IOError("upload failed")
+
+        mocker.patch(
+            "sbl_validation_processor.csv_to_parquet.write_parquet",
+            side_effect=fail_second_part,
+        )
+        with pytest.raises(IOError):
+            split_csv_into_parquet(bucket=str(tmp_path), key="test_files/3.csv")
+
+    @pytest.mark.parametrize("engine", ["pandas", "pyarrow", "polars"])
+    def test_batch_target_bytes(self, mocker: MockerFixture, tmp_path, engine):
+        mocker.patch.dict(
+            os.environ,
+            {
+                "CSV_ENGINE": engine,
+                "BATCH_TARGET_BYTES": "100000",
+                "BATCH_MIN_ROWS": "100",
+                "CSV_BLOCK_SIZE": "65536",
+            },
+        )
+        test_dir = tmp_path / "test_files"
+        test_dir.mkdir()
+        narrow = "".join(f"A{i},20241201\n" for i in range(5000))
+        wide = "".join(f"B{i},{'x' * 200}\n" for i in range(5000))
+        (test_dir / "4.csv").write_text("uid,app_date\n" + narrow + wide)
+        split_csv_into_parquet(bucket=str(tmp_path), key="test_files/4.csv")
+        parts = json.loads((test_dir / "4_manifest.json").read_text())["parts"]
+        assert sum(part["rows"] for part in parts) == 10000
+        # every part but the last is cut close to the target, so wide rows make for fewer rows per part
+        assert all(80000 < part["data_bytes"] < 120000 for part in parts[:-1]), parts
+        assert parts[0]["rows"] > parts[-2]["rows"] * 5
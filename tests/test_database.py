@@ -0,0 +1,49 @@
+import json
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor import database
+
+
+class TestDatabase:
+
+    def test_engine_and_secret_are_cached(self, mocker: MockerFixture):
+        database.reset_engines()
+        mocker.patch.dict(
+            "os.environ", {"ENV": "S3", "DB_SECRET": "db-secret", "DB_POOL_SIZE": "3"}
+        )
+        secrets_client = mocker.patch(
+            "sbl_validation_processor.database.get_client"
+        ).return_value
+        secrets_client.get_secret_value.return_value = {
+            "SecretString": json.dumps(
+                {
+                    "username": "user",
+                    "password": "p@ss/word",
+                    "host": "localhost",
+                    "database": "filing",
+                }
+            )
+        }
+        timings_before = database.get_timings()
+
+        engine = database.get_engine()
+        assert database.get_engine() is engine
+        assert engine.echo is False
+        assert engine.pool.size() == 3
+        assert engine.url.password == "p@ss/word"
+        assert secrets_client.get_secret_value.call_count == 1
+
+        timings = database.get_timings()
+        assert (
+            timings["engine_create_count"] - timings_before["engine_create_count"] == 1
+        )
+        assert timings["engine_cache_hits"] - timings_before["engine_cache_hits"] == 1
+        assert timings["secret_cache_hits"] - timings_before["secret_cache_hits"] == 1
+
+        mocker.patch.dict("os.environ", {"SECRET_TTL_SECONDS": "0"})
+        database._secrets.clear()
+        database.get_secret("db-secret")
+        database.get_secret("db-secret")
+        assert secrets_client.get_secret_value.call_count == 3
+        database.reset_engines()
@@ -0,0 +1,68 @@
+import os
+import polars as pl
+import pytest
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor.findings_format import (
+    LONG_SCHEMA,
+    get_findings_format,
+    get_partitioned_parts,
+    partition_folder,
+    scan_long_findings,
+    to_long,
+)
+from sbl_validation_processor.parquet_validator import write_findings
+from sbl_validation_processor.storage import get_storage
+
+
+class TestFindingsFormat:
+
+    def test_get_findings_format(self, mocker: MockerFixture):
+        assert get_findings_format() == "wide"
+        mocker.patch.dict(os.environ, {"FINDINGS_FORMAT": "long"})
+        assert get_findings_format() == "long"
+        mocker.patch.dict(os.environ, {"FINDINGS_FORMAT": "tall"})
+        with pytest.raises(ValueError):
+            get_findings_format()
+
+    def test_long_round_trip(self, tmp_path):
+        res_dir = tmp_path / "2024/123456789TESTBANK01/1_res"
+        res_dir.mkdir(parents=True)
+        wide = []
+        for i, file in enumerate(sorted(os.listdir("tests/test_files/1_res")), 1):
+            df = pl.read_parquet(f"tests/test_files/1_res/{file}").head(20000)
+            wide.append(df)
+            long = to_long(df)
+            assert long.schema == pl.Schema(LONG_SCHEMA)
+            long.write_parquet(res_dir / f"{i:05}.parquet")
+        expected = pl.concat(wide, how="diagonal")
+
+        lf = scan_long_findings(str(tmp_path), "2024/123456789TESTBANK01/1_res/")
+        assert lf.collect().equals(expected.select(lf.collect_schema().names()))
+        # filters on a finding's columns are pushed down into the scan
+        assert "SELECTION" in (
+            lf.filter(pl.col("validation_id") == "E3000").explain().split("\n")[-1]
+        )
+
+    def test_no_findings(self):
+        assert to_long(pl.DataFrame()).schema == pl.Schema(LONG_SCHEMA)
+
+    def test_partitioned_layout(self, mocker: MockerFixture, tmp_path):
+        mocker.patch.dict(os.environ, {"FINDINGS_LAYOUT": "partitioned"})
+        df = pl.read_parquet("tests/test_files/1_res/00002.parquet").head(20000)
+        written = write_findings(df, str(tmp_path), "LEI/1_res/00002.parquet")
+        validation_ids = sorted(df["validation_id"].unique())
+        assert written == [
+            f"LEI/1_res/validation_id={validation_id}/00002.parquet"
+            for validation_id in validation_ids
+        ]
+        assert partition_folder(written[0]) == f"validation_id={validation_ids[0]}/"
+        assert partition_folder("LEI/1_res/00002.parquet") == ""
+
+        parts = get_storage().list_prefix(str(tmp_path), "LEI/1_res/")
+        parts_by_id = get_partitioned_parts(parts)
+        assert sorted(parts_by_id) == validation_ids
+        for validation_id, id_parts in parts_by_id.items():
+            part = pl.read_parquet(tmp_path / id_parts[0].key)
+            assert part.equals(df.filter(pl.col("validation_id") == validation_id))
@@ -0,0 +1,50 @@
+import polars as pl
+import pytest
+
+from unittest.mock import MagicMock
+
+from sbl_validation_processor.findings_loader import FindingsBulkLoader
+
+
+class TestFindingsBulkLoader:
+
+    def test_batches_are_copied_and_committed_once(self):
+        engine = MagicMock()
+        connection = engine.raw_connection.return_value
+        cursor = connection.cursor.return_value.__enter__.return_value
+        copied = []
+        cursor.copy_expert.side_effect = lambda sql, f: copied.append((sql, f.read()))
+
+        with FindingsBulkLoader(engine) as loader:
+            loader.submit(pl.DataFrame({"validation_id": ["E0001"], "value_1": [""]}))
+            loader.submit(pl.DataFrame({"validation_id": ["E0002"], "value_1": [None]}))
+
+        assert copied == [
+            (
+                'COPY findings ("validation_id", "value_1") FROM STDIN WITH (FORMAT csv)',
+                b'E0001,""\n',
+            ),
+            (
+                'COPY findings ("validation_id", "value_1") FROM STDIN WITH (FORMAT csv)',
+                b"E0002,\n",
+            ),
+        ]
+        assert loader.row_count == 2
+        connection.commit.assert_called_once()
+        connection.rollback.assert_not_called()
+        connection.close.assert_called_once()
+
+    def test_failed_copy_rolls_back(self):
+        engine = MagicMock()
+        connection = engine.raw_connection.return_value
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.copy_expert.side_effect = RuntimeError("copy failed")
+
+        with pytest.raises(RuntimeError):
+            with FindingsBulkLoader(engine) as loader:
+                loader.submit(pl.DataFrame({"validation_id": ["E0001"]}))
+                loader.submit(pl.DataFrame({"validation_id": ["E0002"]}))
+
+        connection.commit.assert_not_called()
+        connection.rollback.assert_called_once()
+        connection.close.assert_called_once()
@@ -0,0 +1,58 @@
+import os
+import polars as pl
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor.csv_to_parquet import split_csv_into_parquet
+from sbl_validation_processor.fused_pipeline import run_fused, should_fuse
+from sbl_validation_processor.parquet_validator import validate_parquets
+from tests.benchmarks.sbl_generator import generate_sbl_csv
+
+
+def read_findings(res_dir):
+    return pl.concat(
+        [pl.read_parquet(f) for f in sorted(res_dir.iterdir())], how="diagonal"
+    )
+
+
+class TestFusedPipeline:
+
+    def test_should_fuse(self, mocker: MockerFixture, tmp_path):
+        size = generate_sbl_csv(tmp_path / "1.csv", 100)
+        assert not should_fuse(str(tmp_path), "1.csv")
+        mocker.patch.dict(os.environ, {"FUSED_MAX_BYTES": str(size)})
+        assert should_fuse(str(tmp_path), "1.csv")
+        mocker.patch.dict(os.environ, {"FUSED_MAX_BYTES": str(size - 1)})
+        assert not should_fuse(str(tmp_path), "1.csv")
+
+    def test_fused_matches_split(self, mocker: MockerFixture, tmp_path):
+        aggregate = mocker.patch(
+            "sbl_validation_processor.results_aggregator.aggregate_validation_results"
+        )
+        mocker.patch.dict(os.environ, {"BATCH_SIZE": "500"})
+        lei_dir = tmp_path / "2024" / "123456789TESTBANK01"
+        lei_dir.mkdir(parents=True)
+        generate_sbl_csv(lei_dir / "1.csv", 2000, 0.2, 0.02)
+        key = "2024/123456789TESTBANK01/1.csv"
+
+        split_csv_into_parquet(str(tmp_path), key)
+        split = validate_parquets(str(tmp_path), "2024/123456789TESTBANK01/1_pqs/")
+        split_findings = read_findings(lei_dir / "1_res")
+        split_summary = (lei_dir / "1_summary.json").read_text()
+        for path in [lei_dir / "1_res", lei_dir / "1_pqs"]:
+            for f in path.iterdir():
+                f.unlink()
+            path.rmdir()
+        (lei_dir / "1_summary.json").unlink()
+
+        fused = run_fused(str(tmp_path), key)
+        assert not (lei_dir / "1_pqs").exists()
+        assert fused["Records"] == split["Records"]
+        assert read_findings(lei_dir / "1_res").equals(split_findings)
+        assert (lei_dir / "1_summary.json").read_text() == split_summary
+        aggregate.assert_called_once_with(
+            str(tmp_path),
+            "2024/123456789TESTBANK01/1_res/",
+            results=None,
+            results_ref=split["Records"][0]["results_ref"],
+        )
@@ -0,0 +1,59 @@
+import pytest
+
+from sbl_validation_processor.import_profile import (
+    cost_by_package,
+    imported_packages,
+    parse_importtime,
+    profile_imports,
+    total_us,
+)
+
+# packages an entry point must not load at import time.  The csv lambda needs pyarrow and boto3 for every
+# upload, the validator and aggregator lambdas import their work (and with it polars, the validator and the
+# db packages) on the first event.  Import time budgets are benchmarks, see
+# tests/benchmarks/test_import_benchmarks.py
+DEFERRED = {
+    "pandas",
+    "polars",
+    "sqlalchemy",
+    "pydantic",
+    "regtech_data_validator",
+    "sbl_filing_api",
+}
+ENTRY_POINT_DEFERRED = [
+    ("sbl_validation_processor.lambda_csv_to_parquet.lambda_function", DEFERRED),
+    (
+        "sbl_validation_processor.lambda_parquet_validator.lambda_function",
+        DEFERRED | {"boto3", "pyarrow"},
+    ),
+    (
+        "sbl_validation_processor.lambda_validation_aggregator.lambda_function",
+        DEFERRED | {"boto3", "pyarrow"},
+    ),
+]
+
+
+class TestImportProfile:
+
+    def test_parse_importtime(self):
+        timings = parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     polars.config\n"
+            "import time:       300 |        420 |   polars\n"
+            "import time:        80 |        500 | sbl_validation_processor.storage\n"
+        )
+        assert [(t.module, t.depth) for t in timings] == [
+            ("polars.config", 2),
+            ("polars", 1),
+            ("sbl_validation_processor.storage", 0),
+        ]
+        assert cost_by_package(timings) == {
+            "polars": 420,
+            "sbl_validation_processor": 80,
+        }
+        assert total_us(timings, "sbl_validation_processor.storage") == 500
+
+    @pytest.mark.parametrize("module,deferred", ENTRY_POINT_DEFERRED)
+    def test_entry_point_defers_imports(self, module, deferred):
+        timings = profile_imports(module)
+        assert imported_packages(timings).isdisjoint(deferred), cost_by_package(timings)
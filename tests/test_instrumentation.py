@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+import pytest
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor import instrumentation
+
+
+def stage_lines(caplog):
+    return [
+        json.loads(record.message)
+        for record in caplog.records
+        if record.message.startswith('{"metric_type": "stage"')
+    ]
+
+
+class TestInstrumentation:
+
+    def test_stage_summary(self, caplog):
+        caplog.set_level(logging.INFO)
+        with instrumentation.stage("split", engine="pyarrow") as metrics:
+            instrumentation.add("rows", 10)
+            instrumentation.add("bytes_read", 100)
+            with instrumentation.timer("collect"):
+                pass
+            with instrumentation.timer("collect"):
+                pass
+            metrics.batch(10, 0.5)
+        # outside a stage these do nothing
+        instrumentation.add("rows", 5)
+        with instrumentation.timer("collect"):
+            pass
+
+        summary = metrics.summary()
+        assert summary["stage"] == "split"
+        assert summary["engine"] == "pyarrow"
+        assert summary["status"] == "ok"
+        assert summary["rows"] == 10
+        assert summary["batches"] == 1
+        assert summary["bytes_read"] == 100
+        assert summary["process_peak_rss_bytes"] > 0
+        assert summary["timings"]["collect"]["count"] == 2
+        assert [line["stage"] for line in stage_lines(caplog)] == ["split"]
+
+    def test_failed_stage(self, caplog):
+        caplog.set_level(logging.INFO)
+        with pytest.raises(ValueError):
+            with instrumentation.stage("validate"):
+                raise ValueError("bad file")
+        assert stage_lines(caplog)[0]["status"] == "failed"
+
+    def test_emf_and_prometheus(self, mocker: MockerFixture, tmp_path, capsys):
+        prom_file = tmp_path / "validate.prom"
+        mocker.patch.dict(
+            os.environ,
+            {
+                "METRICS_FORMAT": "emf,prometheus",
+                "METRICS_PROMETHEUS_FILE": str(prom_file),
+            },
+        )
+        with instrumentation.stage("validate") as metrics:
+            metrics.add("rows", 3)
+            with metrics.timer("db_commit"):
+                pass
+
+        emf = json.loads(capsys.readouterr().out)
+        assert emf["stage"] == "validate"
+        assert emf["rows"] == 3
+        assert "db_commit_seconds" in emf
+        assert {"Name": "rows", "Unit": "Count"} in emf["_aws"]["CloudWatchMetrics"][0][
+            "Metrics"
+        ]
+        assert (
+            'sbl_validation_rows{stage="validate",status="ok"} 3'
+            in prom_file.read_text().splitlines()
+        )
+
+    def test_unknown_format(self, mocker: MockerFixture):
+        mocker.patch.dict(os.environ, {"METRICS_FORMAT": "statsd"})
+        with pytest.raises(ValueError):
+            instrumentation.get_metrics_formats()
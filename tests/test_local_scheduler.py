@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+from sbl_validation_processor.local_scheduler import LocalScheduler
+
+
+class TestLocalScheduler:
+
+    def test_chains_stages_and_dedupes(self, tmp_path):
+        upload = tmp_path / "1.csv"
+        upload.write_text("uid\n")
+        calls = []
+        release = threading.Event()
+
+        def split(key):
+            release.wait(5)
+            calls.append(("split", key))
+            return (f"{key}_pqs/",)
+
+        def validate(key):
+            calls.append(("validate", key))
+            return (key.replace("_pqs", "_res"), {"total_records": 0})
+
+        def aggregate(key, results):
+            calls.append(("aggregate", key, results))
+
+        scheduler = LocalScheduler(
+            [("split", split), ("validate", validate), ("aggregate", aggregate)]
+        )
+        assert scheduler.submit(str(upload), "1")
+        # the same event again, e.g. created and closed for the same write
+        assert not scheduler.submit(str(upload), "1")
+        release.set()
+        assert scheduler.join(timeout=5)
+        assert calls == [
+            ("split", "1"),
+            ("validate", "1_pqs/"),
+            ("aggregate", "1_res/", {"total_records": 0}),
+        ]
+
+        # a rewritten upload runs again
+        os.utime(upload, ns=(0, upload.stat().st_mtime_ns + 1))
+        assert scheduler.submit(str(upload), "1")
+        scheduler.shutdown()
+        stats = scheduler.stats()
+        assert stats["aggregate"]["completed"] == 2
+        assert stats["split"]["queued"] == 0
+        assert set(stats["split"]["run_seconds"]) == {"p50", "p95", "max"}
+
+    def test_forgets_finished_uploads(self, tmp_path):
+        upload = tmp_path / "1.csv"
+        upload.write_text("uid\n")
+        calls = []
+
+        def split(key):
+            calls.append(key)
+            if key == "fail":
+                raise ValueError("bad upload")
+
+        scheduler = LocalScheduler([("split", split)])
+        for key in ["1", "fail"]:
+            assert scheduler.submit(str(upload), key)
+            assert scheduler.join(timeout=5)
+        assert not scheduler._seen
+        # the same version of the file again runs again once the first run is done
+        assert scheduler.submit(str(upload), "1")
+        scheduler.shutdown()
+        assert calls == ["1", "fail", "1"]
+
+    def test_concurrency_and_failures(self, tmp_path):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def split(key):
+            with lock:
+                running.append(key)
+                peak.append(len(running))
+            time.sleep(0.2)
+            with lock:
+                running.remove(key)
+            if key == "bad":
+                raise ValueError("bad upload")
+            return (key,)
+
+        validated = []
+        scheduler = LocalScheduler(
+            [("split", split), ("validate", validated.append)], workers=2
+        )
+        for key in ["a", "b", "bad"]:
+            (tmp_path / key).write_text("uid\n")
+            scheduler.submit(str(tmp_path / key), key)
+        scheduler.shutdown()
+        # a slow upload doesn't block the next one, but no more than 2 run at once
+        assert max(peak) == 2
+        assert sorted(validated) == ["a", "b"]
+        assert scheduler.stats()["split"]["failed"] == 1
@@ -0,0 +1,39 @@
+import io
+import os
+import polars as pl
+import pyarrow.parquet as pq
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor.parquet_profile import write_frame
+
+
+class TestParquetProfile:
+
+    def test_default_profile(self):
+        df = pl.DataFrame(
+            {"validation_id": ["E0001", "W0002"] * 150000, "row": range(300000)}
+        )
+        buffer = io.BytesIO()
+        write_frame(df, buffer)
+        metadata = pq.ParquetFile(buffer).metadata
+        assert metadata.num_row_groups == 3
+        column = metadata.row_group(0).column(0)
+        assert column.compression == "ZSTD"
+        assert "RLE_DICTIONARY" in column.encodings
+        assert column.statistics.min == "E0001"
+
+    def test_profile_from_env(self, mocker: MockerFixture):
+        mocker.patch.dict(
+            os.environ,
+            {
+                "PARQUET_COMPRESSION": "snappy",
+                "PARQUET_ROW_GROUP_SIZE": "",
+                "PARQUET_STATISTICS": "false",
+            },
+        )
+        buffer = io.BytesIO()
+        write_frame(pl.DataFrame({"validation_id": ["E0001"] * 300000}), buffer)
+        column = pq.ParquetFile(buffer).metadata.row_group(0).column(0)
+        assert column.compression == "SNAPPY"
+        assert not column.is_stats_set
@@ -1,9 +1,26 @@
+import json
 import os
+import polars as pl
+import pytest
 import shutil
 
 from pytest_mock import MockerFixture
 
-from sbl_validation_processor.parquet_validator import validate_parquets
+from types import SimpleNamespace
+
+from regtech_data_validator.validation_results import ValidationPhase
+
+from sbl_validation_processor.parquet_validator import (
+    combine_results,
+    get_part_row_counts,
+    plan_partitions,
+    validate_partition,
+    validate_parquets,
+)
+from sbl_validation_processor.validation_summary import (
+    ValidationSummary,
+    load_results,
+)
 
 
 class TestValidateParquets:
@@ -22,6 +39,40 @@ class TestValidateParquets:
                 "00002.parquet",
             ]
         )
+        summary_file = tmp_path / "123456789TESTBANK01/1_summary.json"
+        summary = json.loads(summary_file.read_text())
+        results_ref = results["Records"][0]["results_ref"]
+        assert results_ref["key"] == "123456789TESTBANK01/1_summary.json"
+        assert load_results(str(tmp_path), results_ref) == summary["results"]
+        assert sum(v["findings_count"] for v in summary["validations"]) == 1300003
+        # the results the event used to carry inline, now read through its results_ref
+        assert summary["results"] == {
+            "total_records": 300003,
+            "syntax_errors": {
+                "single_field_count": 0,
+                "multi_field_count": 0,
+                "register_count": 0,
+                "total_count": 0,
+            },
+            "logic_errors": {
+                "single_field_count": 2500025,
+                "multi_field_count": 9100091,
+                "register_count": 300003,
+                "total_count": 11900119,
+            },
+            "logic_warnings": {
+                "single_field_count": 2700027,
+                "multi_field_count": 300003,
+                "register_count": 0,
+                "total_count": 3000030,
+            },
+        }
+        summary_file.write_text(json.dumps({**summary, "validations": []}))
+        with pytest.raises(ValueError):
+            load_results(str(tmp_path), results_ref)
+        metrics = results.pop("metrics")
+        assert metrics["stage"] == "validate"
+        assert metrics["rows"] == 300003
         assert results == {
             "statusCode": 200,
             "body": '"done validating!"',
@@ -31,27 +82,239 @@ class TestValidateParquets:
                         "bucket": {"name": str(tmp_path)},
                         "object": {"key": "123456789TESTBANK01/1_res/"},
                     },
-                    "results": {
-                        "total_records": 300003,
-                        "syntax_errors": {
-                            "single_field_count": 0,
-                            "multi_field_count": 0,
-                            "register_count": 0,
-                            "total_count": 0,
-                        },
-                        "logic_errors": {
-                            "single_field_count": 2500025,
-                            "multi_field_count": 9100091,
-                            "register_count": 300003,
-                            "total_count": 11900119,
-                        },
-                        "logic_warnings": {
-                            "single_field_count": 2700027,
-                            "multi_field_count": 300003,
-                            "register_count": 0,
-                            "total_count": 3000030,
-                        },
-                    },
+                    "results_ref": results_ref,
                 }
             ],
         }
+
+    def test_summary_matches_combine_results(self):
+        def counts(single, multi, register):
+            return SimpleNamespace(
+                single_field_count=single,
+                multi_field_count=multi,
+                register_count=register,
+                total_count=single + multi + register,
+            )
+
+        findings = pl.DataFrame(
+            {
+                "validation_type": ["Error", "Error", "Warning"],
+                "validation_id": ["E0001", "E0001", "W0001"],
+            }
+        )
+        logic_results = [
+            SimpleNamespace(
+                phase=ValidationPhase.SYNTACTICAL,
+                is_valid=True,
+                record_count=10,
+                error_counts=counts(0, 0, 0),
+                warning_counts=counts(0, 0, 0),
+            ),
+            SimpleNamespace(
+                phase=ValidationPhase.LOGICAL,
+                is_valid=False,
+                record_count=10,
+                error_counts=counts(2, 0, 0),
+                warning_counts=counts(0, 1, 0),
+            ),
+        ]
+        syntax_results = [
+            SimpleNamespace(
+                phase=ValidationPhase.SYNTACTICAL,
+                is_valid=False,
+                record_count=5,
+                error_counts=counts(3, 0, 0),
+                warning_counts=counts(0, 0, 0),
+            )
+        ]
+        for results in [logic_results, syntax_results]:
+            summary = ValidationSummary()
+            for validation_results in results:
+                summary.add(validation_results, findings)
+            assert summary.to_results() == combine_results(results)
+
+        assert summary.to_dict()["validations"] == [
+            {
+                "validation_id": "E0001",
+                "validation_type": "Error",
+                "phase": "Syntactical",
+                "findings_count": 2,
+            },
+            {
+                "validation_id": "W0001",
+                "validation_type": "Warning",
+                "phase": "Syntactical",
+                "findings_count": 1,
+            },
+        ]
+
+    def test_partitioned_validation_matches_single_pass(
+        self, mocker: MockerFixture, tmp_path
+    ):
+        shutil.copytree(
+            "tests/test_files/1_pqs", tmp_path / "123456789TESTBANK01/1_pqs"
+        )
+        single = validate_parquets(
+            bucket=str(tmp_path), key="123456789TESTBANK01/1_pqs/"
+        )
+        single_findings = pl.read_parquet(tmp_path / "123456789TESTBANK01/1_res/")
+        single_results = load_results(
+            str(tmp_path), single["Records"][0]["results_ref"]
+        )
+        shutil.rmtree(tmp_path / "123456789TESTBANK01/1_res")
+
+        mocker.patch.dict("os.environ", {"VALIDATION_WORKERS": "3"})
+        partitioned = validate_parquets(
+            bucket=str(tmp_path), key="123456789TESTBANK01/1_pqs/"
+        )
+        partitioned_files = sorted(os.listdir(tmp_path / "123456789TESTBANK01/1_res"))
+        assert partitioned_files[0] == "p000_00001.parquet"
+        assert all(f.startswith("p") for f in partitioned_files)
+        # the summaries can differ in field_count, a batch with nothing but register findings is written with
+        # all its field columns in a single pass and not at all by a partition
+        assert partitioned["Records"][0]["s3"] == single["Records"][0]["s3"]
+        assert (
+            load_results(str(tmp_path), partitioned["Records"][0]["results_ref"])
+            == single_results
+        )
+
+        register_findings = pl.read_parquet(
+            tmp_path / "123456789TESTBANK01/1_res/p000_00001.parquet"
+        )
+        assert register_findings.equals(
+            single_findings.filter(pl.col("scope") == "register").select(
+                register_findings.columns
+            )
+        )
+
+        # every finding, with the same row numbers, in whatever order the parts were written.  A side that
+        # never wrote a field_N column gets it as nulls
+        partitioned_findings = pl.concat(
+            [
+                pl.read_parquet(tmp_path / "123456789TESTBANK01/1_res" / f)
+                for f in partitioned_files
+            ],
+            how="diagonal",
+        )
+        columns = sorted(
+            set(single_findings.columns) | set(partitioned_findings.columns)
+        )
+
+        def normalized(findings):
+            return (
+                findings.with_columns(
+                    pl.lit(None, pl.String).alias(c)
+                    for c in columns
+                    if c not in findings.columns
+                )
+                .select(columns)
+                .sort(columns)
+            )
+
+        assert normalized(partitioned_findings).equals(normalized(single_findings))
+
+    def test_partition_rows_offset_to_file_rows(self, mocker: MockerFixture, tmp_path):
+        shutil.copytree(
+            "tests/test_files/1_pqs", tmp_path / "123456789TESTBANK01/1_pqs"
+        )
+        no_counts = SimpleNamespace(
+            single_field_count=0, multi_field_count=0, register_count=0, total_count=0
+        )
+
+        # a finding on every row, numbered from the start of the frame it was given as the validator does
+        def validate_every_row(lf, context, batch_size, max_errors):
+            total = lf.select(pl.len()).collect().item()
+            for start in range(0, total, batch_size):
+                df = lf.slice(start, batch_size).collect()
+                yield SimpleNamespace(
+                    phase=ValidationPhase.LOGICAL,
+                    is_valid=False,
+                    record_count=df.height,
+                    error_counts=no_counts,
+                    warning_counts=no_counts,
+                    findings=df.with_row_index("row", offset=start + 2).select(
+                        validation_type=pl.lit("Error"),
+                        validation_id=pl.lit("E0001"),
+                        row="row",
+                        unique_identifier="uid",
+                        scope=pl.lit("single-field"),
+                    ),
+                )
+
+        mocker.patch(
+            "sbl_validation_processor.parquet_validator.validate_lazy_frame",
+            side_effect=validate_every_row,
+        )
+        file_rows = (
+            pl.read_parquet(tmp_path / "123456789TESTBANK01/1_pqs/")
+            .with_row_index("row", offset=2)
+            .select("row", unique_identifier="uid")
+        )
+        part_row_counts = get_part_row_counts(
+            str(tmp_path), "123456789TESTBANK01/1_pqs/"
+        )
+        partitions = plan_partitions(part_row_counts, 3)
+        assert len(partitions) == 3
+        for partition, (row_offset, part_keys) in enumerate(partitions, start=1):
+            _, result_files = validate_partition(
+                str(tmp_path),
+                part_keys,
+                row_offset,
+                partition,
+                "123456789TESTBANK01",
+                "1",
+                "123456789TESTBANK01/1_res/",
+                50000,
+                1000000,
+            )
+            findings = pl.concat(
+                [pl.read_parquet(tmp_path / f) for f, _ in result_files]
+            )
+            assert findings.height == sum(
+                rows for part_key, rows in part_row_counts if part_key in part_keys
+            )
+            # the uids sit on the same rows of the file that a single pass over all of it would report
+            assert findings.select("row", "unique_identifier").equals(
+                file_rows.slice(row_offset, findings.height)
+            )
+
+    def test_partitioned_validation_caps_max_errors(
+        self, mocker: MockerFixture, tmp_path
+    ):
+        shutil.copytree(
+            "tests/test_files/1_pqs", tmp_path / "123456789TESTBANK01/1_pqs"
+        )
+        res_path = tmp_path / "123456789TESTBANK01/1_res"
+
+        def stored_findings():
+            return pl.concat(
+                [pl.read_parquet(res_path / f) for f in sorted(os.listdir(res_path))],
+                how="diagonal",
+            )
+
+        mocker.patch.dict("os.environ", {"VALIDATION_WORKERS": "3"})
+        uncapped = validate_parquets(
+            bucket=str(tmp_path), key="123456789TESTBANK01/1_pqs/"
+        )
+        uncapped_findings = stored_findings()
+        uncapped_results = load_results(
+            str(tmp_path), uncapped["Records"][0]["results_ref"]
+        )
+        shutil.rmtree(res_path)
+
+        max_errors = uncapped_findings.height // 2 + 1
+        mocker.patch.dict("os.environ", {"MAX_ERRORS": str(max_errors)})
+        capped = validate_parquets(
+            bucket=str(tmp_path), key="123456789TESTBANK01/1_pqs/"
+        )
+
+        assert stored_findings().equals(uncapped_findings.head(max_errors))
+        summary = json.loads(
+            (tmp_path / "123456789TESTBANK01/1_summary.json").read_text()
+        )
+        assert sum(v["findings_count"] for v in summary["validations"]) == max_errors
+        # the error and warning totals are still for every finding
+        assert (
+            load_results(str(tmp_path), capped["Records"][0]["results_ref"])
+            == uncapped_results
+        )
@@ -0,0 +1,35 @@
+import io
+
+from unittest.mock import MagicMock
+
+from sbl_validation_processor.ranged_reader import RangedS3Reader
+
+
+class TestRangedS3Reader:
+
+    def get_s3(self, data: bytes):
+        def get_object(Bucket, Key, Range):
+            start, end = Range.replace("bytes=", "").split("-")
+            return {"Body": io.BytesIO(data[int(start) : int(end) + 1])}
+
+        s3 = MagicMock()
+        s3.head_object.return_value = {"ContentLength": len(data)}
+        s3.get_object.side_effect = get_object
+        return s3
+
+    def test_read_in_order(self):
+        data = b"".join(f"row{i},value{i}\n".encode() for i in range(1000))
+        s3 = self.get_s3(data)
+        reader = RangedS3Reader(s3, "bucket", "key.csv", part_size=100, parallelism=4)
+        assert reader.read() == data
+        assert s3.get_object.call_count == len(range(0, len(data), 100))
+
+    def test_chunks_end_on_rows(self):
+        data = b"".join(f"row{i},value{i}\n".encode() for i in range(1000)) + b"last"
+        reader = RangedS3Reader(
+            self.get_s3(data), "bucket", "key.csv", part_size=64, parallelism=3
+        )
+        chunks = list(reader.iter_chunks())
+        assert b"".join(chunks) == data
+        assert all(chunk.endswith(b"\n") for chunk in chunks[:-1])
+        assert chunks[-1] == b"last"
@@ -0,0 +1,208 @@
+import os
+import polars as pl
+import shutil
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor.parquet_validator import validate_parquets, write_findings
+from sbl_validation_processor.result_cache import (
+    evict,
+    get_cached,
+    put_cached,
+    restore_cached,
+    write_manifest,
+)
+from sbl_validation_processor.storage import get_storage
+from sbl_validation_processor.validation_summary import ValidationSummary
+
+
+class TestResultCache:
+
+    def test_reupload_reuses_results(self, mocker: MockerFixture, tmp_path):
+        mocker.patch.dict(
+            os.environ, {"RESULT_CACHE": "true", "VALIDATOR_VERSION": "test"}
+        )
+        for submission in ["1", "2"]:
+            pqs_path = f"123456789TESTBANK01/{submission}_pqs/"
+            shutil.copytree("tests/test_files/1_pqs", tmp_path / pqs_path)
+            write_manifest(str(tmp_path), pqs_path, "csv-digest", [])
+
+        first = validate_parquets(
+            bucket=str(tmp_path), key="123456789TESTBANK01/1_pqs/"
+        )
+        validate = mocker.patch(
+            "sbl_validation_processor.parquet_validator.validate_lazy_frame"
+        )
+        second = validate_parquets(
+            bucket=str(tmp_path), key="123456789TESTBANK01/2_pqs/"
+        )
+
+        validate.assert_not_called()
+        assert (
+            second["Records"][0]["results_ref"]["digest"]
+            == first["Records"][0]["results_ref"]["digest"]
+        )
+        first_findings = pl.read_parquet(tmp_path / "123456789TESTBANK01/1_res/")
+        second_findings = pl.read_parquet(tmp_path / "123456789TESTBANK01/2_res/")
+        assert second_findings["submission_id"].unique().to_list() == ["2"]
+        assert second_findings.drop("submission_id").equals(
+            first_findings.drop("submission_id")
+        )
+        assert (tmp_path / "123456789TESTBANK01/2_summary.json").exists()
+
+    def test_evicted_entry_revalidates(self, mocker: MockerFixture, tmp_path):
+        mocker.patch.dict(
+            os.environ, {"RESULT_CACHE": "true", "VALIDATOR_VERSION": "test"}
+        )
+        for submission in ["1", "2"]:
+            pqs_path = f"123456789TESTBANK01/{submission}_pqs/"
+            shutil.copytree("tests/test_files/1_pqs", tmp_path / pqs_path)
+            write_manifest(str(tmp_path), pqs_path, "csv-digest", [])
+
+        first = validate_parquets(
+            bucket=str(tmp_path), key="123456789TESTBANK01/1_pqs/"
+        )
+
+        def evict_then_restore(bucket, key, *args):
+            # evicted between get_cached and restore_cached, entry.json is still there
+            for cached_file in (tmp_path / "validation_cache" / key).glob("*.parquet"):
+                os.remove(cached_file)
+            return restore_cached(bucket, key, *args)
+
+        mocker.patch(
+            "sbl_validation_processor.parquet_validator.restore_cached",
+            side_effect=evict_then_restore,
+        )
+        second = validate_parquets(
+            bucket=str(tmp_path), key="123456789TESTBANK01/2_pqs/"
+        )
+
+        assert (
+            second["Records"][0]["results_ref"]["digest"]
+            == first["Records"][0]["results_ref"]["digest"]
+        )
+        second_findings = pl.read_parquet(tmp_path / "123456789TESTBANK01/2_res/")
+        assert second_findings["submission_id"].unique().to_list() == ["2"]
+
+    def test_restore_evicted_entry(self, mocker: MockerFixture, tmp_path):
+        storage = get_storage()
+        result_files = []
+        for pq_idx in [1, 2]:
+            result_file = f"LEI/1_res/{pq_idx:05}.parquet"
+            pl.DataFrame({"row": [pq_idx]}, schema={"row": pl.UInt32}).write_parquet(
+                tmp_path / "part.parquet"
+            )
+            storage.write_bytes(
+                str(tmp_path), result_file, (tmp_path / "part.parquet").read_bytes()
+            )
+            result_files.append((result_file, "Syntactical"))
+        put_cached(str(tmp_path), "key", ValidationSummary(), result_files)
+        entry = get_cached(str(tmp_path), "key")
+        entry_json = tmp_path / "validation_cache/key/entry.json"
+        os.utime(entry_json, (1000, 1000))
+
+        # a restore marks the entry as used
+        assert restore_cached(str(tmp_path), "key", entry, "LEI/2_res/", "2")
+        assert entry_json.stat().st_mtime > 1000
+
+        # the second part was evicted, so the first part's copy is removed and it's a miss
+        os.remove(tmp_path / "validation_cache/key/00002.parquet")
+        assert restore_cached(str(tmp_path), "key", entry, "LEI/3_res/", "3") is None
+        assert not (tmp_path / "LEI/3_res/00001.parquet").exists()
+
+    def test_restore_partitioned_partition(self, mocker: MockerFixture, tmp_path):
+        mocker.patch.dict(os.environ, {"FINDINGS_LAYOUT": "partitioned"})
+        findings = pl.DataFrame(
+            {
+                "validation_type": ["Error", "Error", "Warning"],
+                "validation_id": ["E0001", "E0001", "W0002"],
+                "row": [3, 4, 3],
+                "unique_identifier": ["A", "B", "A"],
+                "scope": ["single-field"] * 3,
+                "phase": ["Syntactical", "Syntactical", "Logical"],
+                "submission_id": ["1"] * 3,
+                "field_1": ["uid"] * 3,
+                "value_1": ["A", "B", "A"],
+            },
+            schema_overrides={"row": pl.UInt32},
+        )
+        result_files = [
+            (part_file, phase)
+            for pq_idx, phase in enumerate(["Syntactical", "Logical"], start=1)
+            for part_file in write_findings(
+                findings.filter(pl.col("phase") == phase),
+                str(tmp_path),
+                f"LEI/1_res/p002_{pq_idx:05}.parquet",
+            )
+        ]
+        assert [f for f, _ in result_files] == [
+            "LEI/1_res/validation_id=E0001/p002_00001.parquet",
+            "LEI/1_res/validation_id=W0002/p002_00002.parquet",
+        ]
+        summary = ValidationSummary()
+        put_cached(str(tmp_path), "key", summary, result_files, row_offset=0)
+
+        _, restored = restore_cached(
+            str(tmp_path),
+            "key",
+            get_cached(str(tmp_path), "key"),
+            "LEI/2_res/p003_",
+            "2",
+            row_offset=10,
+        )
+
+        # the same folders write_findings puts a partition's findings in, with the partition's name prefix
+        assert restored == [
+            ("LEI/2_res/validation_id=E0001/p003_00001.parquet", "Syntactical"),
+            ("LEI/2_res/validation_id=W0002/p003_00002.parquet", "Logical"),
+        ]
+        restored_findings = pl.read_parquet(tmp_path / "LEI/2_res/**/*.parquet")
+        assert restored_findings["submission_id"].unique().to_list() == ["2"]
+        assert restored_findings["row"].to_list() == [13, 14, 13]
+
+    def test_evict_by_age_and_size(self, mocker: MockerFixture, tmp_path):
+        storage = get_storage()
+
+        def cached_entries():
+            return sorted(
+                obj.key.split("/")[1]
+                for obj in storage.list_prefix(str(tmp_path), "validation_cache/")
+            )
+
+        for age, entry in enumerate(["c", "b", "a"]):
+            storage.write_bytes(
+                str(tmp_path), f"validation_cache/{entry}/entry.json", b"x" * 10
+            )
+            mtime = 1000 - age * 100
+            os.utime(tmp_path / f"validation_cache/{entry}/entry.json", (mtime, mtime))
+        mocker.patch(
+            "sbl_validation_processor.result_cache.time.time", return_value=1000
+        )
+
+        mocker.patch.dict(
+            os.environ,
+            {"RESULT_CACHE_MAX_AGE_SECONDS": "150", "RESULT_CACHE_MAX_BYTES": "100"},
+        )
+        evict(str(tmp_path))
+        assert cached_entries() == ["b", "c"]
+
+        mocker.patch.dict(os.environ, {"RESULT_CACHE_MAX_BYTES": "15"})
+        evict(str(tmp_path))
+        assert cached_entries() == ["c"]
+
+    def test_put_cached_samples_eviction(self, mocker: MockerFixture, tmp_path):
+        storage = get_storage()
+        storage.write_bytes(str(tmp_path), "1_res/00001.parquet", b"findings")
+        evict_mock = mocker.patch("sbl_validation_processor.result_cache.evict")
+        random_mock = mocker.patch(
+            "sbl_validation_processor.result_cache.random.random", return_value=0.5
+        )
+        mocker.patch.dict(os.environ, {"RESULT_CACHE_EVICT_RATE": "0.1"})
+        result_files = [("1_res/00001.parquet", "Syntactical")]
+
+        put_cached(str(tmp_path), "a", ValidationSummary(), result_files)
+        evict_mock.assert_not_called()
+
+        random_mock.return_value = 0.05
+        put_cached(str(tmp_path), "b", ValidationSummary(), result_files)
+        evict_mock.assert_called_once_with(str(tmp_path))
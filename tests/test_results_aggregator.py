@@ -1,12 +1,30 @@
 import os
+import polars as pl
+import pytest
 import shutil
 
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
 
 from pytest_mock import MockerFixture
 
 from sqlalchemy.orm import scoped_session
-from sbl_validation_processor.results_aggregator import aggregate_validation_results
+from sbl_validation_processor.parquet_validator import write_findings
+from sbl_validation_processor.findings_format import get_partitioned_parts
+from sbl_validation_processor.validation_summary import (
+    ValidationSummary,
+    write_summary,
+)
+from sbl_validation_processor.results_aggregator import (
+    PartitionedFindings,
+    aggregate_validation_results,
+    get_parquet_paths,
+    build_group_results,
+    build_group_results_by_loop,
+    GroupHeads,
+    write_report_stream,
+)
+from regtech_data_validator.data_formatters import df_to_download
 from sbl_filing_api.entities.models.dao import SubmissionState, SubmissionDAO
 
 
@@ -70,3 +88,201 @@ class TestResultsAggregator:
                 mock_submission.validation_results["logic_warnings"]["total_count"]
                 == 3000030
             )
+
+    def test_group_results_match_loop(self):
+        lf = pl.concat(
+            [
+                pl.scan_parquet(f"tests/test_files/1_res/{file}")
+                for file in sorted(os.listdir("tests/test_files/1_res"))
+            ],
+            how="diagonal",
+        )
+        for max_group_size in [1, 200]:
+            assert build_group_results(
+                lf, max_group_size
+            ) == build_group_results_by_loop(lf, max_group_size)
+
+    def test_partitioned_findings_match(self, mocker: MockerFixture, tmp_path):
+        mocker.patch.dict(
+            os.environ, {"FINDINGS_LAYOUT": "partitioned", "REPORT_BATCH_SIZE": "5000"}
+        )
+        # every column, so a batch whose columns don't line up with the header shows up
+        mocker.patch(
+            "sbl_validation_processor.results_aggregator.df_to_download",
+            side_effect=lambda df, *args: df.sort("validation_id", maintain_order=True)
+            .write_csv()
+            .encode(),
+        )
+        # register findings (one field) and multi field findings (up to 13)
+        frames = [
+            pl.read_parquet(f"tests/test_files/1_res/{file}").head(20000)
+            for file in sorted(os.listdir("tests/test_files/1_res"))
+        ]
+        lf = pl.concat([df.lazy() for df in frames], how="diagonal")
+        for i, df in enumerate(frames, 1):
+            write_findings(df, str(tmp_path), f"1_res/{i:05}.parquet")
+        partitions = PartitionedFindings(
+            str(tmp_path),
+            get_partitioned_parts(get_parquet_paths(str(tmp_path), "1_res/")),
+            False,
+            lf.collect_schema(),
+        )
+        assert build_group_results(lf, 200, partitions) == build_group_results(lf, 200)
+
+        group_counts = (
+            lf.group_by("validation_id").len().sort("validation_id").collect()
+        )
+        for report_file, report_partitions in [("1.csv", None), ("2.csv", partitions)]:
+            write_report_stream(
+                lf,
+                str(tmp_path),
+                report_file,
+                0,
+                40000,
+                10000000,
+                group_counts,
+                report_partitions,
+            )
+        report = (tmp_path / "1.csv").read_bytes().split(b"\n")
+        partitioned_report = (tmp_path / "2.csv").read_bytes().split(b"\n")
+        assert len(report) == len(partitioned_report) == 40002
+        mismatched = [
+            (line, partitioned_line)
+            for line, partitioned_line in zip(report, partitioned_report)
+            if line != partitioned_line
+        ]
+        assert mismatched[:3] == []
+
+    def test_report_group_heads_match(self, mocker: MockerFixture, tmp_path):
+        # a sample of every validation_id, in batches smaller than a group, so the biggest validation_ids are
+        # split into slices of their own and some of their groups span two slices
+        mocker.patch.dict(os.environ, {"REPORT_BATCH_SIZE": "50"})
+        lf = (
+            pl.concat(
+                [
+                    pl.scan_parquet("tests/test_files/1_res/00001.parquet").head(300),
+                    pl.scan_parquet(
+                        "tests/test_files/1_res/00002.parquet"
+                    ).gather_every(500),
+                ],
+                how="diagonal",
+            )
+            .collect()
+            .lazy()
+        )
+        group_heads = GroupHeads(60)
+        write_report_stream(
+            lf, str(tmp_path), "1.csv", 0, 2000, 10000000, group_heads=group_heads
+        )
+        assert group_heads.results() == build_group_results(lf, 60)
+
+    def test_long_findings_report_matches_wide(self, mocker: MockerFixture, tmp_path):
+        # every column, picked by name like the report does
+        mocker.patch(
+            "sbl_validation_processor.results_aggregator.df_to_download",
+            side_effect=lambda df, *args: df.select(sorted(df.columns))
+            .write_csv()
+            .encode(),
+        )
+        mock_submission = SubmissionDAO()
+        mock_submission.state = SubmissionState.VALIDATION_IN_PROGRESS
+        mock_db_session = MagicMock(spec=scoped_session)
+        mock_db_session.query.return_value.where.return_value.one.return_value = (
+            mock_submission
+        )
+        mock_get_db_session = MagicMock()
+        mock_get_db_session.__enter__.return_value = mock_db_session
+        mocker.patch(
+            "sbl_validation_processor.results_aggregator.get_db_session",
+            return_value=mock_get_db_session,
+        )
+        # the second part's field_2 to field_13 are all null, so its long part has no rows for them
+        frames = [
+            pl.read_parquet(f"tests/test_files/1_res/{file}").head(20000)
+            for file in sorted(os.listdir("tests/test_files/1_res"))
+        ]
+        no_counts = SimpleNamespace(
+            single_field_count=0, multi_field_count=0, register_count=0, total_count=0
+        )
+        reports = []
+        for submission, findings_format in [("1", "wide"), ("2", "long")]:
+            mocker.patch.dict(os.environ, {"FINDINGS_FORMAT": findings_format})
+            res_path = f"2025/123456789TESTBANK01/{submission}_res/"
+            summary = ValidationSummary()
+            for i, df in enumerate(frames, 1):
+                write_findings(df, str(tmp_path), f"{res_path}{i:05}.parquet")
+                summary.add(
+                    SimpleNamespace(
+                        phase="Logical",
+                        record_count=df.height,
+                        error_counts=no_counts,
+                        warning_counts=no_counts,
+                        is_valid=True,
+                    ),
+                    df,
+                )
+            write_summary(summary, str(tmp_path), res_path)
+            aggregate_validation_results(
+                bucket=str(tmp_path),
+                key=res_path,
+                results=summary.to_results(),
+            )
+            reports.append(
+                (tmp_path / f"2025/123456789TESTBANK01/{submission}_report.csv")
+                .read_bytes()
+                .split(b"\n")
+            )
+        wide_report, long_report = reports
+        assert wide_report[0] == long_report[0]
+        assert b"field_13" in wide_report[0]
+        assert len(wide_report) == len(long_report) == 40002
+        assert sorted(wide_report) == sorted(long_report)
+
+    def test_streamed_report_matches_report(self, mocker: MockerFixture, tmp_path):
+        mocker.patch.dict(os.environ, {"REPORT_BATCH_SIZE": "250000"})
+        lf = pl.concat(
+            [
+                pl.scan_parquet(f"tests/test_files/1_res/{file}")
+                for file in sorted(os.listdir("tests/test_files/1_res"))
+            ],
+            how="diagonal",
+        )
+        findings_count = write_report_stream(
+            lf, str(tmp_path), "1_report.csv", 3000030, 11900119, 10000000
+        )
+        streamed = (tmp_path / "1_report.csv").read_bytes().split(b"\n")
+        expected = df_to_download(lf.collect(), 3000030, 11900119, 10000000).split(
+            b"\n"
+        )
+        assert findings_count == 1300003
+        assert streamed[:2] == expected[:2]
+        assert sorted(streamed) == sorted(expected)
+
+    def test_results_loaded_lazily(self, mocker: MockerFixture, tmp_path):
+        load_results = mocker.patch(
+            "sbl_validation_processor.results_aggregator.load_results"
+        )
+        mock_submission = SubmissionDAO()
+        mock_submission.state = SubmissionState.SUBMISSION_ACCEPTED
+        mock_db_session = MagicMock(spec=scoped_session)
+        mock_db_session.query.return_value.where.return_value.one.return_value = (
+            mock_submission
+        )
+        mock_get_db_session = MagicMock()
+        mock_get_db_session.__enter__.return_value = mock_db_session
+        mocker.patch(
+            "sbl_validation_processor.results_aggregator.get_db_session",
+            return_value=mock_get_db_session,
+        )
+
+        # a submission that's already been accepted never reads the validator's results
+        aggregate_validation_results(
+            bucket=str(tmp_path),
+            key="2025/123456789TESTBANK01/1_res/",
+            results_ref={"key": "2025/123456789TESTBANK01/1_summary.json"},
+        )
+        load_results.assert_not_called()
+        with pytest.raises(ValueError):
+            aggregate_validation_results(
+                bucket=str(tmp_path), key="2025/123456789TESTBANK01/1_res/"
+            )
@@ -0,0 +1,79 @@
+import json
+import threading
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor.sqs_consumer import InMemorySQS, SQSConsumer
+from sbl_validation_processor.worker_pool import WorkerPool
+
+
+class TestSQSConsumer:
+
+    def test_batches_receive_and_delete(self, mocker: MockerFixture):
+        mocker.patch.dict("os.environ", {"SQS_WAIT_TIME_SECONDS": "0"})
+        sqs = InMemorySQS()
+        for i in range(12):
+            sqs.send_message(QueueUrl="queue", MessageBody=json.dumps({"n": i}))
+        mocker.spy(sqs, "receive_message")
+        mocker.spy(sqs, "delete_message_batch")
+
+        handled = []
+        lock = threading.Lock()
+
+        def handler(event):
+            if event["n"] == 3:
+                raise RuntimeError("bad message")
+            with lock:
+                handled.append(event["n"])
+
+        SQSConsumer(sqs, "queue", handler, pool=WorkerPool(concurrency=12)).run(
+            max_polls=2
+        )
+
+        assert sorted(handled) == [n for n in range(12) if n != 3]
+        assert sqs.receive_message.call_args_list[0].kwargs["MaxNumberOfMessages"] == 10
+        deleted = sum(
+            len(c.kwargs["Entries"]) for c in sqs.delete_message_batch.call_args_list
+        )
+        assert deleted == 11
+        # the failed message stays on the queue to be retried
+        assert [json.loads(m["Body"]) for m in sqs.messages.values()] == [{"n": 3}]
+
+    def test_job_mode_receives_full_batches(self, mocker: MockerFixture):
+        # with the default pool an idle listener asks for a full receive in job mode, and one per worker
+        # slot when the work runs in process
+        mocker.patch.dict("os.environ", {"SQS_WAIT_TIME_SECONDS": "0"})
+        mocker.patch.dict("os.environ").pop("WORKER_CONCURRENCY", None)
+        for worker_mode, receive_size in [("job", 10), ("inprocess", 2)]:
+            mocker.patch.dict("os.environ", {"WORKER_MODE": worker_mode})
+            sqs = InMemorySQS()
+            mocker.spy(sqs, "receive_message")
+            SQSConsumer(sqs, "queue", lambda event: None).run(max_polls=1)
+            assert (
+                sqs.receive_message.call_args.kwargs["MaxNumberOfMessages"]
+                == receive_size
+            )
+
+    def test_long_running_messages_stay_hidden(self, mocker: MockerFixture):
+        mocker.patch.dict(
+            "os.environ",
+            {
+                "SQS_WAIT_TIME_SECONDS": "0",
+                "SQS_VISIBILITY_TIMEOUT": "1",
+                "SQS_HEARTBEAT_SECONDS": "0.2",
+            },
+        )
+        sqs = InMemorySQS()
+        sqs.send_message(QueueUrl="queue", MessageBody=json.dumps({"n": 1}))
+        calls = []
+
+        def handler(event):
+            calls.append(event)
+            # a second consumer would see the message here if visibility wasn't extended
+            assert sqs.receive_message(QueueUrl="queue", WaitTimeSeconds=2) == {}
+
+        SQSConsumer(sqs, "queue", handler, pool=WorkerPool(concurrency=1)).run(
+            max_polls=1
+        )
+        assert calls == [{"n": 1}]
+        assert sqs.messages == {}
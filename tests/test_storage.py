@@ -0,0 +1,154 @@
+import io
+import polars as pl
+import pytest
+
+from unittest.mock import MagicMock
+
+from pytest_mock import MockerFixture
+
+from sbl_validation_processor.storage import (
+    LocalStorage,
+    MemoryStorage,
+    S3Storage,
+    get_storage,
+    part_sort_key,
+)
+
+
+def parquet_bytes(df: pl.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.write_parquet(buffer)
+    return buffer.getvalue()
+
+
+class TestStorage:
+
+    @pytest.fixture(params=["local", "memory"])
+    def storage(self, request):
+        return LocalStorage() if request.param == "local" else MemoryStorage()
+
+    def test_read_write(self, storage, tmp_path):
+        bucket = str(tmp_path)
+        storage.write_bytes(bucket, "upload/1.csv", b"uid\nA1\nA2\n")
+        storage.write_bytes(bucket, "upload/2.csv", io.BytesIO(b"uid\nB1\n"))
+
+        with storage.open_read(bucket, "upload/1.csv") as f:
+            assert f.read() == b"uid\nA1\nA2\n"
+        assert storage.read_bytes(bucket, "upload/2.csv") == b"uid\nB1\n"
+        assert storage.read_range(bucket, "upload/1.csv", 4, 5) == b"A1"
+        objects = sorted(storage.list_prefix(bucket, "upload/"), key=lambda o: o.key)
+        assert [(o.key, o.size) for o in objects] == [
+            ("upload/1.csv", 10),
+            ("upload/2.csv", 7),
+        ]
+        assert storage.list_prefix(bucket, "missing/") == []
+
+    def test_multipart_writer(self, storage, tmp_path):
+        bucket = str(tmp_path)
+        with storage.open_multipart_writer(bucket, "upload/1_report.csv") as writer:
+            writer.write(b"a,b\n")
+            writer.write(b"1,2\n")
+        assert storage.read_bytes(bucket, "upload/1_report.csv") == b"a,b\n1,2\n"
+
+        with pytest.raises(RuntimeError):
+            with storage.open_multipart_writer(bucket, "upload/2_report.csv") as writer:
+                writer.write(b"a,b\n")
+                raise RuntimeError("failed building report")
+        assert [o.key for o in storage.list_prefix(bucket, "upload/")] == [
+            "upload/1_report.csv"
+        ]
+
+    def test_scan_parquet(self, storage, tmp_path):
+        bucket = str(tmp_path)
+        storage.write_bytes(
+            bucket, "1_res/00001.parquet", parquet_bytes(pl.DataFrame({"a": [1, 2]}))
+        )
+        storage.write_bytes(
+            bucket, "1_res/00002.parquet", parquet_bytes(pl.DataFrame({"a": [3]}))
+        )
+        lf = storage.scan_parquet(bucket, "1_res/", allow_missing_columns=True)
+        assert sorted(lf.collect()["a"].to_list()) == [1, 2, 3]
+
+    def test_s3_multipart_writer(self, mocker: MockerFixture):
+        s3 = MagicMock()
+        s3.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+        s3.upload_part.side_effect = lambda **kwargs: {
+            "ETag": f"etag-{kwargs['PartNumber']}"
+        }
+        mocker.patch("sbl_validation_processor.storage.get_client", return_value=s3)
+        mocker.patch.dict("os.environ", {"S3_MULTIPART_PART_SIZE": "0"})
+
+        with S3Storage().open_multipart_writer("bucket", "report.csv") as writer:
+            writer.write(b"a" * 5 * 1024 * 1024)
+            writer.write(b"b")
+
+        assert s3.upload_part.call_count == 2
+        s3.complete_multipart_upload.assert_called_once_with(
+            Bucket="bucket",
+            Key="report.csv",
+            UploadId="upload-1",
+            MultipartUpload={
+                "Parts": [
+                    {"ETag": "etag-1", "PartNumber": 1},
+                    {"ETag": "etag-2", "PartNumber": 2},
+                ]
+            },
+        )
+
+        with S3Storage().open_multipart_writer("bucket", "small.csv") as writer:
+            writer.write(b"a,b\n")
+        s3.put_object.assert_called_once_with(
+            Body=b"a,b\n", Bucket="bucket", Key="small.csv"
+        )
+
+    def test_get_storage(self, mocker: MockerFixture):
+        mocker.patch.dict("os.environ", {"ENV": "MEMORY"})
+        assert isinstance(get_storage(), MemoryStorage)
+        assert get_storage() is get_storage()
+        mocker.patch.dict("os.environ", {"ENV": "LOCAL"})
+        assert isinstance(get_storage(), LocalStorage)
+
+    def test_s3_list_prefix_paginates(self, mocker: MockerFixture):
+        pages = {
+            "1_res/": [
+                {
+                    "Contents": [
+                        {"Key": f"1_res/{i:05}.parquet", "Size": i, "ETag": f"e{i}"}
+                        for i in range(1000, 0, -1)
+                    ]
+                },
+                {
+                    "Contents": [
+                        {"Key": "1_res/01001.parquet", "Size": 1, "ETag": "e"}
+                    ],
+                    "CommonPrefixes": [{"Prefix": "1_res/validation_id=E0001/"}],
+                },
+            ],
+            "1_res/validation_id=E0001/": [
+                {
+                    "Contents": [
+                        {"Key": "1_res/validation_id=E0001/00001.parquet", "Size": 5}
+                    ]
+                }
+            ],
+        }
+        s3 = MagicMock()
+        s3.get_paginator.return_value.paginate.side_effect = lambda **kwargs: pages[
+            kwargs["Prefix"]
+        ]
+        mocker.patch("sbl_validation_processor.storage.get_client", return_value=s3)
+
+        objects = S3Storage().list_prefix("bucket", "1_res/")
+        assert len(objects) == 1002
+        assert "1_res/validation_id=E0001/00001.parquet" in [o.key for o in objects]
+
+        ordered = sorted(objects, key=lambda o: part_sort_key(o.key))
+        assert [o.key for o in ordered[:2]] == [
+            "1_res/00001.parquet",
+            "1_res/00002.parquet",
+        ]
+        assert [o.key for o in ordered[-2:]] == [
+            "1_res/01001.parquet",
+            "1_res/validation_id=E0001/00001.parquet",
+        ]
+        assert (ordered[0].size, ordered[0].etag) == (1, "e1")
@@ -0,0 +1,46 @@
+import threading
+
+from unittest.mock import MagicMock
+
+from sbl_validation_processor.worker_pool import WorkerPool
+
+
+class TestWorkerPool:
+
+    def test_slots_limit_concurrency(self):
+        pool = WorkerPool(concurrency=2)
+        started = threading.Barrier(3)
+        finish = threading.Event()
+
+        def job():
+            started.wait(timeout=5)
+            finish.wait(timeout=5)
+
+        on_success = MagicMock()
+        futures = []
+        for _ in range(2):
+            assert pool.reserve(timeout=1)
+            futures.append(pool.run(job, on_success=on_success))
+        started.wait(timeout=5)
+        assert not pool.reserve(timeout=0.1)
+
+        finish.set()
+        for future in futures:
+            future.result()
+        assert on_success.call_count == 2
+        assert pool.reserve(timeout=1)
+        pool.release()
+        pool.shutdown()
+
+    def test_failed_job_is_not_acknowledged(self):
+        pool = WorkerPool(concurrency=1)
+
+        def job():
+            raise RuntimeError("validation failed")
+
+        on_success = MagicMock()
+        assert pool.reserve(timeout=1)
+        pool.run(job, on_success=on_success).result()
+        on_success.assert_not_called()
+        assert pool.reserve(timeout=1)
+        pool.shutdown()